@@ -0,0 +1,256 @@
+import contextlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+# --- Admission Control and Backpressure ---
+# Expensive endpoints used to accept any number of concurrent requests, so a
+# burst slowed every request down together until they all timed out. Each
+# limited endpoint now has:
+#   - a concurrency limit (max_concurrent requests run at once)
+#   - a bounded FIFO wait queue (max_queue) with a deadline (queue_timeout, or
+#     the client's X-Request-Deadline in seconds if shorter); a full queue or a
+#     missed deadline is rejected at once with 503 and a Retry-After estimated
+#     from the endpoint's recent service time
+#   - a cost weight: each client has a token bucket (ADMISSION_CLIENT_RATE
+#     cost units per second, bursts up to ADMISSION_CLIENT_BURST) and a request
+#     takes `cost` tokens, so a 12-round workflow uses up a client's quota much
+#     faster than /reverse_string; an empty bucket is a 429 with Retry-After
+# Requests that are admitted run at full speed instead of everyone sharing an
+# overloaded process, which keeps goodput up under overload.
+#
+# An endpoint configured with "deferred": True only has its client quota
+# checked before the view runs; the view takes the concurrency slot itself,
+# with the slot() helper returned by register_admission_control, around the
+# work that needs it. /run_workflow does this so requests served from the memo
+# or coalesced onto a running execution never queue for a slot.
+#
+# Clients are identified by the X-Client-Id header, else the remote address.
+# Endpoints without a limit entry (health checks, stats) are not limited.
+# With several worker processes (see prefork.py) every worker enforces the
+# limits on its own, so a node admits up to workers x max_concurrent requests.
+
+ADMISSION_CLIENT_RATE = float(os.getenv("ADMISSION_CLIENT_RATE", "1.0"))
+ADMISSION_CLIENT_BURST = float(os.getenv("ADMISSION_CLIENT_BURST", "30"))
+MAX_TRACKED_CLIENTS = 10000
+
+
+class AdmissionRejected(Exception):
+    """Raised by slot() when a deferred endpoint's queue is full or its deadline passed."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Server busy ({reason}); retry later.")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """
+    Per-client token buckets.
+    Args:
+        rate (float): Tokens added per second.
+        burst (float): Bucket size.
+    """
+
+    def __init__(self, rate=ADMISSION_CLIENT_RATE, burst=ADMISSION_CLIENT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict() # client -> (tokens, updated_at), least recently seen first
+
+    def take(self, client, cost):
+        """
+        Takes cost tokens from the client's bucket.
+        Returns:
+            float: 0 if admitted, else the seconds until enough tokens are available.
+        """
+        cost = min(cost, self.burst) # A request costing more than the burst still gets through eventually
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / self.rate if self.rate > 0 else 60.0
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > MAX_TRACKED_CLIENTS:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def refund(self, client, cost):
+        with self._lock:
+            if client in self._buckets:
+                tokens, updated_at = self._buckets[client]
+                self._buckets[client] = (min(self.burst, tokens + min(cost, self.burst)), updated_at)
+
+
+class EndpointGate:
+    """
+    Concurrency limit with a bounded FIFO wait queue for one endpoint.
+    Args:
+        name (str): Endpoint name.
+        max_concurrent (int): Requests allowed to run at once.
+        max_queue (int): Requests allowed to wait for a slot.
+        queue_timeout (float): Longest a request waits in the queue, in seconds.
+        cost (float): Token-bucket cost of one request.
+        deferred (bool): The view takes the slot itself (see slot()); only the quota is checked up front.
+    """
+
+    def __init__(self, name, max_concurrent=4, max_queue=16, queue_timeout=30.0, cost=1.0, deferred=False):
+        self.name = name
+        self.deferred = deferred
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.cost = cost
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters = deque()
+        self._service_seconds = None # Moving average of request durations
+        self.stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0, "rejected_quota": 0}
+
+    def retry_after(self):
+        """Seconds until a slot is likely free, estimated from the queue length and service time."""
+        service = self._service_seconds or 1.0
+        return max(1, math.ceil(service * (len(self._waiters) + 1) / self.max_concurrent))
+
+    def acquire(self, timeout=None):
+        """
+        Waits for a slot.
+        Args:
+            timeout (float, optional): Client deadline; the shorter of it and queue_timeout applies.
+        Returns:
+            str or None: None if admitted, else the rejection reason ('queue_full' or 'timeout').
+        """
+        with self._lock:
+            if self._in_flight < self.max_concurrent and not self._waiters:
+                self._in_flight += 1
+                self.stats["admitted"] += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self.stats["rejected_queue_full"] += 1
+                return "queue_full"
+            turn = threading.Event()
+            self._waiters.append(turn)
+            self.stats["queued"] += 1
+        wait = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        if not turn.wait(max(0.0, wait)):
+            with self._lock:
+                if not turn.is_set(): # Still queued: give up the place
+                    self._waiters.remove(turn)
+                    self.stats["rejected_timeout"] += 1
+                    return "timeout"
+        with self._lock:
+            self.stats["admitted"] += 1
+        return None
+
+    def release(self, seconds):
+        """Frees a slot, handing it straight to the oldest waiter if there is one."""
+        with self._lock:
+            self._service_seconds = seconds if self._service_seconds is None else 0.8 * self._service_seconds + 0.2 * seconds
+            if self._waiters:
+                self._waiters.popleft().set() # The slot moves to the waiter; in_flight is unchanged
+            else:
+                self._in_flight -= 1
+
+    def report(self):
+        with self._lock:
+            return dict(self.stats, in_flight=self._in_flight, waiting=len(self._waiters),
+                        max_concurrent=self.max_concurrent, max_queue=self.max_queue, cost=self.cost,
+                        service_seconds=round(self._service_seconds or 0.0, 3))
+
+
+def register_admission_control(app, limits, buckets=None, metrics=None):
+    """
+    Adds per-endpoint admission control to a Flask app and a GET /admission/stats route.
+    Args:
+        app (Flask): The Flask application.
+        limits (dict): {endpoint name: {'max_concurrent', 'max_queue', 'queue_timeout', 'cost', 'deferred'}}.
+        buckets (TokenBuckets, optional): Per-client quotas; defaults to the ADMISSION_CLIENT_* settings.
+        metrics (SharedMetrics, optional): Reports the stats summed over all worker processes.
+    Returns:
+        callable: slot(endpoint), a context manager holding one of a deferred endpoint's slots;
+                  raises AdmissionRejected, which is answered with 503.
+    """
+    from flask import request, jsonify, g
+
+    gates = {endpoint: EndpointGate(endpoint, **config) for endpoint, config in limits.items()}
+    buckets = buckets or TokenBuckets()
+
+    def reject(status, message, retry_after):
+        response = jsonify({'error': message, 'status': 'rejected'})
+        response.status_code = status
+        response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    @app.before_request
+    def admit():
+        gate = gates.get(request.endpoint)
+        if gate is None:
+            return None
+        client = request.headers.get("X-Client-Id") or request.remote_addr or "unknown"
+        wait = buckets.take(client, gate.cost)
+        if wait:
+            with gate._lock:
+                gate.stats["rejected_quota"] += 1
+            return reject(429, "Request quota exceeded; retry later.", wait)
+        if gate.deferred:
+            g.admission_client = client
+            return None
+        reason = gate.acquire(timeout=request_deadline())
+        if reason is not None:
+            buckets.refund(client, gate.cost) # Not served, so not charged
+            print(f"Admission: rejected {request.endpoint} ({reason})")
+            return reject(503, "Server busy; retry later.", gate.retry_after())
+        g.admission = (gate, time.perf_counter())
+        return None
+
+    def request_deadline():
+        try:
+            return float(request.headers["X-Request-Deadline"]) if "X-Request-Deadline" in request.headers else None
+        except ValueError:
+            return None
+
+    @contextlib.contextmanager
+    def slot(endpoint):
+        gate = gates[endpoint]
+        reason = gate.acquire(timeout=request_deadline())
+        if reason is not None:
+            print(f"Admission: rejected {endpoint} ({reason})")
+            raise AdmissionRejected(reason, gate.retry_after())
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            gate.release(time.perf_counter() - started)
+
+    @app.errorhandler(AdmissionRejected)
+    def rejected(e):
+        client = g.pop("admission_client", None)
+        gate = gates.get(request.endpoint)
+        if client is not None and gate is not None:
+            buckets.refund(client, gate.cost) # Not served, so not charged
+        return reject(503, "Server busy; retry later.", e.retry_after)
+
+    @app.teardown_request
+    def release(exc):
+        admitted = g.pop("admission", None)
+        if admitted is not None:
+            gate, started = admitted
+            gate.release(time.perf_counter() - started)
+
+    def report():
+        return {endpoint: gate.report() for endpoint, gate in gates.items()}
+
+    if metrics is not None:
+        metrics.register("admission", report)
+
+    @app.route('/admission/stats', methods=['GET'])
+    def admission_stats():
+        return jsonify(metrics.report("admission") if metrics is not None else report())
+
+    return slot
@@ -2,6 +2,8 @@
 import autogen
 import requests # Used for making HTTP requests to Azure AI Search
 import json # Used for handling JSON responses
+from warmpool import code_execution_config
+from toolpool import register_concurrent_tool_calls
 
 # Define the configuration for the Language Model
 # Replace "YOUR_GEMINI_API_KEY" with your actual Gemini API key if you want to run this locally.
@@ -35,6 +37,7 @@ assistant = autogen.AssistantAgent(
     When a user asks for information that requires searching, you should suggest using the 'azure_ai_search' tool.
     Once the search results are provided by the user_proxy, synthesize the information and present it clearly.
     If you need to perform a search, clearly state what you want to search for.
+    When several searches are needed, request them together in a single message; they run concurrently.
     """,
 )
 
@@ -45,10 +48,9 @@ user_proxy = autogen.UserProxyAgent(
     human_input_mode="NEVER",  # Set to "ALWAYS" if you want to provide manual input
     max_consecutive_auto_reply=10, # Max number of consecutive auto-replies
     is_termination_msg=lambda x: x.get("content", "") and x.get("content", "").rstrip().endswith("TERMINATE"),
-    code_execution_config={
-        "work_dir": "coding", # Directory for code execution
-        "use_docker": False,  # Set to True if you want to use Docker for isolation
-    },
+    # Code runs on a pool of pre-warmed Python workers in the 'coding' directory
+    # (set CODE_EXECUTOR=local to use autogen's default executor, optionally with Docker)
+    code_execution_config=code_execution_config(work_dir="coding", use_docker=False),
     llm_config=llm_config, # User proxy can also use LLM for generating replies
     system_message="""You are a user proxy agent. You can execute code and tools on behalf of the user.
     You have access to the 'azure_ai_search' tool.
@@ -118,6 +120,9 @@ def azure_ai_search(query: str) -> str:
     except Exception as e:
         return f"An unexpected error occurred during Azure AI Search: {e}"
 
+# Several azure_ai_search calls requested in the same turn run concurrently
+register_concurrent_tool_calls(user_proxy)
+
 # Initiate a chat between the user_proxy and the assistant.
 # The user_proxy will start by asking a question that requires searching.
 print("\n--- Starting Autogen Chat ---")
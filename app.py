@@ -1,17 +1,44 @@
 # app.py
 import json
-import os,autogen
+import os
+import re
 import asyncio
-from flask import Flask, request, jsonify
+from types import SimpleNamespace
+from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS # Needed to allow requests from your web app (different origin)
-from autogenstudio import WorkflowManager
-from azure.search.documents import SearchClient
-from azure.core.credentials import AzureKeyCredential
-from openai import AzureOpenAI
+from startup import LazyResource, register_health_routes, warm_up_on_start
+from docdiff import diff_documents, format_diff_for_llm
+from report import render_report, REPORTS_DIR
+from warmpool import code_execution_config, start_pools
+from termination import ConvergenceMonitor
+from contextview import register_context_views
+from singleflight import SingleFlight, normalize_key
+from semcache import SemanticCache
+from runcheckpoint import RunCheckpointStore, RoundRecorder, resume_groupchat
+from profiler import register_profiling
+from httppool import shared_http_client, with_http_client, pool_stats
+from embedbatch import EmbeddingBatcher, local_embed_texts, EMBEDDING_BACKEND
+from queryrouter import QueryRouter
+from prefetch import RetrievalPrefetcher, expand_query, PREFETCH_ENABLED
+from admission import register_admission_control
+from clausecache import ClauseComparisonCache, parse_findings
+from sharedstate import SharedStore, SharedMetrics
+from prefork import serve, SERVER_WORKERS
+from searchstream import iter_search_results, search_documents, take_within_budget
+from structuredoutput import (STRUCTURED_OUTPUT, findings_instructions, structured_llm_config,
+                              parse_structured_findings, render_findings)
+
+# NOTE: autogen, autogenstudio, azure.search.documents and openai are imported lazily
+# inside the factories below so the server starts without paying their import cost.
 
 app = Flask(__name__)
 CORS(app) # Enable Cross-Origin Resource Sharing
 
+# With several worker processes (SERVER_WORKERS, see prefork.py) caches and stats
+# counters are shared through a node-local SQLite store (see sharedstate.py)
+shared_store = SharedStore() if SERVER_WORKERS else None
+metrics = SharedMetrics(shared_store)
+
 
 # Azure OpenAI Configuration
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT", "https://autogenpoc.openai.azure.com/")
@@ -23,146 +50,291 @@ AZURE_OPENAI_API_VERSION = "2024-02-01" # Or your specific API version
 AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT", "https://autogenpoc-search.search.windows.net")
 AZURE_SEARCH_API_KEY = os.getenv("AZURE_SEARCH_API_KEY", "")
 AZURE_SEARCH_INDEX_NAME = os.getenv("AZURE_SEARCH_INDEX_NAME", "")
+# Index per corpus the query router can target; both default to the main index
+CORPUS_INDEXES = {
+    "rules": os.getenv("AZURE_SEARCH_RULES_INDEX_NAME", AZURE_SEARCH_INDEX_NAME),
+    "judgements": os.getenv("AZURE_SEARCH_JUDGEMENTS_INDEX_NAME", AZURE_SEARCH_INDEX_NAME),
+}
 
-
-# --- Initialize Clients ---
-try:
+# Search results are streamed page by page and reading stops at these limits (see searchstream.py).
+# The budget counts approximate tokens of document content; unset means no limit.
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "0")) or None
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0")) or None
+# fetch_data_ai_search feeds the prompt compressor, which aims for less than 16000 tokens
+FETCH_TOKEN_BUDGET = int(os.getenv("FETCH_TOKEN_BUDGET", "16000"))
+FETCH_MAX_RESULTS = int(os.getenv("FETCH_MAX_RESULTS", "50")) # The service's default result count
+
+# Retrieved documents at least this similar to the user's document are sent to the
+# comparators as a locally computed diff (changed regions only) instead of in full.
+DIFF_MIN_SIMILARITY = float(os.getenv("DIFF_MIN_SIMILARITY", "0.6"))
+
+# Request coalescing for /run_workflow. Bump WORKFLOW_VERSION whenever prompts or
+# agents change so results from the old workflow are not shared with new requests.
+WORKFLOW_VERSION = os.getenv("WORKFLOW_VERSION", "1")
+WORKFLOW_RESULT_MEMO_TTL = float(os.getenv("WORKFLOW_RESULT_MEMO_TTL", "30"))
+workflow_flight = SingleFlight(memo_ttl=WORKFLOW_RESULT_MEMO_TTL, shared_store=shared_store)
+
+# Semantic answer cache. Only question-sized inputs are cached: two long documents
+# that differ in a single figure embed almost identically but need different answers.
+AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-ada-002")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_QUERY_CHARS = int(os.getenv("SEMANTIC_CACHE_MAX_QUERY_CHARS", "1000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400")) or None # Seconds; 0 keeps answers until invalidated
+# Bump when index documents are re-ingested in place (the document count alone won't change)
+SEARCH_INDEX_VERSION = os.getenv("SEARCH_INDEX_VERSION", "1")
+
+# Per-round checkpoints of processor runs (see runcheckpoint.py)
+run_checkpoints = RunCheckpointStore()
+
+# Comparator findings per (document clause, reference clause, prompt version); see clausecache.py
+clause_cache = ClauseComparisonCache()
+
+
+# --- Initialize Clients (lazily, on first use) ---
+def _create_openai_client():
+    from openai import AzureOpenAI
     # Initialize Azure OpenAI Client
-    openai_client = AzureOpenAI(
+    client = AzureOpenAI(
         azure_endpoint=AZURE_OPENAI_ENDPOINT,
         api_key=AZURE_OPENAI_API_KEY,
-        api_version=AZURE_OPENAI_API_VERSION
+        api_version=AZURE_OPENAI_API_VERSION,
+        http_client=shared_http_client(), # One keep-alive pool for all OpenAI traffic (see httppool.py)
     )
     print("Azure OpenAI client initialized successfully.")
+    return client
 
+def _create_search_client(index_name=AZURE_SEARCH_INDEX_NAME):
+    from azure.search.documents import SearchClient
+    from azure.core.credentials import AzureKeyCredential
     # Initialize Azure AI Search Client
-    search_client = SearchClient(
+    client = SearchClient(
         endpoint=AZURE_SEARCH_ENDPOINT,
-        index_name=AZURE_SEARCH_INDEX_NAME,
+        index_name=index_name,
         credential=AzureKeyCredential(AZURE_SEARCH_API_KEY)
     )
     print("Azure AI Search client initialized successfully.")
+    return client
+
+# A failed initialization no longer exits the process: the error is reported by
+# /readyz and the next request that needs the client retries the initialization.
+openai_client = LazyResource("openai_client", _create_openai_client)
+search_client = LazyResource("search_client", _create_search_client)
+# Corpora on their own index get their own client; the rest share the main one
+corpus_search_clients = {
+    corpus: search_client if index_name == AZURE_SEARCH_INDEX_NAME else
+    LazyResource(f"search_client:{corpus}", lambda index_name=index_name: _create_search_client(index_name))
+    for corpus, index_name in CORPUS_INDEXES.items()
+}
+
+def _azure_embed_texts(texts):
+    """Embeds a list of strings with the Azure OpenAI embedding deployment."""
+    response = openai_client.get().embeddings.create(model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT, input=texts)
+    return [item.embedding for item in response.data]
 
-except Exception as e:
-    print(f"Error initializing clients: {e}")
-    print("Please ensure your environment variables/configurations are correct.")
-    exit()
+# Concurrent requests' embeddings go out as batched calls (see embedbatch.py)
+embed_texts = EmbeddingBatcher(local_embed_texts if EMBEDDING_BACKEND == "local" else _azure_embed_texts)
+
+def _search_index_version():
+    return (SEARCH_INDEX_VERSION, search_client.get().get_document_count())
+
+answer_cache = SemanticCache(embed_texts, threshold=SEMANTIC_CACHE_THRESHOLD, index_version_fn=_search_index_version,
+                             shared_store=shared_store, ttl=SEMANTIC_CACHE_TTL)
 
 #LLM Configuration
-llm_config = {
+# All agents share the process-wide HTTP connection pool (see httppool.py)
+llm_config = with_http_client({
 "model": "gpt-4",
 "api_type": "azure",
 "api_version": "2025-01-01-preview",
 "base_url": "https://autogenpoc.openai.azure.com/",
 "api_key":""
+})
+
+# Decides before any agent runs which corpora (and so which branches) a question needs
+query_router = QueryRouter()
+
+# Agent branch per corpus: its retrieval agent and its comparator
+CORPUS_BRANCHES = {
+    "rules": ("data_accumulator_compliance_rules", "rules_comparator"),
+    "judgements": ("data_accumulator_judgements", "judgement_analyzer"),
 }
 
-#agent definitions
-user_proxy = autogen.UserProxyAgent(
-    name="User_proxy",
-    system_message="You are an helpful AI assistant.",
-    code_execution_config={
-        "last_n_messages": 2,
-        "work_dir": "groupchat",
-        "use_docker": False,
-    },  # Please set use_docker=True if docker is available to run the generated code. Using docker is safer than running the generated code directly.
-    human_input_mode="TERMINATE",
-)
-
-data_accumulator_compliance_rules = autogen.AssistantAgent(
-    name="data_accumulator_compliance_rules",
-    llm_config=llm_config,
-    system_message="You are a data retrieval agent to fetch only tax rules. Your role is to query an Azure AI Search index and fetch the relevant chunk of data based on a given user query.",
-)
-
-rules_comparator = autogen.AssistantAgent(
-    name="rules_comparator",
-    llm_config=llm_config,
-    system_message="You are a document comparison agent of tax rules. Retrieve the tax rules stored in shared memory and compare it with the document received from user proxy or input. Your task is to analyze two input documents and identify any differences between them. These may include changes in wording, structure, formatting, data values, or semantic meaning. Highlight both exact (verbatim) differences and subtle contextual shifts. Your output should be structured to indicate the type of difference, location within the document, and a clear explanation of the change. Be concise and accurate, and do not make assumptions beyond the provided content. Generate a PDF report.",
-)
-
-data_accumulator_judgements = autogen.AssistantAgent(
-    name="data_accumulator_judgements",
-    llm_config=llm_config,
-    system_message="You are a data retrieval agent to fetch only court orders. Your role is to query an Azure AI Search index and fetch the relevant chunk of data based on a given user query.",
-)
-
-judgement_analyzer = autogen.AssistantAgent(
-    name="judgement_analyzer",
-    llm_config=llm_config,
-    system_message="You are a document comparison agent of court orders and prepare a report on deviation of tax compliance. Retrieve the court orders stored in shared memory and compare it with the document received from user proxy or input. Your task is to analyze two input documents and identify any differences between them. These may include changes in wording, structure, formatting, data values, or semantic meaning. Highlight both exact (verbatim) differences and subtle contextual shifts. Your output should be structured to indicate the type of difference, location within the document, and a clear explanation of the change. Be concise and accurate, and do not make assumptions beyond the provided content. Generate a PDF report.",
-)
-
-prompt_compressor = autogen.AssistantAgent(
-    name="prompt compressor",
-    llm_config=llm_config,
-    system_message="You are AI assitant to compress the data received from AI search to generate input less than 16000 tokens",
-)
-
-processor = autogen.GroupChat(agents=[
-                                    user_proxy,
-                                    data_accumulator_compliance_rules,
-                                    rules_comparator,
-                                    data_accumulator_judgements,
-                                    judgement_analyzer], messages=[], max_round=12)
-orchestrator = autogen.GroupChatManager(groupchat=processor, llm_config=llm_config)
-
-# agent configuration
-prompt_compressor = autogen.AssistantAgent(
-    name="prompt compressor",
-    llm_config=llm_config,
-    system_message="You are AI assitant to compress the data received from AI search to generate input less than 16000 tokens",
-)
-
-
-groupchat1 = autogen.GroupChat(agents=[user_proxy, prompt_compressor],
-                               speaker_selection_method="round_robin",
-                               max_round=2,
-                               messages=[])
-manager1 = autogen.GroupChatManager(groupchat=groupchat1, llm_config=llm_config)
+def _other_corpora_documents(corpus):
+    """Regex matching the retrieved documents in the task that are not tagged with this corpus."""
+    return (r"Document \d+ \(Title: [^\n]*, Corpus: (?![^)\n]*\b" + re.escape(corpus) + r"\b)[^\n]*\n.*?"
+            r"(?=Document \d+ \(Title: |User Question:|\Z)")
+
+# Per-agent context windows (see contextview.py). Retrieval agents only need the user's
+# question; each comparator only needs its own corpus' documents from the task and its
+# own branch of the conversation, so its token budget is not spent on the other corpus.
+AGENT_CONTEXT_VIEWS = {
+    "data_accumulator_compliance_rules": {"task_extract": r"User Question:.*\Z", "last_n": 2, "tool_output_chars": 0},
+    "data_accumulator_judgements": {"task_extract": r"User Question:.*\Z", "last_n": 2, "tool_output_chars": 0},
+    "rules_comparator": {"names": ("User_proxy", "data_accumulator_compliance_rules"), "task_drop": _other_corpora_documents("rules"),
+                         "tool_output_chars": 4000, "max_tokens": 12000},
+    "judgement_analyzer": {"names": ("User_proxy", "data_accumulator_judgements"), "task_drop": _other_corpora_documents("judgements"),
+                           "tool_output_chars": 4000, "max_tokens": 12000},
+}
 
-def retrieve_documents_from_search(query_text: str, top_n: int = 3):
+#agent definitions
+def _create_agents():
     """
-    Retrieves relevant documents from Azure AI Search based on the query text.
+    Builds the agents and group chats used by the workflow.
+    Returns:
+        SimpleNamespace: The agents, group chats and managers by name.
     """
-    print(f"\nSearching Azure AI Search for: '{query_text}'...")
-    try:
-        # Perform a simple search. For more advanced scenarios, consider semantic or vector search.
-        search_results = search_client.search(
-            search_text=query_text,
-            top=top_n,
-            include_total_count=True,
-            query_type="simple" # Can be "semantic", "vector", "full", etc. depending on your index
-            # For semantic search: query_type="semantic", semantic_configuration_name="my-semantic-config"
-            # For vector search: vector_queries=[VectorQuery(vector=embedding_of_query, k_nearest_neighbors=5, fields="contentVector")]
+    import autogen
+
+    user_proxy = autogen.UserProxyAgent(
+        name="User_proxy",
+        system_message="You are an helpful AI assistant.",
+        # Code runs on a pool of pre-warmed Python workers (set CODE_EXECUTOR=local for the default executor)
+        code_execution_config=code_execution_config(work_dir="groupchat", last_n_messages=2, use_docker=False),
+        # Please set use_docker=True if docker is available to run the generated code. Using docker is safer than running the generated code directly.
+        human_input_mode="TERMINATE",
+    )
+
+    # Comparators answer in the compact findings schema, rendered locally (see structuredoutput.py)
+    comparison_format = (
+        " When the context contains a 'Locally computed diff', the exact (verbatim) differences are already listed there as [D1.1], [D1.2], ...; do not re-derive them."
+        " These may include changes in wording, structure, formatting, data values, or semantic meaning. Highlight both exact (verbatim) differences and subtle contextual shifts."
+    )
+    if STRUCTURED_OUTPUT:
+        comparison_format += " " + findings_instructions() + " Base every finding only on the provided content."
+        comparator_llm_config = structured_llm_config(llm_config)
+    else:
+        comparison_format += (
+            " For each one write a line that starts with its id in brackets followed by its semantic impact, e.g. '[D1.2] The rate changes from 12% to 18%, so ...'."
+            " Your output should be structured to indicate the type of difference, location within the document, and a clear explanation of the change."
+            " Be concise and accurate, and do not make assumptions beyond the provided content."
         )
+        comparator_llm_config = llm_config
+    comparison_format += " Do not write code to generate a report; the PDF/HTML report is rendered automatically from your findings."
+
+    data_accumulator_compliance_rules = autogen.AssistantAgent(
+        name="data_accumulator_compliance_rules",
+        llm_config=llm_config,
+        system_message="You are a data retrieval agent to fetch only tax rules. Your role is to query an Azure AI Search index and fetch the relevant chunk of data based on a given user query.",
+    )
+
+    rules_comparator = autogen.AssistantAgent(
+        name="rules_comparator",
+        llm_config=comparator_llm_config,
+        system_message="You are a document comparison agent of tax rules. Retrieve the tax rules stored in shared memory and compare it with the document received from user proxy or input. Your task is to analyze two input documents and identify any differences between them." + comparison_format,
+    )
 
-        documents = []
-        for result in search_results:
-            # --- DEBUGGING STEP: Print the entire result object ---
-            print(f"  --- Full search result document: {result}")
-            # --- END DEBUGGING STEP ---
-
-            # Assuming your documents have a 'content' field and a 'title' or 'id' field
-            # Adjust field names based on your Azure AI Search index schema
-            # IMPORTANT: Check the printed 'result' object above to find the correct field for your document's main content.
-            # It might be 'text', 'main_content', 'description', etc., instead of 'content'.
-            doc_content = result.get('chunk', 'No content found') # <--- **UPDATE THIS FIELD NAME IF NECESSARY**
-            doc_title = result.get('title', result.get('id', 'Untitled Document')) # <--- UPDATE THIS FIELD NAME IF NECESSARY
-
-            documents.append({
-                "title": doc_title,
-                "content": doc_content,
-                "score": result['@search.score']
-            })
-            print(f"  - Found document: '{doc_title}' (Score: {result['@search.score']:.2f})")
-            if doc_content == 'No content found':
-                print(f"    WARNING: Content for '{doc_title}' was not found. Check your index schema for the correct content field name.")
-        return documents
+    data_accumulator_judgements = autogen.AssistantAgent(
+        name="data_accumulator_judgements",
+        llm_config=llm_config,
+        system_message="You are a data retrieval agent to fetch only court orders. Your role is to query an Azure AI Search index and fetch the relevant chunk of data based on a given user query.",
+    )
 
+    judgement_analyzer = autogen.AssistantAgent(
+        name="judgement_analyzer",
+        llm_config=comparator_llm_config,
+        system_message="You are a document comparison agent of court orders and prepare a report on deviation of tax compliance. Retrieve the court orders stored in shared memory and compare it with the document received from user proxy or input. Your task is to analyze two input documents and identify any differences between them." + comparison_format,
+    )
+
+    prompt_compressor = autogen.AssistantAgent(
+        name="prompt compressor",
+        llm_config=llm_config,
+        system_message="You are AI assitant to compress the data received from AI search to generate input less than 16000 tokens",
+    )
+
+    by_name = {agent.name: agent for agent in (data_accumulator_compliance_rules, rules_comparator,
+                                                 data_accumulator_judgements, judgement_analyzer)}
+    register_context_views(list(by_name.values()), AGENT_CONTEXT_VIEWS)
+
+    def build_route(corpora):
+        """GroupChat, monitor, recorder and manager running only the branches of the given corpora."""
+        branch_agents = [by_name[name] for corpus in corpora for name in CORPUS_BRANCHES[corpus]]
+        single_branch = len(corpora) == 1
+        processor = autogen.GroupChat(agents=[user_proxy] + branch_agents, messages=[], max_round=12,
+                                      # One branch has a fixed order: no LLM call to pick the next speaker
+                                      speaker_selection_method="round_robin" if single_branch else "auto")
+        # Stops the run as soon as the comparison branches have reported, the agents
+        # signal completion, or the conversation stops adding new information
+        processor_monitor = ConvergenceMonitor(required_speakers=tuple(CORPUS_BRANCHES[corpus][1] for corpus in corpora))
+        orchestrator = autogen.GroupChatManager(groupchat=processor, llm_config=llm_config,
+                                                is_termination_msg=processor_monitor)
+        # Every completed round is checkpointed for the run in progress
+        round_recorder = RoundRecorder(run_checkpoints)
+        round_recorder.attach(processor)
+        return SimpleNamespace(processor=processor, processor_monitor=processor_monitor,
+                               round_recorder=round_recorder, orchestrator=orchestrator)
+
+    # One processor per route the query router can pick
+    routes = {corpus: build_route([corpus]) for corpus in CORPUS_BRANCHES}
+    routes["all"] = build_route(list(CORPUS_BRANCHES))
+
+    groupchat1 = autogen.GroupChat(agents=[user_proxy, prompt_compressor],
+                                   speaker_selection_method="round_robin",
+                                   max_round=2,
+                                   messages=[])
+    manager1 = autogen.GroupChatManager(groupchat=groupchat1, llm_config=llm_config)
+
+    return SimpleNamespace(
+        user_proxy=user_proxy,
+        data_accumulator_compliance_rules=data_accumulator_compliance_rules,
+        rules_comparator=rules_comparator,
+        data_accumulator_judgements=data_accumulator_judgements,
+        judgement_analyzer=judgement_analyzer,
+        prompt_compressor=prompt_compressor,
+        routes=routes,
+        processor=routes["all"].processor,
+        processor_monitor=routes["all"].processor_monitor,
+        round_recorder=routes["all"].round_recorder,
+        orchestrator=routes["all"].orchestrator,
+        groupchat1=groupchat1,
+        manager1=manager1,
+    )
+
+agents = LazyResource("agents", _create_agents)
+
+def _create_workflow_manager():
+    from autogenstudio import WorkflowManager
+    workflow_path = os.path.join(os.path.dirname(__file__), "workflow.json")
+    return WorkflowManager(workflow=workflow_path)
+
+workflow_manager = LazyResource("workflow_manager", _create_workflow_manager)
+
+# Resources that must be warm before /readyz reports ready
+STARTUP_RESOURCES = [openai_client, search_client, agents] + [
+    client for client in corpus_search_clients.values() if client is not search_client]
+register_health_routes(app, STARTUP_RESOURCES)
+register_profiling(app) # Admin-only; a no-op unless PROFILING_ADMIN_TOKEN is set
+
+# Admission control (see admission.py): concurrency, queue and per-client cost per endpoint.
+# A workflow run is a dozen LLM rounds, so it costs a client 12 quota units. Runs share
+# the route GroupChats, convergence monitors and round recorders, so a process executes
+# one at a time (scale out with SERVER_WORKERS). The slot is taken after coalescing
+# (deferred), so memo hits and coalesced requests do not queue for it.
+ADMISSION_LIMITS = {
+    "run_workflow": {"max_concurrent": 1, "deferred": True,
+                     "max_queue": int(os.getenv("RUN_WORKFLOW_MAX_QUEUE", "16")),
+                     "queue_timeout": float(os.getenv("RUN_WORKFLOW_QUEUE_TIMEOUT", "30")), "cost": 12},
+    "reverse_string": {"max_concurrent": 32, "max_queue": 64, "queue_timeout": 2, "cost": 1},
+    "cache_invalidate": {"max_concurrent": 1, "max_queue": 4, "queue_timeout": 10, "cost": 1},
+}
+admission_slot = register_admission_control(app, ADMISSION_LIMITS, metrics=metrics)
+
+def retrieve_documents_from_search(query_text: str, top_n: int = 3, client=None,
+                                   token_budget=RETRIEVAL_TOKEN_BUDGET, min_score=RETRIEVAL_MIN_SCORE):
+    """
+    Retrieves relevant documents from Azure AI Search based on the query text.
+    client defaults to the main index's search client. Results are streamed page by
+    page (see searchstream.py) and paging stops at top_n documents, the token budget
+    or the score cutoff, whichever comes first.
+    """
+    # IMPORTANT: The document text is read from the 'chunk' field and the title from 'title' (or 'id');
+    # adjust content_field/title_field to your Azure AI Search index schema.
+    try:
+        client = client or search_client.get()
     except Exception as e:
         print(f"Error during Azure AI Search retrieval: {e}")
         return []
+    return search_documents(client, query_text, top_n=top_n, content_field="chunk", title_field="title",
+                            token_budget=token_budget, min_score=min_score)
 
 
 
@@ -170,6 +342,10 @@ def retrieve_documents_from_search(query_text: str, top_n: int = 3):
 
 #fetch data from knowledge store
 def fetch_data_ai_search(searchkey):
+    import autogen
+    from azure.search.documents import SearchClient
+    from azure.core.credentials import AzureKeyCredential
+
     # Replace with your actual values
     endpoint = "https://autogenpoc-search.search.windows.net"
     index_name = "rag-1750581699787"
@@ -180,18 +356,18 @@ def fetch_data_ai_search(searchkey):
                              index_name=index_name,
                              credential=AzureKeyCredential(api_key))
 
-    #Perform a search
-    results = search_client.search(searchkey)
+    #Perform a search; pages are only requested until the chunks fill the compressor's token budget
+    results = iter_search_results(search_client, searchkey, max_results=FETCH_MAX_RESULTS, content_field="chunk")
+    chunks, stop_reason = take_within_budget(results, token_budget=FETCH_TOKEN_BUDGET, min_score=RETRIEVAL_MIN_SCORE)
+    print(f"Fetched {len(chunks)} chunks for the prompt compressor ({stop_reason}).")
 
-    searchmessages = []
+    searchmessages = [chunk['content'] for chunk in chunks]
 
-    #Print results
-    for result in results:
-        searchmessages.append(result['chunk'])
-    
     searchmessagesstr = str(searchmessages)
 
-    groupchat = autogen.GroupChat(agents=[user_proxy, prompt_compressor],
+    workflow = agents.get()
+    user_proxy = workflow.user_proxy
+    groupchat = autogen.GroupChat(agents=[user_proxy, workflow.prompt_compressor],
                                speaker_selection_method="round_robin",
                                max_round=2,
                                messages=[])
@@ -205,6 +381,75 @@ def fetch_data_ai_search(searchkey):
       
     return chat_result.summary
 
+def _search_fn(index_name, query_text, top_n=3):
+    """Returns a zero-argument function running one search against an index."""
+    client = next(corpus_search_clients[corpus] for corpus, name in CORPUS_INDEXES.items() if name == index_name)
+    return lambda: retrieve_documents_from_search(query_text, top_n=top_n, client=client.get())
+
+# Speculative searches launched when a request arrives (see prefetch.py)
+retrieval_prefetcher = RetrievalPrefetcher()
+
+def start_prefetch(input_text):
+    """Launches every corpus index's search for the input and its expansions; returns the request's prefetch, or None."""
+    if not PREFETCH_ENABLED:
+        return None
+    indexes = list(dict.fromkeys(CORPUS_INDEXES.values()))
+    queries = [input_text] + expand_query(input_text)
+    return retrieval_prefetcher.start([((index_name, query), _search_fn(index_name, query))
+                                       for query in queries for index_name in indexes])
+
+def retrieve_for_corpora(query_text, corpora, top_n=3, prefetch=None):
+    """
+    Retrieves documents only from the indexes of the given corpora; corpora sharing
+    an index are searched once. Query expansions fill up indexes that returned fewer
+    than top_n documents. With a prefetch, results come from the speculative searches;
+    without one the same searches run inline, so both return the same documents.
+    """
+    indexes = list(dict.fromkeys(CORPUS_INDEXES[corpus] for corpus in corpora))
+    documents = []
+    for index_name in indexes:
+        def search(query):
+            if prefetch is None:
+                return _search_fn(index_name, query, top_n)()
+            return prefetch.get((index_name, query), _search_fn(index_name, query, top_n))
+
+        found = list(search(query_text))
+        for expansion in expand_query(query_text):
+            if len(found) >= top_n:
+                break
+            titles = {doc['title'] for doc in found}
+            found += [doc for doc in search(expansion) if doc['title'] not in titles][:top_n - len(found)]
+        # Tagged with the corpora the index serves, so each comparator is shown only its own documents
+        index_corpora = [corpus for corpus in corpora if CORPUS_INDEXES[corpus] == index_name]
+        documents += [dict(doc, corpora=index_corpora) for doc in found]
+    if prefetch is not None:
+        prefetch.close() # Cancel what this question did not need (other corpora, unused expansions)
+    return documents
+
+def _document_context(input_text, doc, doc_number=1):
+    """
+    Returns the context to send for one retrieved document and its local diff.
+    Near-identical documents are diffed locally so only the changed regions
+    reach the comparator agents, and of those only the clause pairs not
+    compared in an earlier run; earlier findings are listed for reference.
+    """
+    diff = diff_documents(input_text, doc['content'])
+    if diff['similarity'] < DIFF_MIN_SIMILARITY:
+        return doc['content'], diff
+    for n, difference in enumerate(diff['differences'], 1):
+        difference['id'] = f"D{doc_number}.{n}"
+    cached = clause_cache.annotate(diff['differences'])
+    pending = dict(diff, differences=[d for d in diff['differences'] if not d.get('cached')])
+    print(f"  - Sending local diff for '{doc['title']}' ({len(pending['differences'])} new / "
+          f"{cached} cached differences, similarity {diff['similarity']})")
+    doc_context = format_diff_for_llm(pending, doc['title']) if pending['differences'] or not cached else ""
+    if cached:
+        doc_context += (f"{cached} {'further ' if pending['differences'] else ''}differences against '{doc['title']}' "
+                        f"were compared in earlier runs; use these findings, do not compare them again:\n")
+        doc_context += "".join(f"[{d['id']}] {d['type']} at {d['location']}: {d['explanation']}\n"
+                               for d in diff['differences'] if d.get('cached'))
+    return doc_context, diff
+
 @app.route('/reverse_string', methods=['POST'])
 def reverse_string():
     # Get JSON data from the request
@@ -217,59 +462,219 @@ def reverse_string():
 
     return jsonify({"original": input_text, "reversed": reversed_text})
 
-@app.route('/run_workflow',methods=['POST'])
-def run_workflow():
-
- 
-    workflow_path = os.path.join(os.path.dirname(__file__), "workflow.json")
-    workflow_manager = WorkflowManager(workflow=workflow_path)
-    data = request.get_json()
-    if not data or 'text' not in data:
-        return jsonify({"error": "Missing 'text' in request"}), 400
-
-    input_text = data['text']
-    
-    retrieved_docs = retrieve_documents_from_search(input_text)
-    #fetch_data_ai_search(input_text)
-
+def execute_workflow(input_text, run_id=None, prefetch=None):
+    """
+    Runs retrieval, the agent workflow and report rendering for one input.
+    With a run_id, the retrieval stage and every round are checkpointed, and an
+    interrupted run with the same id resumes from its last completed round.
+    Args:
+        input_text (str): The user's question or document.
+        run_id (str, optional): Checkpoint key for the run.
+        prefetch (RetrievalPrefetch, optional): Searches already launched for this input.
+    Returns:
+        dict: The JSON-serializable workflow result.
+    """
     system_message = (
         "You are a helpful AI assistant that answers questions based ONLY on the provided context. "
         "If the answer cannot be found in the context, politely state that you don't have enough information. "
         "Cite the document titles you used to answer the question, if applicable."
     )
-   
-
-    #agent_input = f"""Based on the following documents:\n{responsefromaisearch}\n\nAnswer the question: {input_text}"""
-    
-# Format the retrieved documents as context for the LLM
-    context_text = ""
-    if retrieved_docs:
-        context_text = "Context Documents:\n"
-        for i, doc in enumerate(retrieved_docs):
-            context_text += f"Document {i+1} (Title: {doc['title']}):\n{doc['content']}\n\n"
-    else:
-        context_text = "No relevant documents were found to provide context.\n\n"
 
-    # Combine context and user query
-    full_prompt = f"{context_text}User Question: {input_text}"
-
-    messages = [
-        {"role": "system", "content": system_message},
-        {"role": "user", "content": full_prompt}
-    ]
+    checkpoint = run_checkpoints.load(run_id) if run_id else None
+    if checkpoint and checkpoint['context']:
+        print(f"\nResuming run {run_id[:12]} from checkpoint ({len(checkpoint['messages'])} completed rounds).")
+        context = checkpoint['context']
+        if prefetch is not None:
+            prefetch.close() # Retrieval results come from the checkpoint
+    else:
+        # Only the corpora the question needs are searched, and only their branches run
+        routing = query_router.route(input_text)
+        retrieved_docs = retrieve_for_corpora(input_text, routing['corpora'], prefetch=prefetch)
+        #fetch_data_ai_search(input_text)
+
+        #agent_input = f"""Based on the following documents:\n{responsefromaisearch}\n\nAnswer the question: {input_text}"""
+
+        # Format the retrieved documents as context for the LLM
+        context_text = ""
+        report_documents = []
+        if retrieved_docs:
+            context_text = "Context Documents:\n"
+            for i, doc in enumerate(retrieved_docs):
+                doc_context, diff = _document_context(input_text, doc, i + 1)
+                report_documents.append({"title": doc['title'], "diff": diff})
+                context_text += f"Document {i+1} (Title: {doc['title']}, Corpus: {', '.join(doc['corpora'])}):\n{doc_context}\n\n"
+        else:
+            context_text = "No relevant documents were found to provide context.\n\n"
+
+        # Combine context and user query
+        full_prompt = f"{context_text}User Question: {input_text}"
+
+        context = {
+            "route": routing['route'],
+            "sources": [doc['title'] for doc in retrieved_docs],
+            "full_prompt": full_prompt,
+            "report_documents": report_documents,
+        }
+        if run_id:
+            run_checkpoints.save_context(run_id, context)
+
+    report_documents = context['report_documents']
+    differences = [difference for document in report_documents for difference in document['diff']['differences']]
+    workflow = agents.get()
+    route = workflow.routes[context.get('route', 'all')]
+    # run the workflow on a task
+    try:
+        if checkpoint and checkpoint['messages']:
+            # Completed rounds are restored from the checkpoint, not re-generated;
+            # recording starts after the restore so they are not written again
+            speaker, last_message = resume_groupchat(route.orchestrator, checkpoint['messages'])
+            route.round_recorder.run_id = run_id
+            route.processor_monitor.reset()
+            chat_result = speaker.initiate_chat(
+            route.orchestrator, message = last_message, clear_history=False,
+            summary_method="reflection_with_llm",
+            summary_prompt = system_message
+            )
+        else:
+            route.round_recorder.run_id = run_id
+            route.processor_monitor.reset()
+            chat_result = workflow.user_proxy.initiate_chat(
+            route.orchestrator, message = context['full_prompt'],
+            summary_method="reflection_with_llm",
+            summary_prompt = system_message
+            )
+    finally:
+        route.round_recorder.run_id = None
+    summary = chat_result.summary
+    stop_reason = route.processor_monitor.result()
+
+    # Remember the comparators' per-difference findings for later runs
+    comparators = {names[1] for names in CORPUS_BRANCHES.values()}
+    comparator_messages = [m for m in route.processor.messages if m.get('name') in comparators]
+    findings = parse_findings(comparator_messages)
+    # Structured replies are validated locally; findings outside the local diff go to the report as is
+    structured, other_findings, rejected = parse_structured_findings(comparator_messages)
+    findings.update(structured)
+    stored = clause_cache.store_findings(differences, findings)
+    if stored:
+        print(f"Clause comparison cache: stored {stored} new findings.")
+
+    # Render the comparison report locally from the structured results
+    report_paths = render_report({
+        "title": "Tax Compliance Comparison Report",
+        "query": input_text,
+        "summary": summary,
+        "documents": report_documents,
+        "findings": render_findings(other_findings),
+    })
+
+    sources = context['sources']
+    if len(input_text) <= SEMANTIC_CACHE_MAX_QUERY_CHARS:
+        try:
+            answer_cache.store(input_text, summary, sources)
+        except Exception as e:
+            print(f"Semantic cache store failed: {e}")
+
+    if run_id:
+        run_checkpoints.delete(run_id)
+
+    return {
+        'message': summary,
+        'sources': sources,
+        'route': context.get('route', 'all'),
+        'stop_reason': stop_reason,
+        'structured_output': {'findings': len(structured) + len(other_findings), 'rejected_messages': len(rejected)},
+        'clause_cache': {'differences': len(differences), 'cached': sum(1 for d in differences if d.get('cached'))},
+        'report': {fmt: f"/reports/{os.path.basename(path)}" for fmt, path in report_paths.items() if fmt != 'report_id'},
+    }
 
+@app.route('/run_workflow',methods=['POST'])
+def run_workflow():
+    data = request.get_json()
+    if not data or 'text' not in data:
+        return jsonify({"error": "Missing 'text' in request"}), 400
 
+    input_text = data['text']
+    workflow_manager.get()
+    key = normalize_key(input_text, WORKFLOW_VERSION)
+
+    def run():
+        # Only the leader of identical requests gets here, so memo hits and coalesced
+        # followers launch no searches; the leader's run while the cache lookup and routing happen
+        prefetch = start_prefetch(input_text)
+        try:
+            # Answer from the semantic cache when a close enough question was answered before
+            if len(input_text) <= SEMANTIC_CACHE_MAX_QUERY_CHARS:
+                try:
+                    cached = answer_cache.lookup(input_text)
+                except Exception as e:
+                    print(f"Semantic cache lookup failed: {e}")
+                    cached = None
+                if cached:
+                    return {'message': cached['answer'], 'sources': cached['sources'],
+                            'similarity': cached['similarity'], 'served_by': 'semantic_cache'}
+
+            with admission_slot('run_workflow'):
+                # The key doubles as checkpoint id; another worker process running the same input keeps it
+                run_id = key if run_checkpoints.claim(key) else None
+                try:
+                    return execute_workflow(input_text, run_id=run_id, prefetch=prefetch)
+                finally:
+                    if run_id:
+                        run_checkpoints.release(run_id)
+        finally:
+            if prefetch is not None:
+                prefetch.close()
+
+    # Identical in-flight requests share one execution; stragglers get the memoized result
+    result, how = workflow_flight.do(key, run)
+    return jsonify(dict(result, served_by=result.get('served_by', how)))
+
+def _cache_report():
+    return {'semantic_cache': answer_cache.report(), 'request_coalescing': dict(workflow_flight.stats),
+            'embeddings': embed_texts.report(), 'query_router': dict(query_router.stats),
+            'retrieval_prefetch': retrieval_prefetcher.report(),
+            'clause_cache': clause_cache.report()}
+
+# Stats endpoints report the totals over all worker processes
+metrics.register("cache", _cache_report)
+metrics.register("http_pool", pool_stats)
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(metrics.report("cache"))
+
+@app.route('/http_pool/stats', methods=['GET'])
+def http_pool_stats():
+    """Returns usage counters of the shared Azure OpenAI connection pool."""
+    return jsonify(metrics.report("http_pool"))
+
+@app.route('/cache/invalidate', methods=['POST'])
+def cache_invalidate():
+    """Drops cached answers based on the given document titles, or everything if none are given."""
+    data = request.get_json(silent=True) or {}
+    titles = data.get('titles')
+    if titles:
+        removed = answer_cache.invalidate_sources(titles)
+    else:
+        removed = answer_cache.report()['entries']
+        answer_cache.clear()
+    return jsonify({'removed': removed})
 
-    # run the workflow on a task
-    
-    chat_result = user_proxy.initiate_chat(
-    orchestrator, message = full_prompt, 
-    summary_method="reflection_with_llm",
-    summary_prompt = system_message
-    )
-    
-    return jsonify({'message':chat_result.summary})
+@app.route('/reports/<path:filename>', methods=['GET'])
+def get_report(filename):
+    """Serves a rendered HTML or PDF report."""
+    return send_from_directory(os.path.abspath(REPORTS_DIR), filename)
 
 if __name__ == '__main__':
+    if SERVER_WORKERS:
+        # Production: pre-forked workers; clients and agent templates are built once before the fork
+        metrics.forget()
+        # Code-execution workers are started per worker process, after the fork
+        serve(app, 5000, preload=STARTUP_RESOURCES + [workflow_manager],
+              on_worker_start=[metrics.start, start_pools], on_worker_exit=[metrics.forget])
+        raise SystemExit(0)
+    # Build clients and agents in the background, or before accepting traffic (see startup.py)
+    warm_up_on_start(STARTUP_RESOURCES + [workflow_manager], then=[start_pools])
     # Run the Flask app on port 5000 (or any other available port)
- app.run(debug=True, port=5000)
+    app.run(debug=True, port=5000)
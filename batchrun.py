@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# --- Batch Question Runner ---
+# Streams questions from a JSONL file through a bounded thread pool and streams
+# results to an output JSONL as they complete. Input lines are read lazily and
+# at most workers * IN_FLIGHT_FACTOR questions are outstanding at once, so a
+# regression set of any size runs in constant memory.
+#
+# Input lines: {"id": ..., "question": "..."} ("query" / "input" also accepted;
+# the id defaults to the line number). A bare JSON string is a question too.
+# Output lines: the input id and question plus whatever the answer function
+# returns, or an "error" field if it raised.
+#
+# The output file is the checkpoint: it is appended to and flushed per record,
+# and a resumed run skips every id that already has a successful record there.
+# Failed questions are retried on resume; their new record supersedes the
+# earlier error line.
+#
+# ordered=True writes results in input order (completed results wait in a
+# reorder buffer for earlier ones); ordered=False writes them as they finish.
+
+IN_FLIGHT_FACTOR = 4
+QUESTION_FIELDS = ("question", "query", "input")
+
+
+def read_questions(path):
+    """
+    Lazily yields (id, question, record) from a JSONL file, skipping blank and invalid lines.
+    Args:
+        path (str): Input JSONL file.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping line {line_number}: invalid JSON ({e})")
+                continue
+            if isinstance(record, str):
+                record = {"question": record}
+            question = None
+            if isinstance(record, dict):
+                question = next((record[field] for field in QUESTION_FIELDS if record.get(field)), None)
+            if not isinstance(question, str):
+                print(f"Skipping line {line_number}: no question field")
+                continue
+            yield str(record.get("id", line_number)), question, record
+
+
+def completed_ids(output_path):
+    """Returns the ids that already have a successful record in the output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue # A line cut off by a crash mid-write
+            if isinstance(record, dict) and "id" in record:
+                if "error" in record:
+                    done.discard(record["id"])
+                else:
+                    done.add(record["id"])
+    return done
+
+
+def _end_partial_line(output_path):
+    # A crash mid-write leaves a line without its newline; appending to it would corrupt the next record
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+
+def run_batch(input_path, output_path, answer_fn, workers=8, ordered=True, resume=True):
+    """
+    Answers every question in a JSONL file concurrently, streaming results to a JSONL file.
+    Args:
+        input_path (str): Input JSONL file.
+        output_path (str): Output JSONL file; also the resume checkpoint.
+        answer_fn (callable): Takes a question, returns a JSON-serializable dict.
+        workers (int): Maximum number of questions answered at once.
+        ordered (bool): Write results in input order instead of completion order.
+        resume (bool): Skip questions already answered in output_path (otherwise it is overwritten).
+    Returns:
+        dict: Counts of 'answered', 'failed' and 'skipped' questions, and 'seconds'.
+    """
+    done = completed_ids(output_path) if resume else set()
+    if resume:
+        _end_partial_line(output_path)
+    stats = {"answered": 0, "failed": 0, "skipped": 0}
+    started = time.perf_counter()
+    write_lock = threading.Lock()
+
+    def answer(question_id, question):
+        t0 = time.perf_counter()
+        try:
+            result = dict(answer_fn(question))
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+        result["latency_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        return dict({"id": question_id, "question": question}, **result)
+
+    with open(output_path, 'a' if resume else 'w', encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+
+        def write(record):
+            with write_lock:
+                out.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+                out.flush()
+                stats["failed" if "error" in record else "answered"] += 1
+                total = stats["answered"] + stats["failed"]
+                if total % 100 == 0:
+                    print(f"Batch: {total} answered ({stats['failed']} failed), "
+                          f"{total / (time.perf_counter() - started):.1f} questions/s")
+
+        pending = {} # future -> sequence number
+        buffered = {} # sequence number -> finished record waiting for earlier ones (ordered mode)
+        next_to_write = 0
+
+        def drain(block):
+            nonlocal next_to_write
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED) if block else (
+                [future for future in pending if future.done()], None)
+            for future in finished:
+                sequence = pending.pop(future)
+                if ordered:
+                    buffered[sequence] = future.result()
+                else:
+                    write(future.result())
+            while next_to_write in buffered:
+                write(buffered.pop(next_to_write))
+                next_to_write += 1
+
+        sequence = 0
+        for question_id, question, _ in read_questions(input_path):
+            if question_id in done:
+                stats["skipped"] += 1
+                continue
+            # Bounded look-ahead: never read far past the oldest unfinished question
+            while len(pending) + len(buffered) >= workers * IN_FLIGHT_FACTOR:
+                drain(block=True)
+            pending[pool.submit(answer, question_id, question)] = sequence
+            sequence += 1
+            drain(block=False)
+        while pending:
+            drain(block=True)
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    print(f"Batch complete: {stats}")
+    return stats
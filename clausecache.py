@@ -0,0 +1,131 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# --- Clause-Level Comparison Cache ---
+# Invoices and filings built from the same templates produce the same clause
+# differences against the same statute text run after run, and the comparator
+# agents were asked to explain every one of them again. Each difference found
+# by docdiff is a (document clause, reference clause) pair; its finding (the
+# comparator's explanation) is cached in SQLite keyed by
+#   sha256(normalized document clause), sha256(normalized reference clause), prompt version
+# so only pairs never seen before are sent to the LLM for comparison. Cached
+# findings are attached to the report and listed in the agents' context as
+# settled, so the agents still answer the user's question but do not compare
+# those clauses again.
+#
+# Findings are read back from the comparator messages: the agents are asked to
+# start each finding with the difference id in brackets ("[D1.2] ...").
+# Bump COMPARISON_PROMPT_VERSION whenever the comparator prompts change.
+
+CLAUSE_CACHE_DB = os.getenv("CLAUSE_CACHE_DB", "clause_cache.db")
+COMPARISON_PROMPT_VERSION = os.getenv("COMPARISON_PROMPT_VERSION", "2")
+FINDING_PATTERN = re.compile(r"^[\s*_#-]*\[?(D\d+(?:\.\d+)?)\]?[*_]*\s*[:.\-–—]?\s*(.+)$", re.MULTILINE)
+
+
+def _clause_hash(text):
+    return hashlib.sha256(" ".join((text or "").split()).lower().encode("utf-8")).hexdigest()
+
+
+def parse_findings(messages):
+    """
+    Extracts per-difference findings ("[D1.2] explanation") from agent messages.
+    Args:
+        messages (iterable): Message dicts; the last finding for an id wins.
+    Returns:
+        dict: {difference id: explanation}.
+    """
+    findings = {}
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, str):
+            for difference_id, text in FINDING_PATTERN.findall(content):
+                findings[difference_id] = text.strip()
+    return findings
+
+
+class ClauseComparisonCache:
+    """
+    SQLite-backed cache of comparator findings per clause pair.
+    Args:
+        path (str): Database file.
+        prompt_version (str): Part of every key; findings from other prompt versions are ignored.
+    """
+
+    def __init__(self, path=CLAUSE_CACHE_DB, prompt_version=COMPARISON_PROMPT_VERSION):
+        self.path = path
+        self.prompt_version = prompt_version
+        self._local = threading.local()
+        os.register_at_fork(after_in_child=self._forget_connections) # Pre-forked workers open their own
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0, "stores": 0}
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS findings (clause_hash TEXT, reference_hash TEXT, prompt_version TEXT, "
+                       "explanation TEXT, created_at REAL, PRIMARY KEY (clause_hash, reference_hash, prompt_version))")
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    def _connect(self):
+        # One connection per thread; WAL keeps writers from blocking readers
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def _key(self, difference):
+        return _clause_hash(difference.get("before")), _clause_hash(difference.get("after")), self.prompt_version
+
+    def annotate(self, differences):
+        """
+        Attaches cached findings to differences ('explanation', 'cached': True).
+        Args:
+            differences (list): Difference dicts from docdiff.diff_documents().
+        Returns:
+            int: Number of differences served from the cache.
+        """
+        db = self._connect()
+        hits = 0
+        for difference in differences:
+            row = db.execute("SELECT explanation FROM findings WHERE clause_hash = ? AND reference_hash = ? AND prompt_version = ?",
+                             self._key(difference)).fetchone()
+            if row is not None:
+                difference.update(explanation=row[0], cached=True)
+                hits += 1
+        with self._lock:
+            self.stats["lookups"] += len(differences)
+            self.stats["hits"] += hits
+        return hits
+
+    def store_findings(self, differences, findings):
+        """
+        Records the findings of uncached differences and attaches them for the report.
+        Args:
+            differences (list): Difference dicts carrying an 'id'.
+            findings (dict): {difference id: explanation}, see parse_findings().
+        Returns:
+            int: Number of findings stored.
+        """
+        rows = []
+        for difference in differences:
+            explanation = findings.get(difference.get("id"))
+            if explanation and not difference.get("cached"):
+                difference["explanation"] = explanation
+                rows.append(self._key(difference) + (explanation, time.time()))
+        if rows:
+            with self._connect() as db:
+                db.executemany("INSERT OR REPLACE INTO findings (clause_hash, reference_hash, prompt_version, explanation, created_at) "
+                               "VALUES (?, ?, ?, ?, ?)", [(c, r, v, e, t) for c, r, v, e, t in rows])
+            with self._lock:
+                self.stats["stores"] += len(rows)
+        return len(rows)
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+        return stats
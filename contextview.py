@@ -0,0 +1,121 @@
+import re
+
+# --- Per-Agent Context Windows ---
+# In a GroupChat every agent is sent the whole conversation, including the large
+# retrieved-context blobs, on every turn, so prompt tokens grow quadratically
+# with the length of the chat. A view trims what one agent sees before it
+# replies. Views are plain dicts, configured per agent name:
+#
+#   keep_task (bool):         keep the first non-system message (the task). Default True.
+#   task_extract (str):       regex; if it matches the task, only the match is kept.
+#   task_drop (str):          regex; every match is removed from the task (e.g. documents meant for another agent).
+#   last_n (int):             keep only the last N messages after the task.
+#   names (tuple):            keep only messages from these senders (own messages are always kept).
+#   roles (tuple):            keep only messages with these roles.
+#   tool_output_chars (int):  truncate tool/function results to this many characters (0 drops them).
+#   max_tokens (int):         approximate token cap; the task is truncated to 3/4 of it, then oldest messages go first.
+#
+# The system message is always kept. Views are applied through autogen's
+# "process_all_messages_before_reply" hook, so the stored history is untouched.
+
+CHARS_PER_TOKEN = 4 # Rough estimate, good enough for a budget
+TRUNCATION_MARKER = "\n...[truncated]...\n"
+
+
+def estimate_tokens(messages):
+    return sum(len(m["content"]) for m in messages if isinstance(m.get("content"), str)) // CHARS_PER_TOKEN
+
+
+def _truncate(text, max_chars):
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= len(TRUNCATION_MARKER):
+        return text[:max_chars]
+    half = (max_chars - len(TRUNCATION_MARKER)) // 2
+    return text[:half] + TRUNCATION_MARKER + text[-half:]
+
+
+def _is_tool_result(message):
+    return message.get("role") in ("tool", "function") or bool(message.get("tool_responses"))
+
+
+def _repair_tool_pairs(messages):
+    """Drops tool results whose call was trimmed away, and calls whose results were trimmed away."""
+    repaired = []
+    for i, message in enumerate(messages):
+        if _is_tool_result(message) and not (repaired and (repaired[-1].get("tool_calls") or _is_tool_result(repaired[-1]))):
+            continue
+        if message.get("tool_calls") and not (i + 1 < len(messages) and _is_tool_result(messages[i + 1])):
+            continue
+        repaired.append(message)
+    return repaired
+
+
+def apply_view(messages, view):
+    """
+    Returns the subset of messages an agent should see, according to its view.
+    Args:
+        messages (list): The agent's full message list for this conversation.
+        view (dict): The view configuration (see module comment).
+    Returns:
+        list: The trimmed message list (new dicts where content was changed).
+    """
+    system = [m for m in messages[:1] if m.get("role") == "system"]
+    rest = messages[len(system):]
+    task, history = [], rest
+    if view.get("keep_task", True) and rest:
+        task, history = [dict(rest[0])], rest[1:]
+        if view.get("task_extract") and isinstance(task[0].get("content"), str):
+            match = re.search(view["task_extract"], task[0]["content"], re.DOTALL)
+            if match:
+                task[0]["content"] = match.group(0)
+        if view.get("task_drop") and isinstance(task[0].get("content"), str):
+            task[0]["content"] = re.sub(view["task_drop"], "", task[0]["content"], flags=re.DOTALL)
+
+    if view.get("names"):
+        history = [m for m in history if m.get("role") == "assistant" or m.get("name") in view["names"] or _is_tool_result(m)]
+    if view.get("roles"):
+        history = [m for m in history if m.get("role") in view["roles"]]
+    if "tool_output_chars" in view:
+        limit = view["tool_output_chars"]
+        trimmed = []
+        for m in history:
+            if _is_tool_result(m) and isinstance(m.get("content"), str) and len(m["content"]) > limit:
+                m = dict(m, content=_truncate(m["content"], limit) if limit else "[tool output omitted]")
+                if m.get("tool_responses"):
+                    m["tool_responses"] = [dict(r, content=_truncate(str(r.get("content", "")), limit) if limit else "[tool output omitted]")
+                                           for r in m["tool_responses"]]
+            trimmed.append(m)
+        history = trimmed
+    if view.get("last_n") is not None:
+        history = history[-view["last_n"]:] if view["last_n"] else []
+    history = _repair_tool_pairs(history)
+
+    max_tokens = view.get("max_tokens")
+    if max_tokens:
+        # The task may use at most 3/4 of the budget so recent turns still fit
+        if task and isinstance(task[0].get("content"), str):
+            task[0]["content"] = _truncate(task[0]["content"], max_tokens * CHARS_PER_TOKEN * 3 // 4)
+        while history and estimate_tokens(system + task + history) > max_tokens:
+            history = _repair_tool_pairs(history[1:])
+    return system + task + history
+
+
+def register_context_views(agents, views):
+    """
+    Attaches views to agents by name.
+    Args:
+        agents (list): ConversableAgent instances.
+        views (dict): Agent name -> view configuration. Agents without a view see everything.
+    """
+    for agent in agents:
+        view = views.get(agent.name)
+        if view is None:
+            continue
+
+        def process_messages(messages, view=view, name=agent.name):
+            viewed = apply_view(messages, view)
+            print(f"  [{name}] context view: {len(messages)} -> {len(viewed)} messages, ~{estimate_tokens(viewed)} tokens")
+            return viewed
+
+        agent.register_hook("process_all_messages_before_reply", process_messages)
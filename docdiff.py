@@ -0,0 +1,207 @@
+import difflib
+import re
+
+# --- Local Deterministic Document Diff ---
+# Computes the exact (verbatim) and structural differences between a user
+# document and a retrieved rule/judgement document without an LLM call.
+# Documents are segmented into sections -> paragraphs -> clauses, sections are
+# aligned by heading and content, and clauses are compared with difflib.
+# Only the changed regions (plus a little context) are handed to the
+# comparator agents, which then explain the semantic impact.
+
+# A line is treated as a section heading if it looks like a markdown heading,
+# a "Section 12"/"Rule 3(a)" style label, or a short numbered title.
+HEADING_PATTERN = re.compile(
+    r"^\s*(?:#{1,6}\s+\S.*"
+    r"|(?:section|article|rule|chapter|part|schedule|clause)\s+[\w.()\-]+.*"
+    r"|\d+(?:\.\d+)*[.)]?\s+[A-Z][^.]{0,80})\s*$",
+    re.IGNORECASE,
+)
+CLAUSE_SPLIT_PATTERN = re.compile(r"(?<=[.;:])\s+(?=\S)|\s+(?=\([a-z0-9]{1,4}\)\s)")
+NUMBER_PATTERN = re.compile(r"\d[\d,]*(?:\.\d+)?%?")
+
+# Sections whose bodies are at least this similar are paired even if their headings differ
+SECTION_MATCH_THRESHOLD = 0.5
+# Characters of unchanged text kept on either side of a change
+CONTEXT_CHARS = 160
+
+
+def _normalize(text):
+    return " ".join(text.split()).lower()
+
+
+def segment_document(text):
+    """
+    Splits a document into sections, paragraphs and clauses.
+    Args:
+        text (str): The raw document text.
+    Returns:
+        list: Section dicts with 'heading', 'paragraphs' (list of clause lists) and 'text'.
+    """
+    sections = []
+    heading, lines = "", []
+
+    def flush():
+        body = "\n".join(lines).strip()
+        if heading or body:
+            paragraphs = [
+                [clause.strip() for clause in CLAUSE_SPLIT_PATTERN.split(paragraph) if clause.strip()]
+                for paragraph in re.split(r"\n\s*\n", body) if paragraph.strip()
+            ]
+            sections.append({"heading": heading.strip(), "paragraphs": paragraphs, "text": body})
+
+    for line in text.splitlines():
+        if HEADING_PATTERN.match(line):
+            flush()
+            heading, lines = line, []
+        else:
+            lines.append(line)
+    flush()
+    return sections
+
+
+def _align_sections(left, right):
+    """
+    Pairs sections of two documents, first by heading, then by body similarity.
+    Returns:
+        list: (left_index or None, right_index or None) pairs in document order.
+    """
+    pairs = {}
+    matcher = difflib.SequenceMatcher(
+        None, [_normalize(s["heading"]) for s in left], [_normalize(s["heading"]) for s in right], autojunk=False
+    )
+    for block in matcher.get_matching_blocks():
+        for offset in range(block.size):
+            pairs[block.a + offset] = block.b + offset
+
+    unmatched_right = [j for j in range(len(right)) if j not in pairs.values()]
+    for i, section in enumerate(left):
+        if i in pairs:
+            continue
+        best, best_ratio = None, SECTION_MATCH_THRESHOLD
+        for j in unmatched_right:
+            candidate = difflib.SequenceMatcher(None, _normalize(section["text"]), _normalize(right[j]["text"]))
+            if candidate.quick_ratio() < best_ratio:
+                continue
+            ratio = candidate.ratio()
+            if ratio >= best_ratio:
+                best, best_ratio = j, ratio
+        if best is not None:
+            pairs[i] = best
+            unmatched_right.remove(best)
+
+    aligned = [(i, pairs.get(i)) for i in range(len(left))]
+    aligned += [(None, j) for j in unmatched_right]
+    # Keep the output in the order of the reference (right) document where possible
+    aligned.sort(key=lambda pair: (pair[1] if pair[1] is not None else pair[0], pair[0] is None))
+    return aligned
+
+
+def _word_changes(before, after):
+    """Returns the verbatim word-level edits between two clauses."""
+    a, b = before.split(), after.split()
+    changes = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag != "equal":
+            changes.append({"op": tag, "before": " ".join(a[i1:i2]), "after": " ".join(b[j1:j2])})
+    return changes
+
+
+def _classify(before, after, word_changes):
+    if _normalize(before) == _normalize(after):
+        return "formatting"
+    edited = " ".join(change["before"] + " " + change["after"] for change in word_changes)
+    if NUMBER_PATTERN.search(edited):
+        return "data_value"
+    return "wording"
+
+
+def _clauses(section):
+    return [clause for paragraph in section["paragraphs"] for clause in paragraph]
+
+
+def _location(section, clause_index=None):
+    label = section["heading"] or "(untitled section)"
+    return label if clause_index is None else f"{label} / clause {clause_index + 1}"
+
+
+def diff_documents(user_text, reference_text):
+    """
+    Computes verbatim and structural differences between two documents.
+    Args:
+        user_text (str): The document received from the user.
+        reference_text (str): The retrieved rule or court order text.
+    Returns:
+        dict: 'similarity' (0-1), 'differences' (list of difference dicts) and
+              'unchanged_clauses' (count of clauses that matched verbatim).
+    """
+    left, right = segment_document(user_text), segment_document(reference_text)
+    differences = []
+    unchanged = 0
+
+    for i, j in _align_sections(left, right):
+        if j is None:
+            differences.append({"type": "section_removed_from_reference", "location": _location(left[i]),
+                                "before": left[i]["text"], "after": ""})
+            continue
+        if i is None:
+            differences.append({"type": "section_missing_from_document", "location": _location(right[j]),
+                                "before": "", "after": right[j]["text"]})
+            continue
+        if _normalize(left[i]["heading"]) != _normalize(right[j]["heading"]):
+            differences.append({"type": "heading_changed", "location": _location(right[j]),
+                                "before": left[i]["heading"], "after": right[j]["heading"]})
+
+        a, b = _clauses(left[i]), _clauses(right[j])
+        matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                unchanged += i2 - i1
+                continue
+            before, after = " ".join(a[i1:i2]), " ".join(b[j1:j2])
+            changes = _word_changes(before, after)
+            differences.append({
+                "type": {"insert": "clause_added", "delete": "clause_removed"}.get(tag) or _classify(before, after, changes),
+                "location": _location(right[j], j1),
+                "before": before,
+                "after": after,
+                "word_changes": changes,
+                "context_before": " ".join(b[:j1])[-CONTEXT_CHARS:],
+                "context_after": " ".join(b[j2:])[:CONTEXT_CHARS],
+            })
+
+    # ratio() over word sequences: quick_ratio() only compares which characters occur,
+    # so unrelated texts of the same language score well above DIFF_MIN_SIMILARITY
+    similarity = difflib.SequenceMatcher(
+        None, _normalize(user_text).split(), _normalize(reference_text).split(), autojunk=False
+    ).ratio()
+    return {"similarity": round(similarity, 3), "differences": differences, "unchanged_clauses": unchanged}
+
+
+def format_diff_for_llm(diff, title="Reference"):
+    """
+    Renders a diff as compact text for the comparator agents: only changed
+    regions and their context, never the full documents.
+    Args:
+        diff (dict): Output of diff_documents().
+        title (str): Title of the reference document.
+    Returns:
+        str: The prompt fragment describing the differences.
+    """
+    if not diff["differences"]:
+        return f"Locally computed diff against '{title}': no differences ({diff['unchanged_clauses']} clauses identical).\n"
+    lines = [
+        f"Locally computed diff against '{title}' (similarity {diff['similarity']}, "
+        f"{diff['unchanged_clauses']} clauses identical, {len(diff['differences'])} differences):"
+    ]
+    for n, difference in enumerate(diff["differences"], 1):
+        lines.append(f"[{difference.get('id', f'D{n}')}] {difference['type']} at {difference['location']}")
+        if difference.get("context_before"):
+            lines.append(f"  ...{difference['context_before']}")
+        if difference["before"]:
+            lines.append(f"  - document:  {difference['before']}")
+        if difference["after"]:
+            lines.append(f"  + reference: {difference['after']}")
+        if difference.get("context_after"):
+            lines.append(f"  {difference['context_after']}...")
+    return "\n".join(lines) + "\n"
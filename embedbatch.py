@@ -0,0 +1,199 @@
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Micro-Batching Embedding Service ---
+# Concurrent requests (the semantic cache on /run_workflow, rag.py batch runs)
+# each need one short embedding. Sent one by one, they pay a full round trip
+# each and run into the deployment's request-per-minute limit long before its
+# token limit. EmbeddingBatcher queues the texts of concurrent callers, waits up
+# to EMBED_MAX_WAIT_MS after the first one arrives (or until EMBED_MAX_BATCH
+# texts are queued), sends them as one batched call and hands every caller its
+# own vectors. Identical texts in a batch are embedded once, and recent
+# embeddings are served from an LRU cache without a call at all.
+#
+# local_embed_texts is a deterministic, dependency-free stand-in (feature-hashed
+# words and word pairs), selected with EMBEDDING_BACKEND=local for tests and
+# offline runs. Similar texts get similar vectors, identical texts identical ones.
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "azure") # "azure" or "local"
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+EMBED_MAX_CONCURRENT_BATCHES = int(os.getenv("EMBED_MAX_CONCURRENT_BATCHES", "4"))
+LOCAL_EMBED_DIM = 256
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def local_embed_texts(texts, dim=LOCAL_EMBED_DIM):
+    """
+    Deterministic stand-in for an embedding model: signed feature hashing of words and word pairs.
+    Args:
+        texts (list): Strings to embed.
+        dim (int): Vector length.
+    Returns:
+        list: One unit-length vector (list of floats) per text.
+    """
+    vectors = []
+    for text in texts:
+        vector = [0.0] * dim
+        words = WORD_PATTERN.findall(text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % dim] += -1.0 if h >> 63 else 1.0
+        norm = math.sqrt(sum(x * x for x in vector))
+        vectors.append([x / norm for x in vector] if norm else vector)
+    return vectors
+
+
+class _Request:
+    def __init__(self, texts):
+        self.texts = texts
+        self.vectors = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into batched calls, with an LRU cache in front.
+    Callable like the function it wraps, so it can be passed wherever an embed_fn is expected.
+    Args:
+        embed_fn (callable): Takes a list of strings, returns a list of vectors.
+        max_batch_size (int): Maximum texts per call.
+        max_wait_ms (float): How long the first queued text waits for company.
+        cache_size (int): Number of recent embeddings kept (0 disables the cache).
+        max_concurrent_batches (int): Batched calls allowed in flight at once.
+    """
+
+    def __init__(self, embed_fn, max_batch_size=EMBED_MAX_BATCH, max_wait_ms=EMBED_MAX_WAIT_MS,
+                 cache_size=EMBED_CACHE_SIZE, max_concurrent_batches=EMBED_MAX_CONCURRENT_BATCHES):
+        self._embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._queue = []
+        self._queued_texts = 0
+        self._cond = threading.Condition()
+        self.max_concurrent_batches = max_concurrent_batches
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix="embed-batch")
+        self._worker = None
+        # A pre-forked worker inherits the objects but not the threads: start over in the child
+        os.register_at_fork(after_in_child=self._reset_threads)
+        self.stats = {"requests": 0, "texts": 0, "cache_hits": 0, "batches": 0, "batched_texts": 0, "errors": 0}
+
+    def _reset_threads(self):
+        self._queue, self._queued_texts = [], 0
+        self._cond = threading.Condition()
+        self._cache_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrent_batches, thread_name_prefix="embed-batch")
+        self._worker = None
+
+    def __call__(self, texts):
+        return self.embed(texts)
+
+    def embed(self, texts):
+        """
+        Returns one vector per text, blocking until the batch containing them has been embedded.
+        Raises:
+            Exception: Whatever the embedding call raised for this caller's batch.
+        """
+        results = [None] * len(texts)
+        missing = OrderedDict() # text -> positions in results
+        with self._cache_lock:
+            self.stats["requests"] += 1
+            self.stats["texts"] += len(texts)
+            for i, text in enumerate(texts):
+                vector = self._cache.get(text)
+                if vector is not None:
+                    self._cache.move_to_end(text)
+                    self.stats["cache_hits"] += 1
+                    results[i] = vector
+                else:
+                    missing.setdefault(text, []).append(i)
+        if not missing:
+            return results
+
+        request = _Request(list(missing))
+        with self._cond:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._collect, name="embed-batcher", daemon=True)
+                self._worker.start()
+            self._queue.append(request)
+            self._queued_texts += len(request.texts)
+            self._cond.notify()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        for text, vector in zip(request.texts, request.vectors):
+            for i in missing[text]:
+                results[i] = vector
+        return results
+
+    def _collect(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.max_wait
+                while self._queued_texts < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, size = [], 0
+                while self._queue and (not batch or size + len(self._queue[0].texts) <= self.max_batch_size):
+                    request = self._queue.pop(0)
+                    batch.append(request)
+                    size += len(request.texts)
+                self._queued_texts -= size
+            self._pool.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        texts = list(OrderedDict.fromkeys(text for request in batch for text in request.texts))
+        try:
+            vectors = {}
+            # A single caller may bring more than max_batch_size texts
+            for start in range(0, len(texts), self.max_batch_size):
+                chunk = texts[start:start + self.max_batch_size]
+                vectors.update(zip(chunk, self._embed_fn(chunk)))
+                with self._cache_lock:
+                    self.stats["batches"] += 1
+                    self.stats["batched_texts"] += len(chunk)
+            for request in batch:
+                request.vectors = [vectors[text] for text in request.texts]
+            self._remember(vectors)
+        except Exception as e:
+            print(f"Embedding batch of {len(texts)} texts failed: {e}")
+            with self._cache_lock:
+                self.stats["errors"] += 1
+            for request in batch:
+                request.error = e
+        finally:
+            for request in batch:
+                request.done.set()
+
+    def _remember(self, vectors):
+        if not self.cache_size:
+            return
+        with self._cache_lock:
+            for text, vector in vectors.items():
+                self._cache[text] = vector
+                self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def report(self):
+        """Returns the counters plus cache size, cache hit rate and mean batch size."""
+        with self._cache_lock:
+            stats = dict(self.stats, cached=len(self._cache))
+        stats["cache_hit_rate"] = round(stats["cache_hits"] / stats["texts"], 4) if stats["texts"] else 0.0
+        stats["mean_batch_size"] = round(stats["batched_texts"] / stats["batches"], 2) if stats["batches"] else 0.0
+        return stats
@@ -0,0 +1,176 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Suspendable Human-in-the-Loop Sessions ---
+# With human_input_mode="ALWAYS" autogen blocks on input() whenever the human's
+# turn comes up, holding a thread (and, behind a web server, a request) for as
+# long as the human takes to answer. Here the user proxy raises
+# HumanInputRequired instead; the run unwinds, the GroupChat state is
+# checkpointed to disk and the worker is released. A later request supplies the
+# input and the chat continues from the checkpoint. Waiting sessions are just a
+# JSON file: no thread, no LLM call.
+#
+# Session states: 'new' -> 'running' -> 'waiting_for_input' <-> 'running' -> 'completed' | 'error'
+
+SESSIONS_DIR = os.getenv("SESSIONS_DIR", "sessions")
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+# What the human "says" when they submit empty input: let the agents carry on
+CONTINUE_MESSAGE = "Please continue."
+EXIT_INPUTS = ("exit", "terminate")
+
+
+class HumanInputRequired(Exception):
+    """Raised from the user proxy when the chat needs the human's input."""
+
+    def __init__(self, prompt):
+        super().__init__(prompt)
+        self.prompt = prompt
+
+
+def make_suspendable(user_proxy):
+    """
+    Makes a UserProxyAgent raise HumanInputRequired instead of blocking on input().
+    Args:
+        user_proxy (UserProxyAgent): The agent that represents the human.
+    """
+    def get_human_input(prompt):
+        raise HumanInputRequired(prompt)
+
+    user_proxy.get_human_input = get_human_input
+
+
+class SessionStore:
+    """
+    Stores one JSON checkpoint per session.
+    Args:
+        directory (str): Where checkpoint files are written.
+    """
+
+    def __init__(self, directory=SESSIONS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id):
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def load(self, session_id):
+        """Returns the session checkpoint, or a fresh 'new' session."""
+        path = self._path(session_id)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"Error loading session '{session_id}': {e}. Starting fresh.")
+        return {"session_id": session_id, "state": "new", "messages": [], "pending_prompt": None,
+                "stop_reason": None, "updated_at": time.time()}
+
+    def save(self, session):
+        session["updated_at"] = time.time()
+        path = self._path(session["session_id"])
+        # Write-then-rename so a crash never leaves a half-written checkpoint
+        with self._lock:
+            with open(path + ".tmp", 'w') as f:
+                json.dump(session, f, indent=4, default=str)
+            os.replace(path + ".tmp", path)
+
+    @contextmanager
+    def locked(self, session_id):
+        """
+        Holds an exclusive lock on a session across processes, so two pre-forked
+        workers never run the same session at once. A no-op without fcntl (Windows).
+        """
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        with open(self._path(session_id) + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def delete(self, session_id):
+        path = self._path(session_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _clear_histories(manager):
+    # The agents are shared by every session: nothing of another session may stay in them
+    manager.groupchat.messages = []
+    for agent in [manager] + manager.groupchat.agents:
+        if hasattr(agent, "clear_history"):
+            agent.clear_history()
+
+
+def restore_groupchat(manager, messages):
+    """
+    Restores a checkpointed conversation into a GroupChatManager and its agents, after
+    clearing whatever an earlier session left there.
+    Uses GroupChatManager.resume() when the installed autogen has it, so every agent's
+    own history is primed too; otherwise only the shared GroupChat messages are restored.
+    """
+    _clear_histories(manager)
+    if not messages:
+        return
+    if hasattr(manager, "resume"):
+        try:
+            speaker, last = manager.resume(messages=messages, silent=True)
+            # resume() leaves out the last message for the caller to re-send; the chat continues
+            # with the human's new message instead, so the last one is restored here
+            for agent in manager.groupchat.agents:
+                manager.send(last, agent, request_reply=False, silent=True)
+            if speaker in manager.groupchat.agents:
+                manager.groupchat.append(last, speaker)
+            else:
+                manager.groupchat.messages.append(last)
+            return
+        except Exception as e:
+            print(f"GroupChatManager.resume failed ({e}); restoring GroupChat messages only.")
+            _clear_histories(manager)
+    manager.groupchat.messages = list(messages)
+
+
+def run_until_input(session, user_proxy, manager, message):
+    """
+    Runs (or continues) a session's chat until it completes or needs human input.
+    Args:
+        session (dict): The session checkpoint; updated in place.
+        user_proxy (UserProxyAgent): A suspendable user proxy (see make_suspendable).
+        manager (GroupChatManager): The manager of the session's GroupChat.
+        message (str): The human's message / answer to the pending prompt.
+    Returns:
+        dict: The updated session.
+    """
+    if session["state"] == "waiting_for_input" and message.strip().lower() in EXIT_INPUTS:
+        session.update(state="completed", pending_prompt=None, stop_reason={"reason": "human_exit"})
+        return session
+
+    restore_groupchat(manager, session["messages"])
+    monitor = getattr(manager, "convergence_monitor", None)
+    if monitor is not None:
+        monitor.reset()
+    session.update(state="running", pending_prompt=None)
+    try:
+        user_proxy.initiate_chat(manager, message=message.strip() or CONTINUE_MESSAGE, clear_history=False)
+        session["state"] = "completed"
+        session["stop_reason"] = monitor.result() if monitor is not None else None
+    except HumanInputRequired as e:
+        print(f"--- Session '{session['session_id']}' waiting for human input ---")
+        session.update(state="waiting_for_input", pending_prompt=e.prompt)
+    except Exception as e:
+        session.update(state="error", pending_prompt=None, error=str(e))
+        raise
+    finally:
+        session["messages"] = [msg for msg in manager.groupchat.messages if isinstance(msg, dict)]
+    return session
@@ -0,0 +1,79 @@
+import gzip
+
+try:
+    import brotli # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# --- Response Compression ---
+# Compresses JSON/HTML/text responses larger than MIN_SIZE with brotli when the
+# client accepts it and the brotli package is installed, otherwise gzip.
+# Chat histories are highly repetitive and typically shrink 5-10x.
+
+MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "text/plain", "text/css", "application/javascript")
+
+
+def _accepts(accept_encoding, encoding):
+    """
+    Tells whether an Accept-Encoding header allows an encoding.
+    Args:
+        accept_encoding (str): The header value, e.g. "gzip;q=1.0, br;q=0".
+        encoding (str): The encoding to check, e.g. "br".
+    Returns:
+        bool: True if the encoding (or "*", when it is not listed itself) has a non-zero q-value.
+    """
+    qualities = {}
+    for token in accept_encoding.lower().split(","):
+        name, _, params = token.partition(";")
+        name = name.strip()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    quality = qualities.get(encoding, qualities.get("*", 0.0))
+    return quality > 0
+
+
+def register_compression(app, min_size=MIN_SIZE, gzip_level=6, brotli_quality=5):
+    """
+    Adds an after_request hook that compresses eligible responses.
+    Args:
+        app (Flask): The Flask application.
+        min_size (int): Responses smaller than this many bytes are sent as-is.
+        gzip_level (int): gzip compression level.
+        brotli_quality (int): brotli quality (0-11).
+    """
+    from flask import request
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.status_code < 200 or response.status_code >= 300
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        accept_encoding = request.headers.get("Accept-Encoding", "")
+        if brotli is not None and _accepts(accept_encoding, "br"):
+            response.set_data(brotli.compress(data, quality=brotli_quality))
+            response.headers["Content-Encoding"] = "br"
+        elif _accepts(accept_encoding, "gzip"):
+            response.set_data(gzip.compress(data, compresslevel=gzip_level))
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            return response
+        response.headers["Content-Length"] = str(len(response.get_data()))
+        response.vary.add("Accept-Encoding")
+        # A strong ETag computed on the uncompressed body no longer matches the bytes sent
+        if response.headers.get("ETag") and not response.headers["ETag"].startswith("W/"):
+            response.headers["ETag"] = "W/" + response.headers["ETag"]
+        return response
@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+
+# --- Shared HTTP Connection Pool for Azure OpenAI ---
+# Every AzureOpenAI client and every autogen agent's internal OpenAI client
+# normally builds its own httpx connection pool with default limits, so one
+# /run_workflow run opens TLS connections to the same endpoint from half a
+# dozen pools and none of them are reused across agents. shared_http_client()
+# returns one process-wide httpx.Client (keep-alive, pool limits, optional
+# HTTP/2, connect/read/pool timeouts) that direct completions and all agents
+# share via with_http_client(llm_config).
+#
+# The client's transport counts requests, in-flight requests (until the
+# response body is closed), errors and newly opened connections; pool_stats()
+# reports them together with the pool's current open/idle connections.
+#
+# HTTP/2 needs the h2 package (pip install "httpx[http2]"); without it the
+# setting is ignored with a warning.
+
+OPENAI_HTTP_MAX_CONNECTIONS = int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "100"))
+OPENAI_HTTP_MAX_KEEPALIVE = int(os.getenv("OPENAI_HTTP_MAX_KEEPALIVE", "20"))
+OPENAI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_HTTP_KEEPALIVE_EXPIRY", "60"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "false").lower() in ("1", "true", "yes")
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "120"))
+OPENAI_POOL_TIMEOUT = float(os.getenv("OPENAI_POOL_TIMEOUT", "10")) # Max wait for a free connection
+
+_client_lock = threading.Lock()
+_client = None
+_transport = None
+
+
+def _build_client():
+    import httpx
+
+    class CountingStream(httpx.SyncByteStream):
+        def __init__(self, stream, on_close):
+            self._stream = stream
+            self._on_close = on_close
+
+        def __iter__(self):
+            yield from self._stream
+
+        def close(self):
+            try:
+                self._stream.close()
+            finally:
+                self._on_close()
+
+    class MeteredTransport(httpx.HTTPTransport):
+        """HTTPTransport that keeps request and connection counters."""
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self._lock = threading.Lock()
+            self._seen_connections = set()
+            self.stats = {"requests": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0,
+                          "connections_opened": 0, "headers_seconds_total": 0.0}
+
+        def _finished(self):
+            with self._lock:
+                self.stats["in_flight"] -= 1
+                # Connections we have not seen before were opened for this request
+                for connection in self.connections():
+                    if id(connection) not in self._seen_connections:
+                        self._seen_connections.add(id(connection))
+                        self.stats["connections_opened"] += 1
+
+        def handle_request(self, request):
+            with self._lock:
+                self.stats["requests"] += 1
+                self.stats["in_flight"] += 1
+                self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+            started = time.perf_counter()
+            try:
+                response = super().handle_request(request)
+            except Exception:
+                with self._lock:
+                    self.stats["errors"] += 1
+                self._finished()
+                raise
+            with self._lock:
+                self.stats["headers_seconds_total"] += time.perf_counter() - started
+            response.stream = CountingStream(response.stream, self._finished)
+            return response
+
+        def connections(self):
+            try:
+                return list(self._pool.connections)
+            except AttributeError: # httpcore internals changed
+                return []
+
+    class SharedHttpClient(httpx.Client):
+        # autogen deep-copies llm_config; every copy must keep using this one pool
+        def __deepcopy__(self, memo):
+            return self
+
+        def __copy__(self):
+            return self
+
+    http2 = OPENAI_HTTP2
+    if http2:
+        try:
+            import h2 # noqa: F401
+        except ImportError:
+            print("OPENAI_HTTP2 is set but the h2 package is not installed; using HTTP/1.1.")
+            http2 = False
+
+    limits = httpx.Limits(max_connections=OPENAI_HTTP_MAX_CONNECTIONS,
+                          max_keepalive_connections=OPENAI_HTTP_MAX_KEEPALIVE,
+                          keepalive_expiry=OPENAI_HTTP_KEEPALIVE_EXPIRY)
+    timeout = httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT, pool=OPENAI_POOL_TIMEOUT)
+    transport = MeteredTransport(limits=limits, http2=http2)
+    client = SharedHttpClient(transport=transport, timeout=timeout, follow_redirects=True)
+    print(f"Shared OpenAI HTTP pool: max {OPENAI_HTTP_MAX_CONNECTIONS} connections, "
+          f"{OPENAI_HTTP_MAX_KEEPALIVE} keep-alive, HTTP/2 {'on' if http2 else 'off'}.")
+    return client, transport
+
+
+def _reset_after_fork():
+    # A pre-forked worker (see prefork.py) inherits the parent's pool. Its pooled
+    # connections share sockets and TLS state with the parent, so the child drops
+    # them and opens its own; counters restart per process.
+    global _client_lock
+    _client_lock = threading.Lock()
+    if _transport is None:
+        return
+    _transport._lock = threading.Lock()
+    _transport.stats = dict.fromkeys(_transport.stats, 0)
+    _transport._seen_connections.clear()
+    pool = getattr(_transport, "_pool", None)
+    for attribute in ("_connections", "_requests"): # httpcore internals; left alone if they changed
+        if isinstance(getattr(pool, attribute, None), list):
+            getattr(pool, attribute).clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def shared_http_client():
+    """
+    Returns the process-wide httpx.Client for Azure OpenAI traffic, creating it on first use.
+    Pass it as AzureOpenAI(http_client=...) or put it in llm_config with with_http_client().
+    """
+    global _client, _transport
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client, _transport = _build_client()
+    return _client
+
+
+def with_http_client(llm_config):
+    """
+    Returns a copy of an autogen llm_config whose OpenAI clients all use the shared pool.
+    Args:
+        llm_config (dict): A flat config or one with a 'config_list'.
+    Returns:
+        dict: The config with 'http_client' set on it (or on every config_list entry).
+    """
+    client = shared_http_client()
+    config = dict(llm_config)
+    if "config_list" in config:
+        config["config_list"] = [dict(entry, http_client=client) for entry in config["config_list"]]
+    else:
+        config["http_client"] = client
+    return config
+
+
+def pool_stats():
+    """Returns the shared pool's request/connection counters and current connections."""
+    if _transport is None:
+        return {"initialized": False}
+    with _transport._lock:
+        stats = dict(_transport.stats)
+    connections = _transport.connections()
+    idle = sum(1 for connection in connections if connection.is_idle())
+    completed = stats["requests"] - stats["errors"]
+    headers_seconds = stats.pop("headers_seconds_total")
+    stats.update({
+        "initialized": True,
+        "connections_open": len(connections),
+        "connections_idle": idle,
+        "connections_active": len(connections) - idle,
+        "max_connections": OPENAI_HTTP_MAX_CONNECTIONS,
+        "connection_reuse_rate": round(1 - stats["connections_opened"] / completed, 4) if completed else 0.0,
+        "headers_ms_mean": round(headers_seconds / completed * 1000, 1) if completed else 0.0,
+    })
+    return stats
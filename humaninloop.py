@@ -1,6 +1,8 @@
 import autogen
 import json
 import os
+from warmpool import code_execution_config
+from termination import ConvergenceMonitor
 
 # --- Configuration ---
 # Define the path for the chat history file
@@ -98,11 +100,9 @@ def create_multi_agents(llm_config):
         human_input_mode="ALWAYS", # IMPORTANT: This enables human in the loop
         max_consecutive_auto_reply=10,
         is_termination_msg=lambda x: "TERMINATE" in x.get("content", "").upper(),
-        code_execution_config={
-            "work_dir": "coding", # Directory for code execution
-            "use_docker": False, # Set to True if you have Docker installed and want isolated execution
-            # Ensure the 'coding' directory exists or is created by the agent
-        },
+        # Code runs on a pool of pre-warmed Python workers in the 'coding' directory
+        # (set CODE_EXECUTOR=local to use autogen's default executor, optionally with Docker)
+        code_execution_config=code_execution_config(work_dir="coding", use_docker=False),
         system_message="You are the human user. You can provide feedback, approve code, "
                         "or tell the agents to TERMINATE. "
                         "Type 'exit' or 'TERMINATE' to end the conversation, or just press Enter "
@@ -121,10 +121,7 @@ def create_multi_agents(llm_config):
     coder = autogen.AssistantAgent(
         name="Coder",
         llm_config=llm_config,
-        code_execution_config={
-            "work_dir": "coding",
-            "use_docker": False,
-        },
+        code_execution_config=code_execution_config(work_dir="coding", use_docker=False),
         system_message="You are a Python programmer. You write and debug Python code. "
                         "Provide code in markdown blocks. If a task requires code execution, "
                         "ask the User to run it and provide output. "
@@ -152,10 +149,14 @@ def create_multi_agents(llm_config):
     )
 
     # Create a GroupChatManager to orchestrate the group chat
+    # The monitor ends the chat early once it converges and records why it stopped
+    monitor = ConvergenceMonitor(done_markers=("TERMINATE",))
     manager = autogen.GroupChatManager(
         groupchat=groupchat,
-        llm_config=llm_config
+        llm_config=llm_config,
+        is_termination_msg=monitor,
     )
+    manager.convergence_monitor = monitor
     return user_proxy, manager
 
 # --- Simulation of Sessions with Human in the Loop ---
@@ -192,6 +193,7 @@ def run_multi_agent_session(session_name, initial_message=None):
     # The chat_history attribute of the chat_result object contains all messages from this conversation
     # (including the loaded history and the new exchanges).
     all_messages = chat_result.chat_history
+    print(f"Chat stopped: {manager.convergence_monitor.result()}")
 
     # Save the updated chat history for the next session
     save_chat_history(all_messages)
@@ -0,0 +1,145 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Speculative Retrieval Prefetch ---
+# /run_workflow used to start searching only once execute_workflow reached its
+# retrieval step, after the workflow manager load, the semantic cache lookup
+# (an embedding round trip) and routing. RetrievalPrefetcher launches the
+# likely searches (every corpus index, for the question and a few query
+# expansions) on a thread pool as soon as the request arrives. They land in a
+# per-request RetrievalPrefetch that the retrieval step reads from, so search
+# latency overlaps with the work before it.
+#
+# A lookup that finds its search prefetched is a hit (it waits for the result
+# if the search is still running); anything else is a miss and runs inline.
+# Only the request that actually executes a run prefetches (the single-flight
+# leader in /run_workflow); requests served from the memo or coalesced onto a
+# running execution launch no searches. When the leader no longer needs its
+# prefetches (retrieval finished or the semantic cache answered), close()
+# cancels the searches that have not started yet. Searches already running
+# cannot be interrupted; they finish and are counted as wasted.
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() in ("1", "true", "yes")
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "8"))
+PREFETCH_EXPANSIONS = int(os.getenv("PREFETCH_EXPANSIONS", "2"))
+EXPANSION_MAX_WORDS = 32
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "has", "have", "how",
+    "i", "in", "is", "it", "of", "on", "or", "please", "that", "the", "this", "to", "under", "was", "we",
+    "what", "when", "where", "which", "who", "why", "will", "with", "you", "your",
+}
+
+
+def expand_query(text, max_expansions=PREFETCH_EXPANSIONS):
+    """
+    Returns alternative search texts for a question: its keywords without stopwords
+    and, for long inputs such as whole documents, their first line.
+    Args:
+        text (str): The user's question or document.
+        max_expansions (int): Maximum number of variants.
+    Returns:
+        list: Search texts different from the input.
+    """
+    variants = []
+    words = re.findall(r"\w+", text)
+    keywords = " ".join([word for word in words if word.lower() not in STOPWORDS][:EXPANSION_MAX_WORDS])
+    if keywords and keywords.lower() != " ".join(words).lower():
+        variants.append(keywords)
+    lines = text.strip().splitlines()
+    if len(text) > 300 and lines and lines[0].strip()[:200] not in variants:
+        variants.append(lines[0].strip()[:200])
+    return variants[:max_expansions]
+
+
+class RetrievalPrefetch:
+    """Per-request cache of speculative searches, keyed by (index, query)."""
+
+    def __init__(self, prefetcher):
+        self._prefetcher = prefetcher
+        self._futures = {}
+        self._used = set()
+        self._closed = False
+
+    def launch(self, key, fn):
+        if key not in self._futures:
+            self._futures[key] = self._prefetcher.submit(fn)
+
+    def get(self, key, fn):
+        """
+        Returns the prefetched result for key, or runs fn() inline on a miss.
+        A prefetch that failed or was cancelled counts as a miss.
+        """
+        future = self._futures.get(key)
+        if future is not None and not future.cancelled():
+            try:
+                result = future.result()
+                self._used.add(key)
+                self._prefetcher.count("hits")
+                return result
+            except Exception as e:
+                print(f"Prefetched search failed ({e}); searching again.")
+        self._prefetcher.count("misses")
+        return fn()
+
+    def close(self):
+        """Cancels the searches that were not used and have not started; safe to call twice."""
+        if self._closed:
+            return
+        self._closed = True
+        for key, future in self._futures.items():
+            if key in self._used:
+                continue
+            self._prefetcher.count("cancelled" if future.cancel() else "wasted")
+
+
+class RetrievalPrefetcher:
+    """
+    Runs speculative searches on a shared pool and keeps hit-rate counters.
+    Args:
+        workers (int): Searches run at once across all requests.
+    """
+
+    def __init__(self, workers=PREFETCH_WORKERS):
+        self._workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        # A pre-forked worker inherits the pool but not its threads: start over in the child
+        os.register_at_fork(after_in_child=self._reset_pool)
+        self.stats = {"requests": 0, "launched": 0, "hits": 0, "misses": 0, "cancelled": 0, "wasted": 0}
+
+    def _reset_pool(self):
+        self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+
+    def submit(self, fn):
+        self.count("launched")
+        return self._pool.submit(fn)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def start(self, plan):
+        """
+        Launches a request's speculative searches.
+        Args:
+            plan (list): (key, fn) pairs, most likely first; fn runs one search.
+        Returns:
+            RetrievalPrefetch: The request's prefetch cache.
+        """
+        self.count("requests")
+        prefetch = RetrievalPrefetch(self)
+        for key, fn in plan:
+            prefetch.launch(key, fn)
+        return prefetch
+
+    def report(self):
+        """Returns the counters plus the hit rate of lookups and the share of prefetches used."""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["used_rate"] = round(stats["hits"] / stats["launched"], 4) if stats["launched"] else 0.0
+        return stats
@@ -0,0 +1,138 @@
+import gc
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+
+from startup import warm_up
+
+# --- Pre-Forked Multi-Worker Server ---
+# app.run() is Flask's single-process development server, so one process (and,
+# with the GIL, about one core) served all traffic. serve() runs the app in
+# SERVER_WORKERS pre-forked worker processes accepting on one shared socket:
+#   - the preload resources (SDK imports, clients, agent templates) are built
+#     once in the parent before forking, and gc.freeze() keeps the collector
+#     from touching them, so the workers share those pages copy-on-write
+#     instead of each importing and building everything again
+#   - every worker runs a threaded WSGI server; the kernel hands each new
+#     connection to whichever worker accepts first
+#   - the parent only supervises: a worker that dies is replaced, and
+#     SIGTERM/SIGINT stop every worker (in-flight requests are not waited for)
+# Preloading must not open network connections or start threads: neither
+# survives a fork in a usable state. Process-wide state that is created early
+# anyway (the HTTP pool, SQLite connections) is reset in each child with
+# os.register_at_fork. Caches and metrics the workers share live in SQLite
+# (see sharedstate.py).
+#
+# SERVER_WORKERS: worker processes, "auto" for one per CPU core; unset or 0
+# keeps the single-process development server.
+
+SERVER_WORKERS = os.getenv("SERVER_WORKERS", "0").strip().lower()
+SERVER_WORKERS = (os.cpu_count() or 1) if SERVER_WORKERS == "auto" else max(0, int(SERVER_WORKERS or 0))
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "256"))
+MIN_WORKER_LIFETIME = 5.0 # A worker dying sooner than this is restarted after RESTART_BACKOFF
+RESTART_BACKOFF = 1.0
+MAX_QUICK_EXITS = 10 # Consecutive quick deaths (e.g. an import error) after which the server gives up
+
+
+def _run_worker(app, listener, host, port, on_worker_start):
+    from werkzeug.serving import make_server
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL) # Not the parent's handler, which would signal the siblings
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C reaches the whole group; the parent stops the workers
+    for hook in on_worker_start:
+        hook()
+    server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+    # shutdown() blocks until serve_forever() returns, so it cannot run on the serving thread
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start())
+    print(f"Worker {os.getpid()} serving on http://{host}:{port}")
+    server.serve_forever()
+
+
+def serve(app, port, preload=(), workers=None, host=SERVER_HOST, on_worker_start=(), on_worker_exit=()):
+    """
+    Serves a Flask app from pre-forked worker processes until SIGTERM or SIGINT.
+    Args:
+        app (Flask): The application.
+        port (int): Port to listen on.
+        preload (list): LazyResource instances to build in the parent before forking.
+        workers (int, optional): Worker processes; defaults to SERVER_WORKERS (at least 1).
+        host (str): Address to bind.
+        on_worker_start (list): Callables run in every worker after the fork (e.g. starting its threads).
+        on_worker_exit (list): Callables run in the parent with the pid of every worker that exited.
+    """
+    workers = workers or SERVER_WORKERS or 1
+    if not hasattr(os, "fork"):
+        print("This platform cannot fork; falling back to a single threaded process.")
+        for hook in on_worker_start:
+            hook()
+        app.run(host=host, port=port, threaded=True)
+        return
+
+    warm_up(preload)
+    # Everything built so far is shared with the workers; keep the GC from writing to those pages
+    gc.collect()
+    gc.freeze()
+
+    listener = socket.create_server((host, port), backlog=SERVER_BACKLOG)
+    listener.set_inheritable(True)
+    children = {} # pid -> start time
+    stopping = False
+    quick_exits = 0
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                _run_worker(app, listener, host, port, on_worker_start)
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                os._exit(status) # Never return into the parent's code
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        if not stopping:
+            print(f"\nStopping {len(children)} workers...")
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Starting {workers} workers on http://{host}:{port} (parent pid {os.getpid()}).")
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None:
+            continue
+        for hook in on_worker_exit:
+            hook(pid)
+        if stopping:
+            continue
+        quick_exits = quick_exits + 1 if time.monotonic() - started < MIN_WORKER_LIFETIME else 0
+        if quick_exits >= MAX_QUICK_EXITS:
+            print("Workers keep exiting right after start; giving up.")
+            stop(None, None)
+            continue
+        print(f"Worker {pid} exited (status {status}); starting a replacement.")
+        if quick_exits:
+            time.sleep(RESTART_BACKOFF)
+        spawn()
+    listener.close()
+    print("All workers stopped.")
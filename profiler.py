@@ -0,0 +1,287 @@
+import hmac
+import html
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+
+# --- On-Demand Profiling ---
+# Opt-in, admin-only profiling of a live Flask process. Nothing is registered
+# unless PROFILING_ADMIN_TOKEN is set, so with the mode off there is no hook
+# and no overhead at all. With it on, a request costs one header lookup unless
+# it asks to be profiled.
+#
+# Two ways to capture a profile (both need the X-Admin-Token header):
+#   - One request: send it with "X-Profile: 1". Only the thread serving that
+#     request is sampled; the response carries an X-Profile-Id header.
+#   - A time window: POST /admin/profile {"seconds": 30} samples every thread
+#     in the process for that long (concurrent requests, background workers).
+#
+# The sampler is statistical: a background thread records the Python stack of
+# the target thread(s) every PROFILE_SAMPLE_INTERVAL seconds, so it measures
+# wall time (time blocked on the network shows up too) at a small fixed cost.
+# tracemalloc runs for the duration of the capture and the allocation growth
+# between its start and end snapshots is reported by source line.
+#
+# Files written to PROFILES_DIR per capture:
+#   <id>.folded     collapsed stacks ("frame;frame;frame count"), for flamegraph.pl / speedscope
+#   <id>.svg        a self-contained flamegraph
+#   <id>.alloc.txt  top allocation growth by line and by traceback
+# Only one capture runs at a time. Subprocess work (warmpool code execution)
+# is not included.
+
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN", "")
+PROFILES_DIR = os.getenv("PROFILES_DIR", "profiles")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+TRACEMALLOC_FRAMES = 16
+ALLOCATION_REPORT_LINES = 30
+
+_capture_lock = threading.Lock() # Held while a capture is running
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Periodically records the Python stacks of selected threads as folded-stack counts.
+    Args:
+        interval (float): Seconds between samples.
+        thread_ids (set, optional): Threads to sample; all threads but the sampler if omitted.
+    """
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL, thread_ids=None):
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling and returns the folded-stack counts."""
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+
+def render_flamegraph(counts, title, width=1200, row_height=16):
+    """
+    Renders folded-stack counts as a standalone SVG flamegraph.
+    Args:
+        counts (Counter): {'a;b;c': samples}.
+        title (str): Heading shown above the graph.
+    Returns:
+        str: SVG document.
+    """
+    root = {"children": {}, "count": 0}
+    for stack, count in counts.items():
+        node = root
+        node["count"] += count
+        for name in stack.split(";"):
+            node = node["children"].setdefault(name, {"children": {}, "count": 0})
+            node["count"] += count
+
+    rects = []
+    depth_max = 0
+
+    def layout(node, x, depth):
+        nonlocal depth_max
+        depth_max = max(depth_max, depth)
+        for name, child in sorted(node["children"].items()):
+            w = child["count"] / root["count"] * width
+            if w >= 0.5:
+                rects.append((name, child["count"], x, depth, w))
+                layout(child, x, depth + 1)
+            x += w
+
+    if root["count"]:
+        layout(root, 0.0, 0)
+    height = (depth_max + 1) * row_height + 40
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+             f'<text x="4" y="16" font-size="14">{html.escape(title)} ({root["count"]} samples)</text>']
+    for name, count, x, depth, w in rects:
+        y = height - (depth + 1) * row_height
+        hue = 20 + (hash(name) % 40)
+        label = html.escape(name[:int(w / 7)]) if w > 21 else ""
+        parts.append(f'<g><title>{html.escape(name)}: {count} samples ({count / root["count"]:.1%})</title>'
+                     f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" fill="hsl({hue},90%,60%)"/>'
+                     f'<text x="{x + 2:.1f}" y="{y + row_height - 4}">{label}</text></g>')
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+def _allocation_report(before, after, title):
+    # Leave out the profiler's own bookkeeping
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    before, after = before.filter_traces(filters), after.filter_traces(filters)
+    lines = [title, "", "Top allocation growth by line:"]
+    for stat in after.compare_to(before, "lineno")[:ALLOCATION_REPORT_LINES]:
+        lines.append(f"  {stat}")
+    lines += ["", "Top allocation growth by traceback:"]
+    for stat in after.compare_to(before, "traceback")[:5]:
+        lines.append(f"  {stat.size_diff / 1024:.1f} KiB in {stat.count_diff} blocks")
+        lines += [f"    {line}" for line in stat.traceback.format()]
+    return "\n".join(lines) + "\n"
+
+
+class ProfileCapture:
+    """
+    One profiling capture: stack sampling plus tracemalloc snapshots.
+    Args:
+        label (str): Describes what was profiled (request path or time window).
+        thread_ids (set, optional): Threads to sample; all threads if omitted.
+        directory (str): Where the report files are written.
+    """
+
+    def __init__(self, label, thread_ids=None, directory=PROFILES_DIR):
+        self.id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.label = label
+        self.directory = directory
+        self._sampler = StackSampler(thread_ids=thread_ids)
+        self._started_tracemalloc = False
+        self._before = None
+        self._started = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        self._before = tracemalloc.take_snapshot()
+        self._started = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self):
+        """
+        Stops the capture and writes its reports.
+        Returns:
+            list: Names of the files written.
+        """
+        counts = self._sampler.stop()
+        seconds = time.perf_counter() - self._started
+        after = tracemalloc.take_snapshot()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        title = f"{self.label} - {seconds:.2f}s, {self._sampler.samples} sampling rounds"
+        os.makedirs(self.directory, exist_ok=True)
+        files = {
+            f"{self.id}.folded": "".join(f"{stack} {count}\n" for stack, count in counts.most_common()),
+            f"{self.id}.svg": render_flamegraph(counts, title),
+            f"{self.id}.alloc.txt": _allocation_report(self._before, after, title),
+        }
+        for name, content in files.items():
+            with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+                f.write(content)
+        print(f"--- Profile {self.id} written: {title} ---")
+        return list(files)
+
+
+def register_profiling(app, admin_token=PROFILING_ADMIN_TOKEN, directory=PROFILES_DIR):
+    """
+    Adds admin-only profiling to a Flask app; does nothing if no admin token is configured.
+    Args:
+        app (Flask): The Flask application.
+        admin_token (str): Secret expected in the X-Admin-Token header.
+        directory (str): Where profiles are written and served from.
+    """
+    if not admin_token:
+        return
+    from flask import request, jsonify, g, send_from_directory
+
+    def authorized():
+        return hmac.compare_digest(request.headers.get("X-Admin-Token", ""), admin_token)
+
+    def finish_request_capture():
+        capture = g.pop("profile_capture", None)
+        if capture is not None:
+            try:
+                return capture, capture.stop()
+            finally:
+                _capture_lock.release()
+        return None, None
+
+    @app.before_request
+    def start_request_capture():
+        if not request.headers.get("X-Profile") or not authorized():
+            return
+        if not _capture_lock.acquire(blocking=False):
+            print("Profiling: a capture is already running; serving the request unprofiled.")
+            return
+        capture = ProfileCapture(f"{request.method} {request.path}", thread_ids={threading.get_ident()}, directory=directory)
+        capture.start()
+        g.profile_capture = capture
+
+    @app.after_request
+    def stop_request_capture(response):
+        capture, _ = finish_request_capture()
+        if capture is not None:
+            response.headers["X-Profile-Id"] = capture.id
+        return response
+
+    @app.teardown_request
+    def cleanup_request_capture(exc):
+        finish_request_capture() # Only still running if the response was never finalized
+
+    @app.route('/admin/profile', methods=['POST'])
+    def profile_window():
+        if not authorized():
+            return jsonify({'error': 'Forbidden'}), 403
+        try:
+            seconds = float((request.get_json(silent=True) or {}).get('seconds', 30))
+        except (TypeError, ValueError):
+            seconds = None
+        if seconds is None or not 0 < seconds <= PROFILE_MAX_SECONDS:
+            return jsonify({'error': f"'seconds' must be between 0 and {PROFILE_MAX_SECONDS}"}), 400
+        if not _capture_lock.acquire(blocking=False):
+            return jsonify({'error': 'A profile capture is already running'}), 409
+        capture = ProfileCapture(f"window of {seconds:g}s", directory=directory)
+        capture.start()
+
+        def finish():
+            try:
+                capture.stop()
+            finally:
+                _capture_lock.release()
+
+        threading.Timer(seconds, finish).start()
+        return jsonify({'profileId': capture.id, 'seconds': seconds,
+                        'files': [f"/admin/profiles/{capture.id}{suffix}" for suffix in (".svg", ".folded", ".alloc.txt")]}), 202
+
+    @app.route('/admin/profiles', methods=['GET'])
+    def list_profiles():
+        if not authorized():
+            return jsonify({'error': 'Forbidden'}), 403
+        names = sorted(os.listdir(directory), reverse=True) if os.path.isdir(directory) else []
+        return jsonify({'profiles': names, 'capturing': _capture_lock.locked()})
+
+    @app.route('/admin/profiles/<path:filename>', methods=['GET'])
+    def get_profile(filename):
+        if not authorized():
+            return jsonify({'error': 'Forbidden'}), 403
+        return send_from_directory(os.path.abspath(directory), filename)
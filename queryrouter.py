@@ -0,0 +1,110 @@
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from embedbatch import local_embed_texts
+
+# --- Local Query Router ---
+# The processor GroupChat always ran both branches (tax rules and court orders),
+# and the manager spent an LLM call per round picking the next speaker, even
+# when a question only concerned one corpus. QueryRouter decides up front, in
+# well under a millisecond and without any network call, which corpora a
+# question needs, so only their retrievals and agent branches run.
+#
+# Two signals are combined per corpus:
+#   - keyword rules: regexes for the vocabulary of each corpus (e.g. "tribunal",
+#     "appeal" for court orders; "notification", "rate" for rules)
+#   - a nearest-centroid vector classifier: the question's embedding is compared
+#     with a centroid built from each corpus' metadata (its description plus
+#     optional sample titles / questions from ROUTER_METADATA_FILE)
+# Every corpus whose keywords the question uses is selected; without keyword
+# hits, corpora whose centroid similarity is within `margin` of the best one
+# are. With no signal at all every corpus is selected, so the router only
+# narrows the workflow when it has evidence.
+#
+# ROUTER_METADATA_FILE (optional JSON): {"rules": ["Sample title", ...], "judgements": [...]}
+
+ROUTER_METADATA_FILE = os.getenv("ROUTER_METADATA_FILE", "")
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", "0.5"))
+KEYWORD_WEIGHT = 0.5 # Score added per matching keyword rule
+MIN_SCORE = 0.25 # Below this for every corpus the question is treated as unrouted
+
+DEFAULT_CORPORA = {
+    "rules": {
+        "description": "Tax rules and compliance provisions: acts, sections, rules, notifications, circulars, "
+                       "tax rates, exemptions, input tax credit, returns, filing deadlines, registration.",
+        "keywords": [r"\bsection\s+\d+", r"\brules?\b", r"\bnotifications?\b", r"\bcirculars?\b", r"\brates?\b",
+                     r"\bexempt(ion|ed)?\b", r"\binput tax credit\b|\bITC\b", r"\breturns?\b", r"\bdue date\b|\bdeadline\b",
+                     r"\bregistration\b", r"\bcompliance\b", r"\bprovisions?\b", r"\bact\b", r"\bschedule\b"],
+    },
+    "judgements": {
+        "description": "Court orders and judgements: rulings of tribunals, high courts and the supreme court, "
+                       "appeals, petitions, advance rulings, case law, precedents, orders against taxpayers.",
+        "keywords": [r"\bcourts?\b", r"\bjudge?ments?\b", r"\btribunals?\b", r"\bappeals?\b|\bappellant\b",
+                     r"\bpetitions?\b|\bpetitioner\b", r"\brulings?\b", r"\bcase law\b|\bprecedents?\b", r"\bbench\b",
+                     r"\bCESTAT\b|\bAAR\b|\bAAAR\b|\bITAT\b", r"\bv(s|ersus)?\.?\s+(union|state|commissioner)\b",
+                     r"\b(held|quashed|dismissed|upheld)\b", r"\borders?\b"],
+    },
+}
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class QueryRouter:
+    """
+    Decides which corpora a question needs, from keyword rules and a centroid classifier.
+    Args:
+        corpora (dict): {name: {'description': str, 'keywords': [regex, ...], 'examples': [str, ...]}}.
+        embed_fn (callable): Takes a list of strings, returns vectors. Defaults to the local hashing embedder.
+        margin (float): Without keyword hits, corpora scoring within this of the best one are selected too.
+        metadata_file (str, optional): JSON of extra example texts per corpus.
+    """
+
+    def __init__(self, corpora=DEFAULT_CORPORA, embed_fn=local_embed_texts, margin=ROUTER_MARGIN,
+                 metadata_file=ROUTER_METADATA_FILE):
+        self.names = list(corpora)
+        self.margin = margin
+        self._embed_fn = embed_fn
+        self._keywords = {name: [re.compile(p, re.IGNORECASE) for p in spec.get("keywords", [])]
+                          for name, spec in corpora.items()}
+        examples = {name: [spec.get("description", name)] + list(spec.get("examples", [])) for name, spec in corpora.items()}
+        if metadata_file and os.path.exists(metadata_file):
+            with open(metadata_file, 'r') as f:
+                for name, texts in json.load(f).items():
+                    if name in examples:
+                        examples[name] += texts
+        self._centroids = _unit([_unit(embed_fn(examples[name])).mean(axis=0) for name in self.names])
+        self._lock = threading.Lock()
+        self.stats = {"routed": 0, **{f"route:{name}": 0 for name in self.names}, "route:all": 0}
+
+    def route(self, question):
+        """
+        Returns the corpora a question needs.
+        Args:
+            question (str): The user's question or document.
+        Returns:
+            dict: {'corpora': [names], 'route': name or 'all', 'scores': {name: score}, 'keyword_hits': {name: n}}.
+        """
+        hits = {name: sum(1 for pattern in patterns if pattern.search(question)) for name, patterns in self._keywords.items()}
+        similarities = self._centroids @ _unit(self._embed_fn([question])[0])
+        scores = {name: round(float(similarities[i]) + KEYWORD_WEIGHT * hits[name], 4) for i, name in enumerate(self.names)}
+        if any(hits.values()):
+            # Explicit vocabulary wins: every corpus the question mentions is needed
+            corpora = [name for name in self.names if hits[name]]
+        elif max(scores.values()) < MIN_SCORE:
+            corpora = list(self.names) # No clear signal: run everything
+        else:
+            corpora = [name for name in self.names if scores[name] >= max(scores.values()) - self.margin]
+        route = corpora[0] if len(corpora) == 1 else "all"
+        with self._lock:
+            self.stats["routed"] += 1
+            self.stats[f"route:{route}"] += 1
+        print(f"Query router: {route} (scores {scores}, keyword hits {hits})")
+        return {"corpora": corpora, "route": route, "scores": scores, "keyword_hits": hits}
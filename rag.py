@@ -1,7 +1,13 @@
+import argparse
 import os
 from openai import AzureOpenAI
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
+from semcache import SemanticCache
+from batchrun import run_batch
+from httppool import shared_http_client, pool_stats
+from embedbatch import EmbeddingBatcher, local_embed_texts, EMBEDDING_BACKEND
+from searchstream import search_documents
 
 # --- Configuration ---
 # IMPORTANT: Replace with your actual Azure OpenAI and Azure AI Search details.
@@ -12,6 +18,7 @@ AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT", "YOUR_AZURE_OPENAI_EN
 AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY", "YOUR_AZURE_OPENAI_API_KEY")
 AZURE_OPENAI_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "YOUR_GPT_MODEL_DEPLOYMENT_NAME") # e.g., "gpt-4" or "gpt-35-turbo"
 AZURE_OPENAI_API_VERSION = "2024-02-01" # Or your specific API version
+AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-ada-002")
 
 # Azure AI Search Configuration
 AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT", "YOUR_AZURE_AI_SEARCH_ENDPOINT")
@@ -24,7 +31,8 @@ try:
     openai_client = AzureOpenAI(
         azure_endpoint=AZURE_OPENAI_ENDPOINT,
         api_key=AZURE_OPENAI_API_KEY,
-        api_version=AZURE_OPENAI_API_VERSION
+        api_version=AZURE_OPENAI_API_VERSION,
+        http_client=shared_http_client(), # Keep-alive pool shared by all threads (see httppool.py)
     )
     print("Azure OpenAI client initialized successfully.")
 
@@ -41,55 +49,64 @@ except Exception as e:
     print("Please ensure your environment variables/configurations are correct.")
     exit()
 
+# --- Semantic Answer Cache ---
+# Returns a stored answer when a close enough question was answered before (see semcache.py)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400")) or None # Seconds; 0 keeps answers until invalidated
+# Bump when index documents are re-ingested in place (the document count alone won't change)
+SEARCH_INDEX_VERSION = os.getenv("SEARCH_INDEX_VERSION", "1")
+
+def _azure_embed_texts(texts):
+    """Embeds a list of strings with the Azure OpenAI embedding deployment."""
+    response = openai_client.embeddings.create(model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT, input=texts)
+    return [item.embedding for item in response.data]
+
+# Batch runs embed many questions at once; batch them into shared calls (see embedbatch.py)
+embed_texts = EmbeddingBatcher(local_embed_texts if EMBEDDING_BACKEND == "local" else _azure_embed_texts)
+
+answer_cache = SemanticCache(
+    embed_texts,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    index_version_fn=lambda: (SEARCH_INDEX_VERSION, search_client.get_document_count()),
+    ttl=SEMANTIC_CACHE_TTL,
+)
+
 # --- RAG Functions ---
 
-def retrieve_documents_from_search(query_text: str, top_n: int = 3):
+def retrieve_documents_from_search(query_text: str, top_n: int = 3, raise_errors: bool = False,
+                                   query_type: str = "simple", content_field: str = "content",
+                                   title_field: str = "title", client=None, verbose: bool = True,
+                                   token_budget: int = None, min_score: float = None):
     """
     Retrieves relevant documents from Azure AI Search based on the query text.
+    Errors are printed and an empty list returned unless raise_errors is set.
+    query_type, content_field, title_field and client (default: the Azure search client)
+    are the knobs compared by retrievaleval.py; verbose=False silences the per-result logging.
+    Results are streamed page by page (see searchstream.py): paging stops at top_n documents,
+    or earlier once token_budget (approximate content tokens) or min_score is reached.
     """
-    print(f"\nSearching Azure AI Search for: '{query_text}'...")
-    try:
-        # Perform a simple search. For more advanced scenarios, consider semantic or vector search.
-        search_results = search_client.search(
-            search_text=query_text,
-            top=top_n,
-            include_total_count=True,
-            query_type="simple" # Can be "semantic", "vector", "full", etc. depending on your index
-            # For semantic search: query_type="semantic", semantic_configuration_name="my-semantic-config"
-            # For vector search: vector_queries=[VectorQuery(vector=embedding_of_query, k_nearest_neighbors=5, fields="contentVector")]
-        )
-
-        documents = []
-        for result in search_results:
-            # --- DEBUGGING STEP: Print the entire result object ---
-            print(f"  --- Full search result document: {result}")
-            # --- END DEBUGGING STEP ---
-
-            # Assuming your documents have a 'content' field and a 'title' or 'id' field
-            # Adjust field names based on your Azure AI Search index schema
-            # IMPORTANT: Check the printed 'result' object above to find the correct field for your document's main content.
-            # It might be 'text', 'main_content', 'description', etc., instead of 'content'.
-            doc_content = result.get('content', 'No content found') # <--- **UPDATE THIS FIELD NAME IF NECESSARY**
-            doc_title = result.get('title', result.get('id', 'Untitled Document')) # <--- UPDATE THIS FIELD NAME IF NECESSARY
-
-            documents.append({
-                "title": doc_title,
-                "content": doc_content,
-                "score": result['@search.score']
-            })
-            print(f"  - Found document: '{doc_title}' (Score: {result['@search.score']:.2f})")
-            if doc_content == 'No content found':
-                print(f"    WARNING: Content for '{doc_title}' was not found. Check your index schema for the correct content field name.")
-        return documents
-
-    except Exception as e:
-        print(f"Error during Azure AI Search retrieval: {e}")
-        return []
-
-def generate_response_with_context(user_query: str, retrieved_docs: list):
+    # Perform a simple search. For more advanced scenarios, consider semantic or vector search.
+    # For semantic search: query_type="semantic", semantic_configuration_name="my-semantic-config"
+    # For vector search: vector_queries=[VectorQuery(vector=embedding_of_query, k_nearest_neighbors=5, fields="contentVector")]
+    # IMPORTANT: Adjust content_field/title_field to your Azure AI Search index schema
+    # (e.g. 'chunk', 'text', 'main_content' instead of 'content').
+    return search_documents(client or search_client, query_text, top_n=top_n, raise_errors=raise_errors,
+                            query_type=query_type, content_field=content_field, title_field=title_field,
+                            verbose=verbose, token_budget=token_budget, min_score=min_score)
+
+def generate_response_with_context(user_query: str, retrieved_docs: list, raise_errors: bool = False):
     """
     Generates a response using Azure OpenAI, augmented with retrieved documents.
+    Errors return an apology message unless raise_errors is set.
     """
+    try:
+        cached = answer_cache.lookup(user_query)
+    except Exception as e:
+        print(f"Semantic cache lookup failed: {e}")
+        cached = None
+    if cached:
+        return cached['answer']
+
     print("\nGenerating response with Azure OpenAI...")
 
     # Construct the system message to guide the LLM
@@ -123,12 +140,31 @@ def generate_response_with_context(user_query: str, retrieved_docs: list):
             temperature=0.7, # Adjust for creativity vs. factualness
             max_tokens=800
         )
-        return chat_completion.choices[0].message.content
+        answer = chat_completion.choices[0].message.content
 
     except Exception as e:
         print(f"Error during Azure OpenAI chat completion: {e}")
+        if raise_errors:
+            raise
         return "An error occurred while generating the response."
 
+    try:
+        answer_cache.store(user_query, answer, [doc['title'] for doc in retrieved_docs])
+    except Exception as e:
+        print(f"Semantic cache store failed: {e}")
+    return answer
+
+def answer_question(question: str):
+    """
+    Runs retrieval and generation for one question; used by the batch runner.
+    Raises on retrieval or generation errors so they are recorded as failures.
+    """
+    retrieved_documents = retrieve_documents_from_search(question, raise_errors=True)
+    return {
+        "answer": generate_response_with_context(question, retrieved_documents, raise_errors=True),
+        "sources": [doc['title'] for doc in retrieved_documents],
+    }
+
 # --- Main Chat Simulation ---
 
 def main():
@@ -138,6 +174,7 @@ def main():
     while True:
         user_input = input("\nYou: ")
         if user_input.lower() in ["exit", "quit"]:
+            print(f"Semantic cache: {answer_cache.report()}")
             print("Exiting chat. Goodbye!")
             break
 
@@ -152,4 +189,20 @@ def main():
         print("-" * 50) # Separator for clarity
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Azure AI RAG chat. Without --batch, starts the interactive chat.")
+    parser.add_argument("--batch", metavar="INPUT_JSONL", help="Answer every question in a JSONL file")
+    parser.add_argument("--output", metavar="OUTPUT_JSONL", help="Results file (default: <input>.answers.jsonl); resumed if it exists")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BATCH_WORKERS", "8")), help="Questions answered concurrently")
+    parser.add_argument("--unordered", action="store_true", help="Write results as they complete instead of in input order")
+    parser.add_argument("--no-resume", action="store_true", help="Overwrite the results file instead of resuming")
+    args = parser.parse_args()
+
+    if args.batch:
+        output = args.output or os.path.splitext(args.batch)[0] + ".answers.jsonl"
+        run_batch(args.batch, output, answer_question, workers=args.workers,
+                  ordered=not args.unordered, resume=not args.no_resume)
+        print(f"Semantic cache: {answer_cache.report()}")
+        print(f"Embeddings: {embed_texts.report()}")
+        print(f"HTTP pool: {pool_stats()}")
+    else:
+        main()
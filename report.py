@@ -0,0 +1,203 @@
+import html
+import os
+import textwrap
+import time
+import uuid
+
+# --- Native Comparison Report Renderer ---
+# Renders structured comparison results to HTML and PDF directly, so the
+# comparator agents no longer have to write report code for user_proxy to run.
+# The PDF writer has no third-party dependencies and streams page by page:
+# each page is written to disk as soon as it is full, so memory use stays flat
+# for large reports.
+#
+# A report is a plain dict:
+#   {
+#       "title": "Tax compliance comparison",
+#       "query": "<the user's input>",
+#       "summary": "<final answer / agent summary>",
+#       "documents": [{"title": "...", "diff": <docdiff.diff_documents() output>}, ...],
+#       "findings": ["<finding not tied to a diff entry>", ...],  (optional)
+#   }
+
+REPORTS_DIR = os.getenv("REPORTS_DIR", "reports")
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842 # A4 in points
+MARGIN = 50
+FONT_SIZES = {"title": 16, "heading": 12, "body": 10, "mono": 9}
+# Approximate characters per line for Helvetica/Courier at the sizes above
+WRAP_WIDTHS = {"title": 55, "heading": 75, "body": 95, "mono": 95}
+
+
+def iter_report_lines(report):
+    """
+    Flattens a report into styled lines shared by the HTML and PDF renderers.
+    Args:
+        report (dict): The structured comparison report.
+    Yields:
+        tuple: (style, text) where style is 'title', 'heading', 'body' or 'mono'.
+    """
+    yield "title", report.get("title", "Comparison Report")
+    yield "body", f"Generated {time.strftime('%Y-%m-%d %H:%M:%S')}"
+    if report.get("query"):
+        yield "heading", "Query"
+        yield "body", report["query"]
+    if report.get("summary"):
+        yield "heading", "Summary"
+        yield "body", report["summary"]
+    if report.get("findings"):
+        yield "heading", "Findings"
+        for finding in report["findings"]:
+            yield "body", finding
+    for document in report.get("documents", []):
+        diff = document.get("diff") or {}
+        differences = diff.get("differences", [])
+        yield "heading", f"Document: {document.get('title', 'Untitled Document')}"
+        yield "body", (f"Similarity {diff.get('similarity', 'n/a')}, "
+                       f"{diff.get('unchanged_clauses', 0)} identical clauses, {len(differences)} differences.")
+        for n, difference in enumerate(differences, 1):
+            yield "body", f"[{difference.get('id', f'D{n}')}] {difference['type']} at {difference['location']}"
+            if difference.get("explanation"):
+                yield "body", difference["explanation"]
+            if difference.get("before"):
+                yield "mono", f"- document:  {difference['before']}"
+            if difference.get("after"):
+                yield "mono", f"+ reference: {difference['after']}"
+
+
+# --- HTML ---
+
+def iter_html(report):
+    """
+    Renders a report as HTML, one chunk at a time (suitable for a streamed response).
+    Args:
+        report (dict): The structured comparison report.
+    Yields:
+        str: HTML fragments.
+    """
+    title = html.escape(report.get("title", "Comparison Report"))
+    yield ("<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<meta charset=\"UTF-8\">\n"
+           f"<title>{title}</title>\n<style>body{{font-family:sans-serif;max-width:900px;margin:20px auto}}"
+           "pre{background:#f4f4f4;padding:6px;white-space:pre-wrap}.del{color:#b91c1c}.ins{color:#15803d}</style>\n"
+           "</head>\n<body>\n")
+    tags = {"title": "h1", "heading": "h2", "body": "p"}
+    for style, text in iter_report_lines(report):
+        escaped = html.escape(text)
+        if style == "mono":
+            css = "del" if text.startswith("-") else "ins"
+            yield f"<pre class=\"{css}\">{escaped}</pre>\n"
+        else:
+            yield f"<{tags[style]}>{escaped}</{tags[style]}>\n"
+    yield "</body>\n</html>\n"
+
+
+def write_html(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in iter_html(report):
+            f.write(chunk)
+    return path
+
+
+# --- PDF ---
+
+def _pdf_escape(text):
+    text = text.encode("latin-1", errors="replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+class StreamingPdfWriter:
+    """
+    Minimal PDF writer that flushes each page to disk as soon as it is complete.
+    Args:
+        path (str): Output file path.
+    """
+
+    # Fixed object numbers; pages and their content streams are numbered from 5
+    CATALOG, PAGES, FONT_REGULAR, FONT_MONO = 1, 2, 3, 4
+
+    def __init__(self, path):
+        self._file = open(path, "wb")
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = 5
+        self._lines = []
+        self._y = PAGE_HEIGHT - MARGIN
+        self._file.write(b"%PDF-1.4\n")
+
+    def _write_object(self, obj_id, body):
+        self._offsets[obj_id] = self._file.tell()
+        self._file.write(f"{obj_id} 0 obj\n".encode("latin-1") + body + b"\nendobj\n")
+
+    def add_line(self, style, text):
+        size = FONT_SIZES[style]
+        leading = size + 4 if style in ("title", "heading") else size + 3
+        for wrapped in textwrap.wrap(text, WRAP_WIDTHS[style]) or [""]:
+            if self._y - leading < MARGIN:
+                self.flush_page()
+            self._y -= leading
+            font = "F2" if style == "mono" else "F1"
+            self._lines.append(f"BT /{font} {size} Tf {MARGIN} {self._y} Td ({_pdf_escape(wrapped)}) Tj ET")
+
+    def flush_page(self):
+        """Writes the current page (content stream + page object) and starts a new one."""
+        if not self._lines:
+            return
+        content = "\n".join(self._lines).encode("latin-1")
+        content_id, page_id = self._next_id, self._next_id + 1
+        self._next_id += 2
+        self._write_object(content_id, b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 {self.FONT_REGULAR} 0 R /F2 {self.FONT_MONO} 0 R >> >> "
+            f"/Contents {content_id} 0 R >>").encode("latin-1"))
+        self._page_ids.append(page_id)
+        self._lines = []
+        self._y = PAGE_HEIGHT - MARGIN
+        self._file.flush()
+
+    def close(self):
+        self.flush_page()
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(self.PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode("latin-1"))
+        self._write_object(self.FONT_REGULAR, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        self._write_object(self.FONT_MONO, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>")
+        self._write_object(self.CATALOG, f"<< /Type /Catalog /Pages {self.PAGES} 0 R >>".encode("latin-1"))
+
+        xref_offset = self._file.tell()
+        size = self._next_id
+        self._file.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode("latin-1"))
+        for obj_id in range(1, size):
+            self._file.write(f"{self._offsets.get(obj_id, 0):010d} 00000 n \n".encode("latin-1"))
+        self._file.write(f"trailer\n<< /Size {size} /Root {self.CATALOG} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("latin-1"))
+        self._file.close()
+
+
+def write_pdf(report, path):
+    writer = StreamingPdfWriter(path)
+    try:
+        for style, text in iter_report_lines(report):
+            writer.add_line(style, text)
+    finally:
+        writer.close()
+    return path
+
+
+def render_report(report, output_dir=REPORTS_DIR, formats=("html", "pdf")):
+    """
+    Renders a report to disk in the requested formats.
+    Args:
+        report (dict): The structured comparison report.
+        output_dir (str): Directory to write the files to.
+        formats (tuple): Any of 'html' and 'pdf'.
+    Returns:
+        dict: {'report_id': ..., 'html': path, 'pdf': path} for the formats rendered.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    report_id = uuid.uuid4().hex[:12]
+    paths = {"report_id": report_id}
+    if "html" in formats:
+        paths["html"] = write_html(report, os.path.join(output_dir, f"report_{report_id}.html"))
+    if "pdf" in formats:
+        paths["pdf"] = write_pdf(report, os.path.join(output_dir, f"report_{report_id}.pdf"))
+    print(f"Report {report_id} written to {output_dir}.")
+    return paths
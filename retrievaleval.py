@@ -0,0 +1,244 @@
+import argparse
+import json
+import math
+import os
+import re
+import statistics
+import time
+from collections import Counter
+
+from contextview import estimate_tokens
+from searchstream import search_documents
+
+# --- Offline Retrieval Evaluation ---
+# Measures what a retrieval setting (top_n, query_type, content field) does to
+# both quality and cost, so retrieval can be tuned for speed without quietly
+# losing accuracy. Each configuration runs the labelled query set through
+# searchstream.search_documents (the production code path behind
+# rag.retrieve_documents_from_search) against either the real Azure AI Search
+# index or LocalSearchIndex, an in-process BM25 stand-in built from a JSONL
+# corpus. Only the former imports rag.py and needs Azure credentials.
+#
+# Per configuration it reports recall@k, MRR and nDCG@k (graded relevance),
+# per-query latency (mean / p50 / p95) and the context tokens the retrieved
+# documents would add to the prompt, and writes one JSON report per
+# configuration plus a side-by-side comparison table.
+#
+# Labelled queries (JSONL): {"id": "q1", "query": "...", "relevant": ["Doc title", ...]}
+#   or graded: {"relevant": {"Doc title": 3, "Other title": 1}}
+# Corpus for the local index (JSONL): {"title": "...", "content": "...", ...any other fields}
+# Configurations (JSON list): [{"name": "top3", "top_n": 3, "query_type": "simple", "content_field": "content"}, ...]
+#
+#   python retrievaleval.py --queries labelled.jsonl --corpus corpus.jsonl --configs configs.json
+#   python retrievaleval.py --queries labelled.jsonl --configs configs.json   # against the real index
+
+EVAL_REPORTS_DIR = os.getenv("EVAL_REPORTS_DIR", "eval_reports")
+DEFAULT_CONFIGS = [{"name": "default", "top_n": 3, "query_type": "simple", "content_field": "content"}]
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def _tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower()) if isinstance(text, str) else []
+
+
+class LocalSearchIndex:
+    """
+    In-process BM25 index with the subset of the SearchClient.search() interface rag.py uses.
+    Every query_type is served as a keyword search.
+    Args:
+        documents (list): Dicts with the index fields (e.g. 'title', 'content').
+        search_fields (tuple): Fields that are tokenized and scored.
+        k1 (float): BM25 term-frequency saturation.
+        b (float): BM25 length normalization.
+    """
+
+    def __init__(self, documents, search_fields=("title", "content"), k1=1.2, b=0.75):
+        self.documents = list(documents)
+        self.k1 = k1
+        self.b = b
+        self._term_freqs = []
+        self._lengths = []
+        document_freqs = Counter()
+        for doc in self.documents:
+            tokens = [token for field in search_fields for token in _tokenize(doc.get(field))]
+            term_freqs = Counter(tokens)
+            self._term_freqs.append(term_freqs)
+            self._lengths.append(len(tokens))
+            document_freqs.update(term_freqs.keys())
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        n = len(self.documents)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_freqs.items()}
+
+    @classmethod
+    def from_jsonl(cls, path, **kwargs):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls([json.loads(line) for line in f if line.strip()], **kwargs)
+
+    def search(self, search_text, top=50, skip=0, **kwargs):
+        terms = [term for term in set(_tokenize(search_text)) if term in self._idf]
+        scored = []
+        for i, term_freqs in enumerate(self._term_freqs):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / (self._avg_length or 1))
+            for term in terms:
+                tf = term_freqs.get(term)
+                if tf:
+                    score += self._idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                scored.append((score, i))
+        scored.sort(reverse=True)
+        return [dict(self.documents[i], **{"@search.score": score}) for score, i in scored[skip:skip + top]]
+
+    def get_document_count(self):
+        return len(self.documents)
+
+
+# --- Metrics ---
+
+def _grades(relevant):
+    """Normalizes a 'relevant' label (list of titles or {title: grade}) to {title: grade}."""
+    if isinstance(relevant, dict):
+        return {title: float(grade) for title, grade in relevant.items() if grade}
+    return {title: 1.0 for title in relevant}
+
+
+def recall_at_k(retrieved, grades, k):
+    if not grades:
+        return 0.0
+    return len(set(retrieved[:k]) & grades.keys()) / len(grades)
+
+
+def reciprocal_rank(retrieved, grades):
+    for rank, title in enumerate(retrieved, start=1):
+        if title in grades:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(retrieved, grades, k):
+    # Each relevant document counts once, at its best rank
+    seen = set()
+    dcg = 0.0
+    for rank, title in enumerate(retrieved[:k], start=1):
+        if title in grades and title not in seen:
+            seen.add(title)
+            dcg += (2 ** grades[title] - 1) / math.log2(rank + 1)
+    ideal = sorted(grades.values(), reverse=True)[:k]
+    idcg = sum((2 ** grade - 1) / math.log2(rank + 1) for rank, grade in enumerate(ideal, start=1))
+    return dcg / idcg if idcg else 0.0
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+# --- Evaluation ---
+
+def load_labelled_queries(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        queries = [json.loads(line) for line in f if line.strip()]
+    for i, query in enumerate(queries, start=1):
+        query.setdefault("id", str(i))
+    return queries
+
+
+def evaluate_config(queries, config, client=None, ks=(1, 3, 5, 10)):
+    """
+    Runs one retrieval configuration over a labelled query set.
+    Args:
+        queries (list): Labelled queries ({'id', 'query', 'relevant'}).
+        config (dict): 'name', plus retrieve_documents_from_search settings: 'top_n', 'query_type', 'content_field', 'title_field'.
+        client (object, optional): A LocalSearchIndex; the Azure search client is used if omitted.
+        ks (tuple): Cutoffs for recall@k and nDCG@k (limited to top_n).
+    Returns:
+        dict: {'config', 'summary', 'queries'} with aggregate and per-query results.
+    """
+    if client is None:
+        from rag import search_client # Builds the Azure clients; not needed for a local index
+        client = search_client
+
+    top_n = config.get("top_n", 3)
+    ks = sorted({k for k in ks if k <= top_n} | {top_n})
+    per_query = []
+    for i, query in enumerate(queries, start=1):
+        grades = _grades(query.get("relevant", []))
+        started = time.perf_counter()
+        documents = search_documents(
+            client, query["query"], top_n=top_n, raise_errors=True, verbose=False,
+            query_type=config.get("query_type", "simple"),
+            content_field=config.get("content_field", "content"),
+            title_field=config.get("title_field", "title"),
+        )
+        latency_ms = (time.perf_counter() - started) * 1000
+        retrieved = [doc["title"] for doc in documents]
+        result = {
+            "id": query.get("id", str(i)),
+            "query": query["query"],
+            "retrieved": retrieved,
+            "latency_ms": round(latency_ms, 2),
+            "context_tokens": estimate_tokens([{"content": doc["content"]} for doc in documents]),
+            "mrr": reciprocal_rank(retrieved, grades),
+        }
+        for k in ks:
+            result[f"recall@{k}"] = recall_at_k(retrieved, grades, k)
+            result[f"ndcg@{k}"] = ndcg_at_k(retrieved, grades, k)
+        per_query.append(result)
+
+    latencies = [r["latency_ms"] for r in per_query]
+    summary = {"queries": len(per_query)}
+    if per_query:
+        for metric in ["mrr"] + [f"{m}@{k}" for k in ks for m in ("recall", "ndcg")]:
+            summary[metric] = round(statistics.mean(r[metric] for r in per_query), 4)
+        summary.update({
+            "latency_ms_mean": round(statistics.mean(latencies), 2),
+            "latency_ms_p50": round(_percentile(latencies, 0.5), 2),
+            "latency_ms_p95": round(_percentile(latencies, 0.95), 2),
+            "context_tokens_mean": round(statistics.mean(r["context_tokens"] for r in per_query), 1),
+        })
+    return {"config": config, "summary": summary, "queries": per_query}
+
+
+def write_reports(results, directory=EVAL_REPORTS_DIR):
+    """
+    Writes one JSON report per configuration and a comparison table (Markdown and JSON).
+    Returns:
+        str: Path of the comparison table.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for result in results:
+        with open(os.path.join(directory, f"{result['config']['name']}.json"), 'w') as f:
+            json.dump(result, f, indent=2)
+
+    columns = []
+    for result in results:
+        columns += [column for column in result["summary"] if column not in columns]
+    lines = ["| config | " + " | ".join(columns) + " |", "|---" * (len(columns) + 1) + "|"]
+    for result in results:
+        lines.append(f"| {result['config']['name']} | " +
+                     " | ".join(str(result["summary"].get(column, "")) for column in columns) + " |")
+    with open(os.path.join(directory, "comparison.json"), 'w') as f:
+        json.dump([{"config": r["config"], "summary": r["summary"]} for r in results], f, indent=2)
+    path = os.path.join(directory, "comparison.md")
+    with open(path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    print("\n".join(lines))
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare retrieval configurations on a labelled query set.")
+    parser.add_argument("--queries", required=True, help="Labelled queries JSONL")
+    parser.add_argument("--corpus", help="Corpus JSONL for the local BM25 index (default: the real Azure AI Search index)")
+    parser.add_argument("--configs", help="JSON file with a list of configurations")
+    parser.add_argument("--out", default=EVAL_REPORTS_DIR, help="Report directory")
+    args = parser.parse_args()
+
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, 'r') as f:
+            configs = json.load(f)
+    client = LocalSearchIndex.from_jsonl(args.corpus) if args.corpus else None
+    queries = load_labelled_queries(args.queries)
+    results = [evaluate_config(queries, config, client=client) for config in configs]
+    print(f"Reports written to {write_reports(results, args.out)}")
@@ -0,0 +1,173 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --- Crash-Safe GroupChat Checkpoints ---
+# A long processor run that dies at round 10 used to be redone from scratch,
+# LLM calls included. RunCheckpointStore keeps, per run, the retrieval-stage
+# context (retrieved documents / tool results and the built prompt) and one row
+# per completed GroupChat round (message, speaker, speaker index) in a local
+# SQLite database. Each round is committed as soon as the manager appends it.
+#
+# A retried run with the same run id (the coalescing key: normalized input +
+# workflow version) skips retrieval, restores the completed rounds into the
+# agents from the checkpoint instead of asking the LLM again, and continues
+# from the last completed round. Checkpoints are deleted when a run completes
+# and ignored once older than CHECKPOINT_MAX_AGE.
+#
+# Pre-forked workers (see prefork.py) share the database, so a run is claimed
+# by the process executing it: a second worker handed the same input while the
+# first is still running gets no claim and runs without checkpoints instead of
+# writing and deleting the same rounds. A claim held by a process that no
+# longer exists is taken over, so a crashed run can still be resumed.
+
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.db")
+CHECKPOINT_MAX_AGE = float(os.getenv("CHECKPOINT_MAX_AGE", str(24 * 3600)))
+
+
+class RunCheckpointStore:
+    """
+    SQLite-backed store of per-round run checkpoints.
+    Args:
+        path (str): Database file.
+        max_age (float): Seconds after which an unfinished checkpoint is discarded.
+    """
+
+    def __init__(self, path=CHECKPOINT_DB, max_age=CHECKPOINT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._local = threading.local()
+        os.register_at_fork(after_in_child=self._forget_connections) # Pre-forked workers open their own
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, context TEXT, updated_at REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS rounds (run_id TEXT, round INTEGER, speaker TEXT, "
+                       "speaker_index INTEGER, message TEXT, PRIMARY KEY (run_id, round))")
+            db.execute("CREATE TABLE IF NOT EXISTS claims (run_id TEXT PRIMARY KEY, pid INTEGER)")
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    def _connect(self):
+        # One connection per thread; WAL keeps writers from blocking readers
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def load(self, run_id):
+        """
+        Returns the checkpoint of an unfinished run, or None.
+        Returns:
+            dict or None: {'context': dict, 'messages': [message, ...]} in round order.
+        """
+        db = self._connect()
+        row = db.execute("SELECT context, updated_at FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[1] > self.max_age:
+            self.delete(run_id)
+            return None
+        messages = [json.loads(message) for (message,) in
+                    db.execute("SELECT message FROM rounds WHERE run_id = ? ORDER BY round", (run_id,))]
+        return {"context": json.loads(row[0]) if row[0] else None, "messages": messages}
+
+    def save_context(self, run_id, context):
+        """Checkpoints the retrieval stage (documents, prompt) of a run."""
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO runs (run_id, context, updated_at) VALUES (?, ?, ?)",
+                       (run_id, json.dumps(context, default=str), time.time()))
+
+    def save_round(self, run_id, round_number, speaker, speaker_index, message):
+        """Durably records one completed round."""
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO rounds (run_id, round, speaker, speaker_index, message) VALUES (?, ?, ?, ?, ?)",
+                       (run_id, round_number, speaker, speaker_index, json.dumps(message, default=str)))
+            db.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (time.time(), run_id))
+
+    def delete(self, run_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM rounds WHERE run_id = ?", (run_id,))
+            db.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+    def claim(self, run_id):
+        """
+        Marks a run as executed by this process.
+        Returns:
+            bool: False if another live process is executing the run; the caller must not checkpoint it.
+        """
+        pid = os.getpid()
+        db = self._connect()
+        with db:
+            db.execute("BEGIN IMMEDIATE") # Check and take the claim atomically
+            row = db.execute("SELECT pid FROM claims WHERE run_id = ?", (run_id,)).fetchone()
+            if row and row[0] != pid and _process_alive(row[0]):
+                return False
+            db.execute("INSERT OR REPLACE INTO claims (run_id, pid) VALUES (?, ?)", (run_id, pid))
+        return True
+
+    def release(self, run_id):
+        """Drops this process' claim on a run."""
+        with self._connect() as db:
+            db.execute("DELETE FROM claims WHERE run_id = ? AND pid = ?", (run_id, os.getpid()))
+
+
+def _process_alive(pid):
+    if not hasattr(os, "fork"):
+        return False # Single-process platforms: a claim by another pid is from an earlier server
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RoundRecorder:
+    """
+    Hooks a GroupChat so every appended message is checkpointed for the current run.
+    Args:
+        store (RunCheckpointStore): Where rounds are written.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.run_id = None
+
+    def attach(self, groupchat):
+        original_append = groupchat.append
+
+        def append(message, speaker):
+            original_append(message, speaker)
+            if self.run_id is not None:
+                round_number = len(groupchat.messages) - 1
+                speaker_index = groupchat.agent_names.index(speaker.name) if speaker.name in groupchat.agent_names else -1
+                self.store.save_round(self.run_id, round_number, speaker.name, speaker_index, groupchat.messages[-1])
+
+        groupchat.append = append
+
+
+def resume_groupchat(manager, messages):
+    """
+    Restores checkpointed rounds into a GroupChatManager without calling the LLM.
+    Args:
+        manager (GroupChatManager): The manager to restore into.
+        messages (list): Checkpointed messages in round order.
+    Returns:
+        tuple: (agent, message) to continue the chat with: agent.initiate_chat(manager, message=message, clear_history=False)
+    """
+    # Drop whatever an interrupted run left in memory, or the restored rounds are appended to it
+    manager.groupchat.messages = []
+    for agent in [manager] + manager.groupchat.agents:
+        if hasattr(agent, "clear_history"):
+            agent.clear_history()
+    if hasattr(manager, "resume"):
+        return manager.resume(messages=messages, silent=True)
+    # Older autogen: restore the shared history and replay the last round's message
+    manager.groupchat.messages = list(messages[:-1])
+    last = messages[-1]
+    return manager.groupchat.agent_by_name(last["name"]), last
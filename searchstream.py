@@ -0,0 +1,143 @@
+import os
+
+from contextview import CHARS_PER_TOKEN
+
+# --- Streaming Search Retrieval ---
+# retrieve_documents_from_search read every result of a search before
+# returning, and fetch_data_ai_search read the service's whole default result
+# set, although a prompt only has room for so many tokens. iter_search_results
+# is a generator that requests results one page (top=page_size, skip=offset)
+# at a time, only when the consumer asks for a result past the current page.
+# take_within_budget consumes it and stops as soon as
+#   - the next document would exceed the token budget (contextview's estimate)
+#   - the score drops below min_score, or below min_relative_score x the best score
+#   - max_documents documents were taken
+# Closing the generator there means later pages are never requested, so
+# large-recall searches stop paying for results that would not reach the prompt.
+#
+# Results arrive in score order (reranker score for semantic queries), so a
+# cutoff on the score ends the useful part of the result list.
+#
+# search_documents combines the two with rag.py's logging and error handling.
+# It takes the client as an argument and imports no Azure SDK, so the offline
+# retrieval evaluation (retrievaleval.py) runs it against a local index.
+
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+MAX_SKIP = 100000 # Azure AI Search rejects larger skip values
+
+
+def _score(result):
+    score = result.get("@search.reranker_score")
+    return score if score is not None else result.get("@search.score", 0.0)
+
+
+def iter_search_results(client, query_text, page_size=SEARCH_PAGE_SIZE, max_results=None, query_type="simple",
+                        content_field="content", title_field="title", **search_kwargs):
+    """
+    Yields search results as documents, requesting the next page only when it is needed.
+    Args:
+        client (SearchClient): Azure AI Search client (or anything with the same search() signature).
+        query_text (str): The search text.
+        page_size (int): Results per search request.
+        max_results (int, optional): Stop after this many results; None pages until the results run out.
+        query_type (str): 'simple', 'full' or 'semantic'.
+        content_field (str): Index field holding the document text.
+        title_field (str): Index field holding the document title.
+        **search_kwargs: Passed through to client.search() (e.g. semantic_configuration_name, select).
+    Yields:
+        dict: {'title', 'content', 'score'} in the order the service ranks them.
+    """
+    offset = 0
+    while (max_results is None or offset < max_results) and offset <= MAX_SKIP:
+        top = page_size if max_results is None else min(page_size, max_results - offset)
+        received = 0
+        for result in client.search(search_text=query_text, top=top, skip=offset, query_type=query_type, **search_kwargs):
+            received += 1
+            yield {
+                "title": result.get(title_field, result.get("id", "Untitled Document")),
+                "content": result.get(content_field, "No content found"),
+                "score": _score(result),
+            }
+        if received < top: # Last page
+            return
+        offset += received
+
+
+def take_within_budget(documents, token_budget=None, min_score=None, min_relative_score=None, max_documents=None):
+    """
+    Takes documents from a (lazy) result stream until a budget or score cutoff is reached,
+    then closes the stream so no further pages are requested. The first document is
+    always taken, even if it alone exceeds the token budget.
+    Args:
+        documents (iterator): Documents from iter_search_results(), best first.
+        token_budget (int, optional): Approximate tokens of content allowed in total.
+        min_score (float, optional): Absolute score cutoff.
+        min_relative_score (float, optional): Cutoff as a fraction (0-1) of the best document's score.
+        max_documents (int, optional): Maximum number of documents.
+    Returns:
+        tuple: (documents taken, stop reason: 'exhausted', 'max_documents', 'token_budget' or 'score_cutoff').
+    """
+    taken, used, best, reason = [], 0, None, "exhausted"
+    try:
+        for document in documents:
+            score = document["score"]
+            best = score if best is None else best
+            if (min_score is not None and score < min_score) or \
+                    (min_relative_score is not None and best > 0 and score < best * min_relative_score):
+                reason = "score_cutoff"
+                break
+            tokens = len(document["content"]) // CHARS_PER_TOKEN if isinstance(document["content"], str) else 0
+            if token_budget is not None and taken and used + tokens > token_budget:
+                reason = "token_budget"
+                break
+            taken.append(document)
+            used += tokens
+            if max_documents is not None and len(taken) >= max_documents:
+                reason = "max_documents"
+                break
+    finally:
+        if hasattr(documents, "close"):
+            documents.close()
+    return taken, reason
+
+
+def search_documents(client, query_text, top_n=3, raise_errors=False, query_type="simple", content_field="content",
+                     title_field="title", verbose=True, token_budget=None, min_score=None):
+    """
+    Retrieves up to top_n documents for a query, stopping early at the token budget or score cutoff.
+    Errors are printed and an empty list returned unless raise_errors is set.
+    Args:
+        client (SearchClient): Azure AI Search client, or a local index with the same search() signature.
+        query_text (str): The search text.
+        top_n (int): Maximum number of documents.
+        raise_errors (bool): Re-raise search errors instead of returning [].
+        query_type (str): 'simple', 'full' or 'semantic'.
+        content_field (str): Index field holding the document text.
+        title_field (str): Index field holding the document title.
+        verbose (bool): Print the query and every document found.
+        token_budget (int, optional): Approximate tokens of content allowed in total.
+        min_score (float, optional): Absolute score cutoff.
+    Returns:
+        list: {'title', 'content', 'score'} documents, best first.
+    """
+    if verbose:
+        print(f"\nSearching Azure AI Search for: '{query_text}'...")
+    try:
+        results = iter_search_results(client, query_text, max_results=top_n, query_type=query_type,
+                                      content_field=content_field, title_field=title_field)
+        documents, stop_reason = take_within_budget(results, token_budget=token_budget, min_score=min_score,
+                                                    max_documents=top_n)
+        if verbose:
+            for doc in documents:
+                print(f"  - Found document: '{doc['title']}' (Score: {doc['score']:.2f})")
+                if doc['content'] == 'No content found':
+                    print(f"    WARNING: Content for '{doc['title']}' was not found. Check your index schema for the correct content field name.")
+            if stop_reason in ("token_budget", "score_cutoff"):
+                print(f"  Stopped reading results after {len(documents)} documents ({stop_reason}).")
+        return documents
+
+    except Exception as e:
+        print(f"Error during Azure AI Search retrieval: {e}")
+        if raise_errors:
+            raise
+        return []
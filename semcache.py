@@ -0,0 +1,228 @@
+import base64
+import hashlib
+import threading
+import time
+import uuid
+
+import numpy as np
+
+# --- Semantic Answer Cache ---
+# Users ask the same tax questions in many phrasings, so an exact-match cache
+# misses most repeats. This cache is keyed on query embeddings: a lookup embeds
+# the query, finds the nearest stored query by cosine similarity in a local
+# NumPy index, and returns the stored final answer (with its source document
+# titles) if the similarity clears the threshold.
+#
+# The index is a dense matrix of unit vectors searched with one matrix-vector
+# product, which is exact and fast for the few thousand entries a process
+# holds; entries beyond max_entries are evicted oldest first.
+#
+# Invalidation: every entry records the titles of the documents its answer came
+# from. invalidate_sources() drops entries that used changed documents, and an
+# optional index_version_fn (e.g. document count + a deploy-time version) is
+# polled so any change to the search index clears the whole cache. With a ttl,
+# answers also expire that many seconds after they were stored, so answers to
+# questions whose documents changed without notice do not live forever.
+#
+# With a shared_store (sharedstate.SharedStore, used when several worker
+# processes serve the app) answers are written to SQLite and every worker pulls
+# the entries stored since its last lookup into its local index, so an answer
+# computed by one worker is a hit on all of them. Invalidations delete the
+# shared entries and change a generation token, which makes every worker
+# reload its index.
+
+# Truncate long inputs (e.g. whole documents) before embedding
+EMBED_MAX_CHARS = 8000
+SHARED_NAMESPACE = "semantic_cache"
+
+
+class SemanticCache:
+    """
+    Answer cache keyed on query embeddings.
+    Args:
+        embed_fn (callable): Takes a list of strings, returns a list of equal-length vectors.
+        threshold (float): Minimum cosine similarity for a hit.
+        max_entries (int): Maximum number of cached answers.
+        index_version_fn (callable, optional): Returns a token that changes when the index changes.
+        version_check_interval (float): Seconds between index version checks.
+        shared_store (SharedStore, optional): Shares the cached answers with other worker processes.
+        ttl (float, optional): Seconds an answer stays cached; None keeps it until invalidated or evicted.
+    """
+
+    def __init__(self, embed_fn, threshold=0.95, max_entries=5000, index_version_fn=None, version_check_interval=60.0,
+                 shared_store=None, ttl=None):
+        self._embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._index_version_fn = index_version_fn
+        self._version_check_interval = version_check_interval
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._entries = []
+        self._last_embedded = (None, None) # store() right after a missed lookup reuses the vector
+        self._index_version = None
+        self._version_checked_at = 0.0
+        self._shared = shared_store
+        self._synced_rowid = 0
+        self._generation = None
+        self.stats = {"lookups": 0, "hits": 0, "stores": 0, "invalidations": 0}
+
+    def _embed(self, text):
+        last_text, last_vector = self._last_embedded
+        if text == last_text:
+            return last_vector
+        vector = np.asarray(self._embed_fn([text[:EMBED_MAX_CHARS]])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+        self._last_embedded = (text, vector)
+        return vector
+
+    def _check_index_version(self):
+        if self._index_version_fn is None or time.monotonic() - self._version_checked_at < self._version_check_interval:
+            return
+        self._version_checked_at = time.monotonic()
+        try:
+            version = self._index_version_fn()
+        except Exception as e:
+            print(f"Semantic cache: could not read index version: {e}")
+            return
+        if self._index_version is not None and version != self._index_version:
+            print("Semantic cache: search index changed, clearing cached answers.")
+            self.clear()
+        self._index_version = version
+
+    def lookup(self, query):
+        """
+        Returns the cached answer for the closest stored query, if close enough.
+        Args:
+            query (str): The user's question.
+        Returns:
+            dict or None: {'answer', 'sources', 'similarity', 'query'} on a hit.
+        """
+        self._check_index_version()
+        self._sync()
+        vector = self._embed(query)
+        with self._lock:
+            self.stats["lookups"] += 1
+            self._expire()
+            if self._vectors is None or not self._entries:
+                return None
+            similarities = self._vectors @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                return None
+            self.stats["hits"] += 1
+            entry = self._entries[best]
+        print(f"Semantic cache hit (similarity {similarity:.3f}) for: '{query[:80]}'")
+        return dict(entry, similarity=round(similarity, 4))
+
+    def store(self, query, answer, sources):
+        """
+        Caches a final answer.
+        Args:
+            query (str): The user's question.
+            answer (str): The final answer.
+            sources (list): Titles of the documents the answer was based on.
+        """
+        vector = self._embed(query)
+        entry = {"query": query, "answer": answer, "sources": list(sources), "stored_at": time.time()}
+        if self._shared is not None:
+            encoded = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+            key = hashlib.sha256(query.encode("utf-8")).hexdigest()
+            self._shared.set(SHARED_NAMESPACE, key, dict(entry, vector=encoded), ttl=self.ttl)
+            self._shared.trim(SHARED_NAMESPACE, self.max_entries)
+            with self._lock:
+                self.stats["stores"] += 1
+            self._sync() # Picks up this entry together with any other worker's
+            return
+        with self._lock:
+            self._append(entry, vector)
+            self.stats["stores"] += 1
+
+    def _append(self, entry, vector):
+        # Caller holds self._lock
+        self._entries.append(entry)
+        self._vectors = vector[None, :] if self._vectors is None else np.vstack([self._vectors, vector])
+        if len(self._entries) > self.max_entries:
+            overflow = len(self._entries) - self.max_entries
+            self._entries = self._entries[overflow:]
+            self._vectors = self._vectors[overflow:]
+
+    def _expire(self):
+        # Caller holds self._lock. Entries are in the order they were stored, so expired ones are a prefix
+        if self.ttl is None:
+            return
+        cutoff = time.time() - self.ttl
+        expired = 0
+        while expired < len(self._entries) and self._entries[expired].get("stored_at", 0) <= cutoff:
+            expired += 1
+        if expired:
+            self._entries = self._entries[expired:]
+            self._vectors = self._vectors[expired:] if self._entries else None
+
+    def _sync(self):
+        """Adds the entries stored by any worker since the last sync; reloads everything after an invalidation."""
+        if self._shared is None:
+            return
+        generation = self._shared.get(SHARED_NAMESPACE + ":meta", "generation")
+        with self._lock:
+            if generation != self._generation:
+                self._entries, self._vectors, self._synced_rowid = [], None, 0
+                self._generation = generation
+            after = self._synced_rowid
+        rows = self._shared.items(SHARED_NAMESPACE, after=after)
+        with self._lock:
+            for rowid, _, stored in rows:
+                if rowid <= self._synced_rowid: # Another thread synced it meanwhile
+                    continue
+                self._synced_rowid = rowid
+                vector = np.frombuffer(base64.b64decode(stored.pop("vector")), dtype=np.float32)
+                self._append(stored, vector)
+
+    def _invalidate_shared(self, titles=None):
+        """Deletes shared entries (those based on any of the titles, or all) and makes every worker reload."""
+        if titles is None:
+            removed = self._shared.delete(SHARED_NAMESPACE)
+        else:
+            removed = sum(self._shared.delete(SHARED_NAMESPACE, key) for _, key, stored in self._shared.items(SHARED_NAMESPACE)
+                          if titles.intersection(stored["sources"]))
+        self._shared.set(SHARED_NAMESPACE + ":meta", "generation", uuid.uuid4().hex)
+        with self._lock:
+            self.stats["invalidations"] += removed
+        self._sync()
+        return removed
+
+    def invalidate_sources(self, titles):
+        """
+        Drops every cached answer that was based on any of the given documents.
+        Returns:
+            int: Number of entries removed.
+        """
+        titles = set(titles)
+        if self._shared is not None:
+            return self._invalidate_shared(titles)
+        with self._lock:
+            keep = [i for i, entry in enumerate(self._entries) if not titles.intersection(entry["sources"])]
+            removed = len(self._entries) - len(keep)
+            self._entries = [self._entries[i] for i in keep]
+            self._vectors = self._vectors[keep] if keep else None
+            self.stats["invalidations"] += removed
+        return removed
+
+    def clear(self):
+        if self._shared is not None:
+            self._invalidate_shared()
+            return
+        with self._lock:
+            self.stats["invalidations"] += len(self._entries)
+            self._entries = []
+            self._vectors = None
+
+    def report(self):
+        """Returns the cache counters plus size and hit rate."""
+        with self._lock:
+            stats = dict(self.stats, entries=len(self._entries))
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+        return stats
@@ -0,0 +1,206 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --- Cross-Worker Shared State ---
+# In the pre-forked serving mode (see prefork.py) every worker is a separate
+# process, so in-memory caches and stats counters would each see only part of
+# the traffic. SharedStore is a small SQLite database (WAL mode, one connection
+# per thread and process) that all workers on a node share:
+#   - a key/value table with optional expiry (memoized workflow results, the
+#     semantic answer cache entries)
+#   - per-worker metric snapshots: SharedMetrics publishes each worker's stats
+#     dicts every METRICS_PUBLISH_INTERVAL seconds (and whenever stats are
+#     requested), and reports the totals over all live workers
+# Without a store (single-process dev server) SharedMetrics reports the local
+# stats unchanged.
+#
+# When totals are built, counters are summed, rates, means and durations (keys
+# ending in _rate or _seconds, or starting with mean_) are averaged over the
+# workers, and peaks and limits (peak_*, max_*, cost) take the maximum. A
+# worker that exits has its snapshot removed, so a replacement worker's
+# counters start from zero.
+
+SHARED_STATE_DB = os.getenv("SHARED_STATE_DB", "shared_state.db")
+METRICS_PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_INTERVAL", "5"))
+
+
+class SharedStore:
+    """
+    SQLite-backed key/value and metrics store shared by the worker processes of one node.
+    Args:
+        path (str): Database file.
+    """
+
+    def __init__(self, path=SHARED_STATE_DB):
+        self.path = path
+        self._local = threading.local()
+        # Connections inherited through fork() must not be used by the child
+        os.register_at_fork(after_in_child=self._forget_connections)
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS kv (namespace TEXT, key TEXT, value TEXT, expires_at REAL, "
+                       "PRIMARY KEY (namespace, key))")
+            db.execute("CREATE TABLE IF NOT EXISTS metrics (worker INTEGER, name TEXT, value TEXT, updated_at REAL, "
+                       "PRIMARY KEY (worker, name))")
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    def _connect(self):
+        # One connection per thread; WAL keeps writers from blocking readers
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def get(self, namespace, key):
+        """Returns the value stored under (namespace, key), or None if missing or expired."""
+        row = self._connect().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace, key, value, ttl=None):
+        """
+        Stores a JSON-serializable value.
+        Args:
+            ttl (float, optional): Seconds until the value expires; None keeps it until deleted.
+        Raises:
+            TypeError: If the value is not JSON-serializable.
+        """
+        payload = json.dumps(value)
+        with self._connect() as db:
+            # REPLACE gives the row a new rowid, so items(after=...) sees updates as new
+            db.execute("INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                       (namespace, key, payload, time.time() + ttl if ttl else None))
+
+    def delete(self, namespace, key=None):
+        """Deletes one key, or the whole namespace if no key is given. Returns the number of rows removed."""
+        with self._connect() as db:
+            if key is None:
+                return db.execute("DELETE FROM kv WHERE namespace = ?", (namespace,)).rowcount
+            return db.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).rowcount
+
+    def items(self, namespace, after=0):
+        """
+        Returns the live entries of a namespace written after a given row id, oldest first.
+        Returns:
+            list: (rowid, key, value) tuples; pass the last rowid as `after` to get only newer entries.
+        """
+        rows = self._connect().execute(
+            "SELECT rowid, key, value FROM kv WHERE namespace = ? AND rowid > ? "
+            "AND (expires_at IS NULL OR expires_at > ?) ORDER BY rowid", (namespace, after, time.time())).fetchall()
+        return [(rowid, key, json.loads(value)) for rowid, key, value in rows]
+
+    def trim(self, namespace, keep):
+        """Deletes all but the `keep` newest entries of a namespace, and expired entries."""
+        with self._connect() as db:
+            db.execute("DELETE FROM kv WHERE namespace = ? AND (expires_at <= ? OR rowid NOT IN "
+                       "(SELECT rowid FROM kv WHERE namespace = ? ORDER BY rowid DESC LIMIT ?))",
+                       (namespace, time.time(), namespace, keep))
+
+    def publish(self, name, stats, worker=None):
+        """Records one worker's snapshot of a stats dict."""
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO metrics (worker, name, value, updated_at) VALUES (?, ?, ?, ?)",
+                       (worker or os.getpid(), name, json.dumps(stats), time.time()))
+
+    def snapshots(self, name):
+        """Returns {worker pid: stats} of every worker that published the named stats."""
+        rows = self._connect().execute("SELECT worker, value FROM metrics WHERE name = ?", (name,)).fetchall()
+        return {worker: json.loads(value) for worker, value in rows}
+
+    def forget_worker(self, worker=None):
+        """Removes the snapshots of one worker, or of all workers if none is given."""
+        with self._connect() as db:
+            if worker is None:
+                db.execute("DELETE FROM metrics")
+            else:
+                db.execute("DELETE FROM metrics WHERE worker = ?", (worker,))
+
+
+def _averaged(key):
+    return key.endswith(("_rate", "_seconds")) or key.startswith("mean_")
+
+
+def combine_stats(snapshots):
+    """
+    Combines several workers' stats dicts into totals.
+    Args:
+        snapshots (list): Stats dicts with the same shape (nested dicts allowed).
+    Returns:
+        dict: Summed counters, averaged rates and means, maximum peaks and limits; other values from the first snapshot.
+    """
+    combined = {}
+    for key in dict.fromkeys(key for snapshot in snapshots for key in snapshot):
+        values = [snapshot[key] for snapshot in snapshots if key in snapshot]
+        if all(isinstance(value, dict) for value in values):
+            combined[key] = combine_stats(values)
+        elif all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+            if key.startswith(("peak_", "max_")) or key == "cost":
+                combined[key] = max(values)
+            elif _averaged(key):
+                combined[key] = round(sum(values) / len(values), 4)
+            else:
+                combined[key] = sum(values)
+        else:
+            combined[key] = values[0]
+    return combined
+
+
+class SharedMetrics:
+    """
+    Publishes this worker's stats to a SharedStore and reports totals over all workers.
+    Args:
+        store (SharedStore, optional): The shared store; without one, reports are local.
+        interval (float): Seconds between background publishes (see start()).
+    """
+
+    def __init__(self, store=None, interval=METRICS_PUBLISH_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self._sources = {}
+
+    def register(self, name, report_fn):
+        """Adds a named stats source; report_fn returns a JSON-serializable dict."""
+        self._sources[name] = report_fn
+
+    def publish(self, names=None):
+        if self.store is None:
+            return
+        for name in names or list(self._sources):
+            try:
+                self.store.publish(name, self._sources[name]())
+            except Exception as e:
+                print(f"Publishing {name} metrics failed: {e}")
+
+    def report(self, name):
+        """
+        Returns the named stats: this process' own without a store, else the totals of all workers.
+        """
+        if self.store is None:
+            return self._sources[name]()
+        self.publish([name])
+        snapshots = self.store.snapshots(name)
+        return dict(combine_stats(list(snapshots.values())), workers=len(snapshots))
+
+    def start(self):
+        """Starts the background publisher; call once in every worker process after the fork."""
+        if self.store is None:
+            return
+
+        def loop():
+            while True:
+                self.publish()
+                time.sleep(self.interval)
+
+        threading.Thread(target=loop, name="metrics-publisher", daemon=True).start()
+
+    def forget(self, worker=None):
+        """Drops an exited worker's snapshots (or all of them); called by the supervising process."""
+        if self.store is not None:
+            self.store.forget_worker(worker)
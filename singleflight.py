@@ -0,0 +1,129 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+# --- Single-Flight Request Coalescing ---
+# When many users submit the same question within seconds (e.g. right after a
+# new circular), each request used to launch its own search and full agent run.
+# SingleFlight lets concurrent callers with the same key attach to one
+# execution and all receive its result; a short-lived memo then serves
+# stragglers that arrive just after it finished.
+#
+# With a shared_store (several worker processes, see sharedstate.py) finished
+# results are also memoized in SQLite, so a straggler that lands on another
+# worker is served from the memo too. Requests running at the same moment on
+# different workers are not coalesced.
+
+
+def normalize_key(text, version=""):
+    """
+    Builds a coalescing key from the normalized input and the workflow version.
+    Args:
+        text (str): The request input.
+        version (str): Bump when prompts/agents change so old results are not shared.
+    Returns:
+        str: A hex digest.
+    """
+    normalized = " ".join(text.split()).lower()
+    return hashlib.sha256(f"{version}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+    Args:
+        memo_ttl (float): Seconds a finished result keeps being served to new callers (0 disables).
+        max_memo_entries (int): Upper bound on memoized results.
+        shared_store (SharedStore, optional): Also memoizes JSON-serializable results for other worker processes.
+    """
+
+    def __init__(self, memo_ttl=30.0, max_memo_entries=256, shared_store=None):
+        self.memo_ttl = memo_ttl
+        self._shared = shared_store
+        self.max_memo_entries = max_memo_entries
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._memo = {}
+        self.stats = {"executions": 0, "coalesced": 0, "memo_hits": 0}
+
+    def do(self, key, fn):
+        """
+        Runs fn() once per key at a time and shares its result.
+        Args:
+            key (str): The coalescing key.
+            fn (callable): Zero-argument function producing the result.
+        Returns:
+            tuple: (result, how) where how is 'executed', 'coalesced' or 'memo'.
+        Raises:
+            Exception: Whatever fn raised, re-raised in every attached caller. Failures are not memoized.
+        """
+        with self._lock:
+            memo = self._memo.get(key)
+            if memo and memo[0] > time.monotonic():
+                self.stats["memo_hits"] += 1
+                return memo[1], "memo"
+        if self._shared is not None and self.memo_ttl > 0:
+            try:
+                result = self._shared.get("singleflight", key)
+            except sqlite3.Error as e:
+                print(f"Shared memo lookup for {key[:12]} failed: {e}")
+                result = None
+            if result is not None:
+                with self._lock:
+                    self.stats["memo_hits"] += 1
+                return result, "memo"
+        with self._lock:
+            call = self._in_flight.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats["coalesced"] += 1
+                leader = False
+            else:
+                call = self._in_flight[key] = _Call()
+                self.stats["executions"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, "coalesced"
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if call.error is None and self.memo_ttl > 0:
+                    self._remember(key, call.result)
+            call.done.set()
+        if call.error is not None:
+            raise call.error
+        if self._shared is not None and self.memo_ttl > 0:
+            try:
+                self._shared.set("singleflight", key, call.result, ttl=self.memo_ttl)
+            except (TypeError, ValueError, sqlite3.Error) as e:
+                # The run succeeded; failing to share it (e.g. "database is locked") must not fail the request
+                print(f"Result for {key[:12]} not shared with other workers: {e}")
+        if call.waiters:
+            print(f"--- Shared one execution with {call.waiters} coalesced request(s) ---")
+        return call.result, "executed"
+
+    def _remember(self, key, result):
+        now = time.monotonic()
+        if len(self._memo) >= self.max_memo_entries:
+            self._memo = {k: v for k, v in self._memo.items() if v[0] > now}
+            while len(self._memo) >= self.max_memo_entries:
+                self._memo.pop(next(iter(self._memo)))
+        self._memo[key] = (now + self.memo_ttl, result)
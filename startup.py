@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+
+# --- Lazy Startup Helpers ---
+# Shared by app.py and the human server. Heavy SDK imports (autogen, openai,
+# azure.search.documents) and client/agent construction are deferred until the
+# first request that needs them, so the process binds its port immediately.
+# /healthz answers "is the process up", /readyz answers "are the dependencies warm".
+#
+# WARMUP_ON_START:
+#   background (default) - the port is bound at once and the dependencies are
+#                          built in a background thread; /readyz reports 503
+#                          with per-dependency progress until they are all warm
+#   true                 - build everything before the server accepts traffic
+#   false                - build on first use only; /readyz then reports ready
+#                          as soon as the process is up, since nothing else
+#                          would ever warm the dependencies
+
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "background").strip().lower()
+if WARMUP_ON_START in ("1", "true", "yes"):
+    WARMUP_ON_START = "true"
+elif WARMUP_ON_START != "background":
+    WARMUP_ON_START = "false"
+
+# 'not_started' | 'running' | 'completed' | 'failed'
+_warm_up_state = "not_started"
+
+
+class LazyResource:
+    """
+    Builds a resource on first access and caches it for the life of the process.
+    Args:
+        name (str): Name used in logs and in the readiness report.
+        factory (callable): Zero-argument function that builds the resource.
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+        self._ready = False
+        self.error = None
+        self.init_seconds = None
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def get(self):
+        """
+        Returns the resource, building it on first call. Concurrent callers
+        wait on the same initialization instead of building it twice.
+        """
+        if self._ready:
+            return self._value
+        with self._lock:
+            if not self._ready:
+                started = time.perf_counter()
+                try:
+                    self._value = self._factory()
+                except Exception as e:
+                    self.error = str(e)
+                    print(f"Error initializing {self.name}: {e}")
+                    raise
+                self.init_seconds = round(time.perf_counter() - started, 3)
+                self.error = None
+                self._ready = True
+                print(f"{self.name} initialized in {self.init_seconds}s.")
+        return self._value
+
+    def reset(self):
+        """Drops the cached resource so the next get() rebuilds it."""
+        with self._lock:
+            self._value = None
+            self._ready = False
+            self.error = None
+            self.init_seconds = None
+
+    def status(self):
+        return {"ready": self._ready, "error": self.error, "init_seconds": self.init_seconds}
+
+
+def warm_up(resources):
+    """
+    Initializes every resource up front, e.g. before the server accepts traffic.
+    Args:
+        resources (list): LazyResource instances to build.
+    Returns:
+        bool: True if every resource initialized successfully.
+    """
+    global _warm_up_state
+    _warm_up_state = "running"
+    print("\n--- Warming up dependencies ---")
+    ok = True
+    for resource in resources:
+        try:
+            resource.get()
+        except Exception:
+            ok = False
+    _warm_up_state = "completed" if ok else "failed"
+    print(f"Warm-up {'completed' if ok else 'finished with errors'}.")
+    return ok
+
+
+def warm_up_on_start(resources, then=()):
+    """
+    Warms the resources as configured by WARMUP_ON_START: in a background thread
+    (the default), before returning, or not at all.
+    Args:
+        resources (list): LazyResource instances to build.
+        then (list): Callables run after the warm-up, e.g. starting worker pools.
+    """
+    def run():
+        warm_up(resources)
+        for hook in then:
+            hook()
+
+    if WARMUP_ON_START == "background":
+        threading.Thread(target=run, name="warm-up", daemon=True).start()
+    elif WARMUP_ON_START == "true":
+        run()
+
+
+def register_health_routes(app, resources):
+    """
+    Adds /healthz (liveness) and /readyz (readiness) routes to a Flask app.
+    Args:
+        app (Flask): The Flask application.
+        resources (list): LazyResource instances that must be warm for /readyz to pass.
+    """
+    from flask import jsonify
+
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        return jsonify({'status': 'up'}), 200
+
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        report = {resource.name: resource.status() for resource in resources}
+        # With lazy initialization (WARMUP_ON_START=false) the first request builds what it needs
+        ready = all(resource.ready for resource in resources) or WARMUP_ON_START == "false"
+        return jsonify({'status': 'ready' if ready else 'warming', 'warm_up': _warm_up_state,
+                        'dependencies': report}), 200 if ready else 503
@@ -0,0 +1,253 @@
+import json
+import os
+
+# --- Compact Structured Output ---
+# The comparator agents (app.py) and the Summarizer (summary.py) used to write
+# long free-form Markdown, which downstream code scanned for markers such as
+# "SUMMARY COMPLETE". Output tokens are the slowest part of a completion, so
+# with STRUCTURED_OUTPUT=true (opt-in) the agents reply with a terse JSON object
+# instead, which is validated here and rendered into prose, Markdown or report
+# entries locally, outside the LLM.
+#
+# Findings (comparator agents):
+#   {"f": [{"d": "D1.2", "t": "dv", "l": "Section 3 / clause 2", "x": ["rate"], "n": "12%->18%"}]}
+#     d  difference id from the locally computed diff (optional for full-text comparisons)
+#     t  type code (TYPE_CODES); l  location, only needed without a difference id
+#     x  explanation codes (EXPLANATION_CODES); n  optional short note, at most NOTE_MAX_WORDS words
+# Summary (Summarizer):
+#   {"h": "Title", "s": [{"h": "Heading", "b": ["point", ...]}], "src": ["Source", ...], "status": "done"}
+#
+# The summary's "status": "done" member doubles as the completion signal
+# understood by termination.ConvergenceMonitor, so no marker phrase has to be
+# generated. Findings carry no status: a GroupChat with several comparators
+# stops once all of them have reported (required_speakers), not after the first.
+# Set STRUCTURED_OUTPUT_JSON_MODE=true to also request JSON mode from the API
+# (only for deployments that support response_format).
+
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "false").lower() in ("1", "true", "yes")
+STRUCTURED_OUTPUT_JSON_MODE = os.getenv("STRUCTURED_OUTPUT_JSON_MODE", "false").lower() in ("1", "true", "yes")
+NOTE_MAX_WORDS = 25
+
+TYPE_CODES = {
+    "dv": "data_value",
+    "wd": "wording",
+    "fm": "formatting",
+    "ca": "clause_added",
+    "cr": "clause_removed",
+    "hc": "heading_changed",
+    "sm": "section_missing_from_document",
+    "sr": "section_removed_from_reference",
+    "sem": "semantic",
+}
+
+EXPLANATION_CODES = {
+    "rate": "The tax rate differs from the reference.",
+    "amount": "An amount or threshold differs from the reference.",
+    "date": "A date, period or deadline differs from the reference.",
+    "ref": "A cited section, rule, notification or case differs.",
+    "scope_narrow": "The provision applies more narrowly than the reference.",
+    "scope_wide": "The provision applies more broadly than the reference.",
+    "oblig_add": "The document adds an obligation or condition not in the reference.",
+    "oblig_drop": "The document omits an obligation or condition required by the reference.",
+    "exempt": "An exemption or concession differs from the reference.",
+    "penalty": "Interest, penalty or consequence differs from the reference.",
+    "party": "The parties, authority or jurisdiction differ.",
+    "outcome": "The outcome differs from the court's holding.",
+    "contradicts": "The document contradicts the reference.",
+    "wording_only": "Wording differs without changing the meaning.",
+    "format_only": "Only formatting differs.",
+    "unclear": "The impact cannot be determined from the provided text.",
+}
+
+class StructuredOutputError(ValueError):
+    """Raised when an agent message does not match the expected schema."""
+
+
+def findings_instructions():
+    """Returns the system message fragment asking comparator agents for the findings schema."""
+    return (
+        "Reply with a single JSON object and nothing else, in this compact schema: "
+        '{"f":[{"d":"D1.2","t":"dv","x":["rate"],"n":"12%->18%"}]}. '
+        "One entry per difference: d is its id from the 'Locally computed diff' (omit d and give l, the location, "
+        "for differences you find in full documents); t is one of " + ",".join(TYPE_CODES) + "; "
+        "x lists one or more of " + ",".join(EXPLANATION_CODES) + "; "
+        f"n is an optional note of at most {NOTE_MAX_WORDS} words with the changed values. No prose, no Markdown."
+    )
+
+
+def summary_instructions():
+    """Returns the system message fragment asking for the summary schema."""
+    return (
+        "Reply with a single JSON object and nothing else, in this compact schema: "
+        '{"h":"Title","s":[{"h":"Heading","b":["terse point"]}],"src":["Source"],"status":"done"}. '
+        "Points are short phrases, not full paragraphs. No Markdown; formatting is applied afterwards."
+    )
+
+
+def structured_llm_config(llm_config):
+    """Adds JSON mode to an llm_config when STRUCTURED_OUTPUT_JSON_MODE is set; returns a new dict."""
+    if not STRUCTURED_OUTPUT_JSON_MODE:
+        return llm_config
+    return dict(llm_config, response_format={"type": "json_object"})
+
+
+def iter_json_objects(content):
+    """Yields every JSON object in a text, skipping code fences, prose and braces that are not JSON."""
+    decoder = json.JSONDecoder()
+    start = content.find("{")
+    while start != -1:
+        try:
+            payload, end = decoder.raw_decode(content, start)
+        except ValueError:
+            start = content.find("{", start + 1)
+            continue
+        yield payload
+        start = content.find("{", end)
+
+
+def extract_json(content):
+    """
+    Returns the first JSON object in a message, tolerating code fences or text (braces included) around it.
+    Raises:
+        StructuredOutputError: If there is no parseable JSON object.
+    """
+    if not isinstance(content, str):
+        raise StructuredOutputError("message has no text content")
+    for payload in iter_json_objects(content):
+        return payload
+    raise StructuredOutputError("no JSON object in message")
+
+
+def is_done(content):
+    """Returns True if a message is a structured object with "status": "done"."""
+    try:
+        return str(extract_json(content).get("status", "")).lower() == "done"
+    except StructuredOutputError:
+        return False
+
+
+def _string(value, field):
+    if not isinstance(value, str) or not value.strip():
+        raise StructuredOutputError(f"'{field}' must be a non-empty string")
+    return value.strip()
+
+
+def _string_list(value, field):
+    if not isinstance(value, list):
+        raise StructuredOutputError(f"'{field}' must be a list")
+    return [_string(item, field) for item in value]
+
+
+def validate_findings(payload):
+    """
+    Validates a findings object against the compact schema.
+    Args:
+        payload (dict): Parsed JSON from a comparator message.
+    Returns:
+        list: Normalized findings {'id', 'type', 'location', 'codes', 'note'}.
+    Raises:
+        StructuredOutputError: On the first schema violation.
+    """
+    entries = payload.get("f")
+    if not isinstance(entries, list):
+        raise StructuredOutputError("'f' must be a list of findings")
+    findings = []
+    for n, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise StructuredOutputError(f"finding {n} is not an object")
+        type_code = entry.get("t")
+        if type_code not in TYPE_CODES:
+            raise StructuredOutputError(f"finding {n}: unknown type code {type_code!r}")
+        codes = _string_list(entry.get("x", []), f"f[{n}].x")
+        unknown = [code for code in codes if code not in EXPLANATION_CODES]
+        if unknown or not codes:
+            raise StructuredOutputError(f"finding {n}: unknown or missing explanation codes {unknown}")
+        difference_id = _string(entry["d"], f"f[{n}].d") if "d" in entry else None
+        location = _string(entry["l"], f"f[{n}].l") if "l" in entry else None
+        if difference_id is None and location is None:
+            raise StructuredOutputError(f"finding {n}: needs a difference id 'd' or a location 'l'")
+        note = entry.get("n")
+        if note is not None:
+            note = _string(note, f"f[{n}].n")
+            if len(note.split()) > NOTE_MAX_WORDS:
+                raise StructuredOutputError(f"finding {n}: note longer than {NOTE_MAX_WORDS} words")
+        findings.append({"id": difference_id, "type": TYPE_CODES[type_code], "location": location,
+                         "codes": codes, "note": note})
+    return findings
+
+
+def validate_summary(payload):
+    """
+    Validates a summary object against the compact schema.
+    Args:
+        payload (dict): Parsed JSON from a Summarizer message.
+    Returns:
+        dict: {'title', 'sections': [{'heading', 'points'}], 'sources'}.
+    Raises:
+        StructuredOutputError: On the first schema violation.
+    """
+    sections = payload.get("s")
+    if not isinstance(sections, list) or not sections:
+        raise StructuredOutputError("'s' must be a non-empty list of sections")
+    normalized = []
+    for n, section in enumerate(sections):
+        if not isinstance(section, dict):
+            raise StructuredOutputError(f"section {n} is not an object")
+        normalized.append({"heading": _string(section.get("h"), f"s[{n}].h"),
+                           "points": _string_list(section.get("b", []), f"s[{n}].b")})
+    return {"title": _string(payload.get("h", "Summary"), "h"), "sections": normalized,
+            "sources": _string_list(payload.get("src", []), "src")}
+
+
+def explain(finding):
+    """Renders one validated finding as a sentence."""
+    text = " ".join(EXPLANATION_CODES[code] for code in finding["codes"])
+    return f"{text} ({finding['note']})" if finding["note"] else text
+
+
+def parse_structured_findings(messages):
+    """
+    Collects the valid findings of every structured message; invalid messages are skipped.
+    Args:
+        messages (iterable): Message dicts from the comparator agents.
+    Returns:
+        tuple: (findings keyed by difference id {id: sentence}, findings without an id [finding], errors [str]).
+    """
+    by_id, unanchored, errors = {}, [], []
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else None
+        if not isinstance(content, str) or "{" not in content:
+            continue
+        # A message may hold several findings objects (e.g. one per document)
+        payloads = [payload for payload in iter_json_objects(content) if "f" in payload]
+        if not payloads:
+            errors.append(f"{message.get('name', 'agent')}: no findings object in message")
+            continue
+        try:
+            findings = [finding for payload in payloads for finding in validate_findings(payload)]
+        except StructuredOutputError as e:
+            errors.append(f"{message.get('name', 'agent')}: {e}")
+            continue
+        for finding in findings:
+            if finding["id"]:
+                by_id[finding["id"]] = explain(finding)
+            else:
+                unanchored.append(finding)
+    for error in errors:
+        print(f"Structured output rejected: {error}")
+    return by_id, unanchored, errors
+
+
+def render_findings(findings):
+    """Renders findings without a difference id as report lines."""
+    return [f"{finding['type']} at {finding['location']}: {explain(finding)}" for finding in findings]
+
+
+def render_summary_markdown(summary):
+    """Renders a validated summary as Markdown."""
+    lines = [f"# {summary['title']}", ""]
+    for section in summary["sections"]:
+        lines += [f"## {section['heading']}", ""] + [f"- {point}" for point in section["points"]] + [""]
+    if summary["sources"]:
+        lines += ["Sources: " + "; ".join(summary["sources"])]
+    return "\n".join(lines).strip()
@@ -1,6 +1,10 @@
 import autogen
 from typing_extensions import Annotated
 import json
+from toolpool import register_concurrent_tool_calls
+from termination import ConvergenceMonitor
+from structuredoutput import (STRUCTURED_OUTPUT, StructuredOutputError, summary_instructions, structured_llm_config,
+                              extract_json, is_done, validate_summary, render_summary_markdown)
 
 # --- IMPORTANT: Replace this with your actual AI Search Integration ---
 def ai_search_knowledge_store(query: Annotated[str, "The search query to send to the knowledge store."]) -> str:
@@ -90,7 +94,7 @@ user_proxy = autogen.UserProxyAgent(
     code_execution_config={"last_n_messages": 1, "work_dir": "coding"},
     human_input_mode="NEVER",
     max_consecutive_auto_reply=10,
-    is_termination_msg=lambda x: "summary complete" in x.get("content", "").lower(),
+    is_termination_msg=lambda x: "summary complete" in (x.get("content") or "").lower() or is_done(x.get("content")),
 )
 
 researcher = autogen.AssistantAgent(
@@ -101,19 +105,23 @@ researcher = autogen.AssistantAgent(
         "information from the AI knowledge store to answer the user's questions comprehensively. "
         "Use the 'ai_search_knowledge_store' tool to find relevant data. "
         "If you don't find enough information with one query, try rephrasing or using related terms. "
+        "When several searches are needed, request them together in a single message; they run concurrently. "
         "Once you believe you have all the required information, inform the Summarizer agent."
     ),
 )
 
+# With STRUCTURED_OUTPUT the Summarizer replies in a compact JSON schema that is
+# validated and rendered to Markdown locally (see structuredoutput.py)
 summarizer = autogen.AssistantAgent(
     name="Summarizer",
-    llm_config={"config_list": config_list},
+    llm_config=structured_llm_config({"config_list": config_list}) if STRUCTURED_OUTPUT else {"config_list": config_list},
     system_message=(
         "You are an expert summarizer and report generator. Your task is to take all the information "
         "provided by the Researcher and synthesize it into a clear, concise, and comprehensive report or summary. "
         "Ensure the summary directly addresses the original query from the Admin. "
-        "Format the summary professionally using Markdown. "
-        "Conclude your summary with the phrase 'SUMMARY COMPLETE' to signal the end of the report."
+        + (summary_instructions() if STRUCTURED_OUTPUT else
+           "Format the summary professionally using Markdown. "
+           "Conclude your summary with the phrase 'SUMMARY COMPLETE' to signal the end of the report.")
     ),
 )
 
@@ -125,6 +133,8 @@ autogen.register_function(
     name="ai_search_knowledge_store",
     description="Tool to perform a search on the external AI knowledge store. Input is the search query string.",
 )
+# Several searches requested in the same turn run concurrently instead of one after another
+register_concurrent_tool_calls(user_proxy)
 
 # --- 4. Create Group Chat ---
 groupchat = autogen.GroupChat(
@@ -133,7 +143,10 @@ groupchat = autogen.GroupChat(
     max_round=20,
     speaker_selection_method="auto",
 )
-manager = autogen.GroupChatManager(groupchat=groupchat, llm_config={"config_list": config_list})
+# Stops as soon as the Summarizer signals completion or the chat stops adding new information
+monitor = ConvergenceMonitor(done_markers=("SUMMARY COMPLETE", "TERMINATE"))
+manager = autogen.GroupChatManager(groupchat=groupchat, llm_config={"config_list": config_list},
+                                   is_termination_msg=monitor)
 
 # --- 5. Initiate the Conversation ---
 initial_prompt = (
@@ -149,6 +162,8 @@ user_proxy.initiate_chat(
     message=initial_prompt,
 )
 
+print(f"\n--- Chat stopped: {monitor.result()} ---")
+
 # --- Retrieve all messages from the group chat ---
 print("\n--- Retrieving All Messages from Group Chat ---")
 all_messages = groupchat.messages
@@ -171,7 +186,15 @@ else:
 print("\n--- Final Summary Report (extracted from last message) ---")
 final_summary = None
 for msg in reversed(groupchat.messages):
-    if msg.get("sender") == summarizer and "summary complete" in msg.get("content", "").lower():
+    if msg.get("name") != summarizer.name or not isinstance(msg.get("content"), str):
+        continue
+    if STRUCTURED_OUTPUT:
+        try:
+            final_summary = render_summary_markdown(validate_summary(extract_json(msg["content"])))
+            break
+        except StructuredOutputError as e:
+            print(f"Summarizer message rejected: {e}")
+    elif "summary complete" in msg["content"].lower():
         final_summary = msg["content"].replace("SUMMARY COMPLETE", "").strip()
         break
 
@@ -0,0 +1,139 @@
+import difflib
+import json
+import re
+
+# --- Convergence-Based Early Termination ---
+# GroupChats used to stop only on max_round or brittle substring checks such as
+# "TERMINATE" in content, so many runs spent several idle rounds after the answer
+# was already there. A ConvergenceMonitor is passed as the GroupChatManager's
+# is_termination_msg: the manager calls it with every message of the chat and
+# stops as soon as one of these holds:
+#   - done_signal:        a structured {"status": "done"} message or a done marker line
+#   - required_artifacts: every required speaker has spoken / every required pattern appeared
+#   - repeated_content:   a message is (almost) a copy of a recent one
+#   - no_new_information: several consecutive messages add almost no new content
+# The reason is kept in monitor.stop_reason so callers can record it.
+
+
+def _normalize(text):
+    return " ".join(text.split()).lower()
+
+
+def _shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))} if words else set()
+
+
+class ConvergenceMonitor:
+    """
+    Detects when a GroupChat has converged and records why it stopped.
+    Args:
+        done_markers (tuple): Phrases that signal completion when a line starts or ends with them.
+        required_speakers (tuple): Agent names that must all have spoken for the chat to be complete.
+        required_patterns (tuple): Regexes that must all have matched some message for the chat to be complete.
+        repeat_threshold (float): Similarity (0-1) above which a message counts as repeated.
+        repeat_window (int): How many recent messages to compare against.
+        novelty_threshold (float): Share of new word 3-grams below which a message adds nothing new.
+        stale_rounds (int): Consecutive messages without new information before stopping.
+        min_rounds (int): Messages to see before repetition/novelty checks apply.
+    """
+
+    def __init__(self, done_markers=("TERMINATE",), required_speakers=(), required_patterns=(),
+                 repeat_threshold=0.92, repeat_window=4, novelty_threshold=0.15, stale_rounds=2, min_rounds=2):
+        self.done_markers = [marker.lower() for marker in done_markers]
+        self.required_speakers = set(required_speakers)
+        self.required_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in required_patterns]
+        self.repeat_threshold = repeat_threshold
+        self.repeat_window = repeat_window
+        self.novelty_threshold = novelty_threshold
+        self.stale_rounds = stale_rounds
+        self.min_rounds = min_rounds
+        self.reset()
+
+    def reset(self):
+        """Clears all state; call before starting a new chat."""
+        self.rounds = 0
+        self.stop_reason = None
+        self._recent = []
+        self._seen = set()
+        self._stale = 0
+        self._speakers = set()
+        self._matched_patterns = set()
+
+    def result(self):
+        """Returns the stop reason, or a max_round/agent reason if the monitor never fired."""
+        return self.stop_reason or {"reason": "max_round_or_agent_termination", "round": self.rounds, "detail": None}
+
+    def __call__(self, message):
+        if self.stop_reason is not None:
+            return True
+        self.rounds += 1
+        content = message.get("content")
+        content = content if isinstance(content, str) else ""
+        if message.get("name"):
+            self._speakers.add(message["name"])
+        for i, pattern in enumerate(self.required_patterns):
+            if pattern.search(content):
+                self._matched_patterns.add(i)
+
+        reason = (self._check_done_signal(content)
+                  or self._check_required_artifacts()
+                  or self._check_repetition(message, content)
+                  or self._check_novelty(message, content))
+        if reason:
+            self.stop_reason = {"reason": reason[0], "round": self.rounds, "detail": reason[1]}
+            print(f"\n--- Stopping chat at round {self.rounds}: {reason[0]} ({reason[1]}) ---")
+            return True
+        return False
+
+    def _check_done_signal(self, content):
+        stripped = content.strip()
+        if stripped.startswith("{"):
+            try:
+                payload = json.loads(stripped)
+            except ValueError:
+                payload = None
+            if isinstance(payload, dict) and str(payload.get("status", "")).lower() in ("done", "complete"):
+                return "done_signal", "structured status message"
+        for line in stripped.lower().splitlines()[-3:]:
+            line = line.strip(" .*#!")
+            for marker in self.done_markers:
+                if line.startswith(marker) or line.endswith(marker):
+                    return "done_signal", f"marker '{marker}'"
+        return None
+
+    def _check_required_artifacts(self):
+        if not self.required_speakers and not self.required_patterns:
+            return None
+        if self.required_speakers <= self._speakers and len(self._matched_patterns) == len(self.required_patterns):
+            return "required_artifacts", "all required speakers and artifacts present"
+        return None
+
+    def _check_repetition(self, message, content):
+        normalized = _normalize(content)
+        recent = self._recent
+        self._recent = (recent + [normalized])[-self.repeat_window:]
+        if self.rounds <= self.min_rounds or not normalized or message.get("role") in ("tool", "function"):
+            return None
+        for previous in recent:
+            if previous and difflib.SequenceMatcher(None, previous, normalized).quick_ratio() >= self.repeat_threshold \
+                    and difflib.SequenceMatcher(None, previous, normalized).ratio() >= self.repeat_threshold:
+                return "repeated_content", "message repeats a recent one"
+        return None
+
+    def _check_novelty(self, message, content):
+        # A tool/function call request usually has no text; it is neither stale nor new
+        if message.get("tool_calls") or message.get("function_call"):
+            return None
+        shingles = _shingles(content)
+        new = shingles - self._seen
+        self._seen |= shingles
+        # Tool/function results are new information by definition
+        if self.rounds <= self.min_rounds or message.get("role") in ("tool", "function"):
+            self._stale = 0
+            return None
+        novelty = len(new) / len(shingles) if shingles else 0.0
+        self._stale = self._stale + 1 if novelty < self.novelty_threshold else 0
+        if self._stale >= self.stale_rounds:
+            return "no_new_information", f"{self._stale} consecutive messages below {self.novelty_threshold:.0%} new content"
+        return None
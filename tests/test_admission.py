@@ -0,0 +1,70 @@
+import threading
+import time
+
+from admission import EndpointGate, TokenBuckets
+
+
+def test_token_bucket_charges_cost_and_refills():
+    buckets = TokenBuckets(rate=10.0, burst=20.0)
+    assert buckets.take("client", 12) == 0
+    wait = buckets.take("client", 12)
+    assert 0.3 < wait <= 0.4 # 4 tokens short at 10 tokens per second
+    time.sleep(wait + 0.05)
+    assert buckets.take("client", 12) == 0
+
+
+def test_token_bucket_clients_are_independent_and_refunds_restore():
+    buckets = TokenBuckets(rate=0.0, burst=10.0)
+    assert buckets.take("a", 10) == 0
+    assert buckets.take("a", 1) > 0
+    assert buckets.take("b", 10) == 0
+    buckets.refund("a", 5)
+    assert buckets.take("a", 5) == 0
+
+
+def test_cost_above_burst_is_capped():
+    buckets = TokenBuckets(rate=1.0, burst=5.0)
+    assert buckets.take("client", 50) == 0
+
+
+def test_gate_rejects_when_queue_is_full():
+    gate = EndpointGate("run", max_concurrent=1, max_queue=0)
+    assert gate.acquire() is None
+    assert gate.acquire() == "queue_full"
+    gate.release(0.1)
+    assert gate.acquire() is None
+    assert gate.report()["rejected_queue_full"] == 1
+
+
+def test_gate_times_out_queued_requests():
+    gate = EndpointGate("run", max_concurrent=1, max_queue=4, queue_timeout=5)
+    assert gate.acquire() is None
+    started = time.monotonic()
+    assert gate.acquire(timeout=0.05) == "timeout" # The client deadline is shorter than queue_timeout
+    assert time.monotonic() - started < 1
+    assert gate.report()["waiting"] == 0
+
+
+def test_gate_hands_slot_to_oldest_waiter():
+    gate = EndpointGate("run", max_concurrent=1, max_queue=4, queue_timeout=5)
+    assert gate.acquire() is None
+    order = []
+
+    def wait(name):
+        assert gate.acquire() is None
+        order.append(name)
+
+    threads = []
+    for name in ("first", "second"):
+        threads.append(threading.Thread(target=wait, args=(name,)))
+        threads[-1].start()
+        while gate.report()["waiting"] < len(threads):
+            time.sleep(0.01)
+    gate.release(0.5)
+    threads[0].join(1)
+    assert order == ["first"]
+    assert gate.report()["in_flight"] == 1
+    gate.release(0.5)
+    threads[1].join(1)
+    assert order == ["first", "second"]
+    assert gate.retry_after() >= 1
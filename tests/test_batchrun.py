@@ -0,0 +1,66 @@
+import json
+import random
+import time
+
+from batchrun import completed_ids, read_questions, run_batch
+
+
+def _write_lines(path, lines):
+    path.write_text("\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines) + "\n")
+
+
+def _records(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_read_questions_accepts_aliases_and_skips_bad_lines(tmp_path):
+    path = tmp_path / "in.jsonl"
+    _write_lines(path, [{"id": "a", "question": "q1"}, {"query": "q2"}, "", "not json", '"q5"', {"other": 1}])
+    assert [(qid, q) for qid, q, _ in read_questions(path)] == [("a", "q1"), ("2", "q2"), ("5", "q5")]
+
+
+def test_ordered_results_follow_input_order(tmp_path):
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_lines(source, [{"id": str(n), "question": f"q{n}"} for n in range(20)])
+
+    def answer(question):
+        time.sleep(random.random() / 100)
+        return {"answer": question.upper()}
+
+    stats = run_batch(str(source), str(output), answer, workers=4)
+    assert stats["answered"] == 20 and stats["failed"] == 0
+    assert [r["id"] for r in _records(output)] == [str(n) for n in range(20)]
+    assert _records(output)[3]["answer"] == "Q3"
+
+
+def test_resume_skips_answered_and_retries_failed(tmp_path):
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_lines(source, [{"id": str(n), "question": f"q{n}"} for n in range(5)])
+
+    def flaky(question):
+        if question == "q2":
+            raise TimeoutError("search timed out")
+        return {"answer": question}
+
+    first = run_batch(str(source), str(output), flaky, workers=2)
+    assert (first["answered"], first["failed"]) == (4, 1)
+    with open(output, "a") as f:
+        f.write('{"id": "2", "question": "q2", "answ') # A retry cut off by a crash mid-write
+    assert completed_ids(str(output)) == {"0", "1", "3", "4"}
+
+    asked = []
+    second = run_batch(str(source), str(output), lambda q: asked.append(q) or {"answer": q}, workers=2)
+    assert asked == ["q2"]
+    assert (second["answered"], second["skipped"]) == (1, 4)
+    assert completed_ids(str(output)) == {"0", "1", "2", "3", "4"}
+    # The new record starts on a line of its own, after the cut-off one
+    assert output.read_text().splitlines()[-1].startswith('{"id": "2"')
+    assert json.loads(output.read_text().splitlines()[-1])["answer"] == "q2"
+
+
+def test_no_resume_overwrites(tmp_path):
+    source, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_lines(source, [{"id": "1", "question": "q"}])
+    run_batch(str(source), str(output), lambda q: {"answer": 1}, workers=1)
+    run_batch(str(source), str(output), lambda q: {"answer": 2}, workers=1, resume=False)
+    assert [r["answer"] for r in _records(output)] == [2]
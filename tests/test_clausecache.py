@@ -0,0 +1,46 @@
+from clausecache import ClauseComparisonCache, parse_findings
+
+
+def test_parse_findings_reads_bracketed_ids():
+    messages = [
+        {"name": "rules_comparator", "content": "[D1.1] The rate differs (12% vs 18%).\n- **[D1.2]**: Wording only."},
+        {"name": "rules_comparator", "content": "D2.1 - A condition is missing."},
+        {"name": "other", "content": None},
+    ]
+    assert parse_findings(messages) == {
+        "D1.1": "The rate differs (12% vs 18%).",
+        "D1.2": "Wording only.",
+        "D2.1": "A condition is missing.",
+    }
+
+
+def test_parse_findings_last_finding_wins():
+    messages = [{"content": "[D1.1] first"}, {"content": "[D1.1] revised"}]
+    assert parse_findings(messages) == {"D1.1": "revised"}
+
+
+def _differences():
+    return [{"id": "D1.1", "before": "Tax at 18%.", "after": "Tax at 12%."},
+            {"id": "D1.2", "before": "Pay  monthly.", "after": "Pay quarterly."}]
+
+
+def test_findings_are_cached_per_clause_pair(tmp_path):
+    cache = ClauseComparisonCache(str(tmp_path / "clauses.db"), prompt_version="1")
+    first = _differences()
+    assert cache.annotate(first) == 0
+    assert cache.store_findings(first, {"D1.1": "Rate differs."}) == 1
+
+    # Ids differ between runs; the clause text (normalized) is the key
+    second = [dict(d, id=f"D3.{n}") for n, d in enumerate(_differences(), 1)]
+    second[0]["before"] = "tax  at 18%."
+    assert cache.annotate(second) == 1
+    assert second[0]["cached"] and second[0]["explanation"] == "Rate differs."
+    assert "cached" not in second[1]
+    assert cache.store_findings(second, {"D3.1": "ignored, already cached"}) == 0
+    assert cache.report()["hit_rate"] == 0.25
+
+
+def test_prompt_version_separates_findings(tmp_path):
+    path = str(tmp_path / "clauses.db")
+    ClauseComparisonCache(path, prompt_version="1").store_findings(_differences(), {"D1.1": "Rate differs."})
+    assert ClauseComparisonCache(path, prompt_version="2").annotate(_differences()) == 0
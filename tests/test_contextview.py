@@ -0,0 +1,44 @@
+from contextview import TRUNCATION_MARKER, apply_view, estimate_tokens
+
+SYSTEM = {"role": "system", "content": "You compare documents."}
+TASK = {"role": "user", "name": "User_proxy",
+        "content": "Document 1 (Title: R, Corpus: rules):\nrule text\n\n"
+                   "Document 2 (Title: J, Corpus: judgements):\njudgement text\n\nUser Question: compare"}
+
+
+def _message(name, content, role="user"):
+    return {"role": role, "name": name, "content": content}
+
+
+def test_names_filter_keeps_own_messages_and_listed_senders():
+    messages = [SYSTEM, TASK, _message("data_accumulator_judgements", "other branch"),
+                _message("data_accumulator_compliance_rules", "own branch"),
+                _message("rules_comparator", "my earlier reply", role="assistant")]
+    viewed = apply_view(messages, {"names": ("User_proxy", "data_accumulator_compliance_rules")})
+    assert [m["content"] for m in viewed[2:]] == ["own branch", "my earlier reply"]
+
+
+def test_system_message_and_task_are_retained():
+    messages = [SYSTEM, TASK] + [_message("A", f"turn {n}") for n in range(5)]
+    viewed = apply_view(messages, {"last_n": 1})
+    assert viewed[:2] == [SYSTEM, TASK]
+    assert [m["content"] for m in viewed[2:]] == ["turn 4"]
+    extracted = apply_view(messages, {"task_extract": r"User Question:.*\Z", "last_n": 0})
+    assert extracted == [SYSTEM, dict(TASK, content="User Question: compare")]
+    assert messages[1] is TASK and "Document 1" in TASK["content"] # The stored history is untouched
+
+
+def test_task_drop_removes_matching_parts_of_the_task():
+    view = {"task_drop": r"Document \d+ \(Title: [^\n]*, Corpus: judgements\):\n.*?(?=Document|User Question:)"}
+    task = apply_view([SYSTEM, TASK], view)[1]["content"]
+    assert "rule text" in task and "judgement text" not in task
+    assert task.endswith("User Question: compare")
+
+
+def test_budget_truncates_the_task_and_drops_oldest_turns_first():
+    long_task = _message("User_proxy", "x" * 4000)
+    messages = [SYSTEM, long_task] + [_message("A", f"turn {n} " + "y" * 200) for n in range(10)]
+    viewed = apply_view(messages, {"max_tokens": 400})
+    assert estimate_tokens(viewed) <= 400
+    assert TRUNCATION_MARKER in viewed[1]["content"] and len(viewed[1]["content"]) <= 400 * 4 * 3 // 4
+    assert viewed[-1]["content"].startswith("turn 9") and len(viewed) < len(messages)
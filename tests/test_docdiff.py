@@ -0,0 +1,53 @@
+from docdiff import diff_documents, format_diff_for_llm, segment_document
+
+REFERENCE = """Section 1 Levy
+Tax shall be levied at the rate of 12% on the value of the supply. The supplier shall pay the tax.
+
+Section 2 Exemptions
+Supplies to charitable institutions are exempt. Exports are zero rated.
+"""
+
+
+def test_identical_documents_have_no_differences():
+    diff = diff_documents(REFERENCE, REFERENCE)
+    assert diff["similarity"] == 1.0
+    assert diff["differences"] == []
+    assert diff["unchanged_clauses"] == 4
+
+
+def test_changed_rate_is_a_data_value_difference():
+    document = REFERENCE.replace("12%", "18%")
+    diff = diff_documents(document, REFERENCE)
+    assert [d["type"] for d in diff["differences"]] == ["data_value"]
+    difference = diff["differences"][0]
+    assert difference["location"] == "Section 1 Levy / clause 1"
+    assert difference["word_changes"] == [{"op": "replace", "before": "18%", "after": "12%"}]
+    assert diff["similarity"] > 0.9
+
+
+def test_missing_section_is_reported():
+    document = REFERENCE.split("Section 2")[0]
+    types = [d["type"] for d in diff_documents(document, REFERENCE)["differences"]]
+    assert types == ["section_missing_from_document"]
+
+
+def test_unrelated_texts_score_low_similarity():
+    # Same language and letters, different content: quick_ratio() scored pairs like this above 0.7
+    rule = "Tax shall be levied at the rate of twelve percent on the value of every taxable supply of goods."
+    judgement = "The appellant challenged the assessment order before the tribunal, which remanded the matter."
+    assert diff_documents(rule, judgement)["similarity"] < 0.3
+
+
+def test_segment_document_splits_sections_and_clauses():
+    sections = segment_document(REFERENCE)
+    assert [s["heading"] for s in sections] == ["Section 1 Levy", "Section 2 Exemptions"]
+    assert sections[0]["paragraphs"] == [["Tax shall be levied at the rate of 12% on the value of the supply.",
+                                          "The supplier shall pay the tax."]]
+
+
+def test_format_diff_uses_difference_ids():
+    diff = diff_documents(REFERENCE.replace("12%", "18%"), REFERENCE)
+    diff["differences"][0]["id"] = "D1.1"
+    text = format_diff_for_llm(diff, title="Rules")
+    assert "[D1.1] data_value at Section 1 Levy / clause 1" in text
+    assert "- document:  Tax shall be levied at the rate of 18%" in text
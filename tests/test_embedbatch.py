@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+from embedbatch import EmbeddingBatcher, local_embed_texts
+
+
+class _Backend:
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        return local_embed_texts(texts)
+
+
+def _concurrently(batcher, texts):
+    results, errors = {}, {}
+    start = threading.Barrier(len(texts))
+
+    def call(text):
+        start.wait()
+        try:
+            results[text] = batcher.embed([text])[0]
+        except Exception as e:
+            errors[text] = e
+
+    threads = [threading.Thread(target=call, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results, errors
+
+
+def test_concurrent_callers_share_one_batch():
+    backend = _Backend()
+    texts = [f"question {n}" for n in range(8)]
+    # The batch goes out as soon as it is full, well before the wait expires
+    batcher = EmbeddingBatcher(backend, max_batch_size=len(texts), max_wait_ms=5000)
+    results, errors = _concurrently(batcher, texts)
+    assert not errors
+    assert len(backend.calls) == 1 and sorted(backend.calls[0]) == sorted(texts)
+    assert all(results[text] == local_embed_texts([text])[0] for text in texts)
+
+
+def test_an_error_reaches_every_waiter():
+    backend = _Backend(error=RuntimeError("rate limited"))
+    texts = [f"question {n}" for n in range(4)]
+    batcher = EmbeddingBatcher(backend, max_batch_size=len(texts), max_wait_ms=5000)
+    results, errors = _concurrently(batcher, texts)
+    assert not results and set(errors) == set(texts)
+    assert all(str(e) == "rate limited" for e in errors.values())
+    assert batcher.report()["errors"] == 1
+
+
+def test_duplicates_are_embedded_once_and_then_cached():
+    backend = _Backend()
+    batcher = EmbeddingBatcher(backend, max_wait_ms=0)
+    first = batcher.embed(["same", "same", "other"])
+    assert backend.calls == [["same", "other"]] and first[0] == first[1]
+    assert batcher.embed(["same"]) == [first[0]]
+    assert len(backend.calls) == 1 and batcher.report()["cache_hits"] == 1
+
+
+def test_large_requests_are_split_into_max_batch_size_calls():
+    backend = _Backend()
+    batcher = EmbeddingBatcher(backend, max_batch_size=2, max_wait_ms=0, cache_size=0)
+    assert len(batcher.embed(["a", "b", "c"])) == 3
+    assert [len(call) for call in backend.calls] == [2, 1]
+
+
+def test_local_embedding_is_deterministic_and_unit_length():
+    first, second = local_embed_texts(["The same text"]), local_embed_texts(["the same text"])
+    assert first == second
+    assert sum(x * x for x in first[0]) == pytest.approx(1.0)
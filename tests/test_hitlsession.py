@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+from hitlsession import HumanInputRequired, restore_groupchat, run_until_input
+
+
+class _Agent:
+    def __init__(self, name):
+        self.name = name
+        self.history = ["stale"]
+
+    def clear_history(self):
+        self.history = []
+
+
+class _Manager(_Agent):
+    def __init__(self, groupchat):
+        super().__init__("manager")
+        self.groupchat = groupchat
+
+    def send(self, message, recipient, request_reply=False, silent=False):
+        recipient.history.append(message["content"])
+
+    def resume(self, messages, silent=False):
+        # Like autogen's GroupChatManager.resume(): everything but the last message
+        for message in messages[:-1]:
+            self.groupchat.append(message, self.groupchat.agent_by_name(message["name"]))
+            for agent in self.groupchat.agents:
+                self.send(message, agent)
+        return self.groupchat.agent_by_name(messages[-1]["name"]), messages[-1]
+
+
+def _manager(names):
+    agents = [_Agent(name) for name in names]
+    groupchat = SimpleNamespace(agents=agents, messages=[])
+    groupchat.agent_by_name = lambda name: next(a for a in agents if a.name == name)
+    groupchat.append = lambda message, speaker: groupchat.messages.append(dict(message, name=speaker.name))
+    return _Manager(groupchat)
+
+
+def test_restore_keeps_the_last_message():
+    manager = _manager(["User", "A"])
+    messages = [{"name": "User", "content": "question"}, {"name": "A", "content": "answer"}]
+    restore_groupchat(manager, messages)
+    assert [m["content"] for m in manager.groupchat.messages] == ["question", "answer"]
+    assert all(agent.history == ["question", "answer"] for agent in manager.groupchat.agents)
+    assert manager.history == []
+
+
+def test_new_session_does_not_inherit_another_sessions_history():
+    manager = _manager(["User", "A"])
+    manager.groupchat.messages = [{"name": "A", "content": "other session"}]
+    restore_groupchat(manager, [])
+    assert manager.groupchat.messages == []
+    assert all(agent.history == [] for agent in manager.groupchat.agents + [manager])
+
+
+def test_suspend_and_resume_cycles_lose_no_messages():
+    manager = _manager(["User", "A"])
+
+    class _Proxy:
+        def initiate_chat(self, recipient, message, clear_history):
+            recipient.groupchat.append({"content": message}, recipient.groupchat.agents[0])
+            recipient.groupchat.append({"content": "reply"}, recipient.groupchat.agents[1])
+            raise HumanInputRequired("next?")
+
+    session = {"session_id": "s", "state": "new", "messages": []}
+    for turn in ("first", "second"):
+        run_until_input(session, _Proxy(), manager, turn)
+        assert session["state"] == "waiting_for_input"
+    assert [m["content"] for m in session["messages"]] == ["first", "reply", "second", "reply"]
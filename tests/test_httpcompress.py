@@ -0,0 +1,24 @@
+from httpcompress import _accepts
+
+
+def test_listed_encodings_are_accepted():
+    assert _accepts("gzip, deflate, br", "br")
+    assert _accepts("gzip;q=0.5, br", "gzip")
+    assert _accepts("GZIP", "gzip")
+
+
+def test_substrings_do_not_count():
+    assert not _accepts("x-gzip-like", "gzip")
+    assert not _accepts("", "gzip")
+
+
+def test_q_zero_refuses_an_encoding():
+    assert not _accepts("gzip, br;q=0", "br")
+    assert not _accepts("br; q=0.0", "br")
+    assert _accepts("gzip, br;q=0", "gzip")
+
+
+def test_wildcard_covers_unlisted_encodings_only():
+    assert _accepts("*", "br")
+    assert not _accepts("*;q=0", "gzip")
+    assert not _accepts("*, br;q=0", "br")
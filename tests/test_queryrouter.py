@@ -0,0 +1,41 @@
+import json
+
+from queryrouter import QueryRouter
+
+
+def test_keywords_select_their_corpus():
+    router = QueryRouter()
+    assert router.route("Which tribunal upheld the appeal?")["corpora"] == ["judgements"]
+    decision = router.route("What is the rate under section 9 of the act?")
+    assert decision["corpora"] == ["rules"] and decision["route"] == "rules"
+
+
+def test_keywords_of_both_corpora_select_all():
+    decision = QueryRouter().route("Did the court rule on the notification that changed the rate?")
+    assert decision["corpora"] == ["rules", "judgements"] and decision["route"] == "all"
+
+
+def test_no_signal_falls_back_to_every_corpus():
+    router = QueryRouter()
+    decision = router.route("hello there")
+    assert decision["route"] == "all" and not any(decision["keyword_hits"].values())
+    assert router.stats["route:all"] == 1
+
+
+def _fruit_and_vehicles(**kwargs):
+    corpora = {"fruit": {"description": "apples oranges bananas pears fruit"},
+               "vehicles": {"description": "cars trucks engines wheels vehicles"}}
+    return QueryRouter(corpora=corpora, margin=0.1, **kwargs)
+
+
+def test_centroid_decides_without_keywords():
+    router = _fruit_and_vehicles()
+    assert router.route("fresh apples and oranges")["corpora"] == ["fruit"]
+    assert router.route("trucks with big engines")["corpora"] == ["vehicles"]
+
+
+def test_metadata_file_extends_the_centroids(tmp_path):
+    metadata = tmp_path / "router.json"
+    metadata.write_text(json.dumps({"vehicles": ["motorbike helmets and motorbike gear"]}))
+    assert _fruit_and_vehicles().route("motorbike helmets")["route"] == "all"
+    assert _fruit_and_vehicles(metadata_file=str(metadata)).route("motorbike helmets")["corpora"] == ["vehicles"]
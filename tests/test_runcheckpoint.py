@@ -0,0 +1,93 @@
+import subprocess
+import sys
+from types import SimpleNamespace
+
+from runcheckpoint import RoundRecorder, RunCheckpointStore, resume_groupchat
+
+
+def _store(tmp_path):
+    return RunCheckpointStore(str(tmp_path / "checkpoints.db"))
+
+
+def test_rounds_are_checkpointed_in_order(tmp_path):
+    store = _store(tmp_path)
+    store.save_context("run", {"full_prompt": "question"})
+    store.save_round("run", 0, "User", 0, {"name": "User", "content": "question"})
+    store.save_round("run", 1, "A", 1, {"name": "A", "content": "answer"})
+    checkpoint = store.load("run")
+    assert checkpoint["context"] == {"full_prompt": "question"}
+    assert [m["name"] for m in checkpoint["messages"]] == ["User", "A"]
+    store.delete("run")
+    assert store.load("run") is None
+
+
+def test_claim_is_exclusive_to_live_processes(tmp_path):
+    store = _store(tmp_path)
+    with store._connect() as db:
+        # A claim left by a process that has exited can be taken over
+        dead = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead.wait()
+        db.execute("INSERT INTO claims (run_id, pid) VALUES (?, ?)", ("run", dead.pid))
+    assert store.claim("run")
+    assert store.claim("run") # Re-entrant for the owning process
+
+    live = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        with store._connect() as db:
+            db.execute("UPDATE claims SET pid = ? WHERE run_id = ?", (live.pid, "run"))
+        assert not store.claim("run")
+    finally:
+        live.kill()
+        live.wait()
+    assert store.claim("run")
+    store.release("run")
+    assert store._connect().execute("SELECT COUNT(*) FROM claims").fetchone()[0] == 0
+
+
+class _Agent:
+    def __init__(self, name):
+        self.name = name
+        self.history = ["stale"]
+
+    def clear_history(self):
+        self.history = []
+
+
+class _Manager(_Agent):
+    def __init__(self, groupchat):
+        super().__init__("manager")
+        self.groupchat = groupchat
+
+    def resume(self, messages, silent=False):
+        for message in messages[:-1]:
+            self.groupchat.append(message, self.groupchat.agent_by_name(message["name"]))
+        return self.groupchat.agent_by_name(messages[-1]["name"]), messages[-1]
+
+
+def _groupchat(agents):
+    groupchat = SimpleNamespace(agents=agents, agent_names=[a.name for a in agents], messages=[])
+    groupchat.agent_by_name = lambda name: next(a for a in agents if a.name == name)
+    groupchat.append = lambda message, speaker: groupchat.messages.append(dict(message, name=speaker.name))
+    return groupchat
+
+
+def test_resume_replaces_leftover_messages(tmp_path):
+    store = _store(tmp_path)
+    agents = [_Agent("User"), _Agent("A")]
+    groupchat = _groupchat(agents)
+    recorder = RoundRecorder(store)
+    recorder.attach(groupchat)
+    manager = _Manager(groupchat)
+    checkpointed = [{"name": "User", "content": "question"}, {"name": "A", "content": "partial"},
+                    {"name": "User", "content": "continue"}]
+    store.save_context("run", {})
+    for n, message in enumerate(checkpointed):
+        store.save_round("run", n, message["name"], 0, message)
+    groupchat.messages = [{"name": "A", "content": "left over from the failed run"}]
+
+    speaker, last = resume_groupchat(manager, checkpointed)
+    recorder.run_id = "run"
+    assert (speaker.name, last["content"]) == ("User", "continue")
+    assert [m["content"] for m in groupchat.messages] == ["question", "partial"]
+    assert all(agent.history == [] for agent in agents + [manager])
+    assert len(store.load("run")["messages"]) == 3
@@ -0,0 +1,77 @@
+import pytest
+
+from contextview import CHARS_PER_TOKEN
+from searchstream import iter_search_results, search_documents, take_within_budget
+
+
+class _FakeClient:
+    """Serves ranked results page by page and records every search request."""
+
+    def __init__(self, count, content_chars=CHARS_PER_TOKEN * 100):
+        self.results = [{"title": f"doc{n}", "content": "x" * content_chars, "@search.score": 10.0 - n * 0.5}
+                        for n in range(count)]
+        self.requests = []
+
+    def search(self, search_text, top, skip, query_type, **kwargs):
+        self.requests.append((top, skip))
+        return iter(self.results[skip:skip + top])
+
+
+def test_pages_are_requested_lazily():
+    client = _FakeClient(45)
+    results = iter_search_results(client, "q", page_size=20)
+    assert [next(results)["title"] for _ in range(21)][-1] == "doc20"
+    assert client.requests == [(20, 0), (20, 20)]
+    assert len(list(results)) == 24
+    assert client.requests == [(20, 0), (20, 20), (20, 40)]
+
+
+def test_max_results_limits_the_last_page():
+    client = _FakeClient(45)
+    assert len(list(iter_search_results(client, "q", page_size=20, max_results=25))) == 25
+    assert client.requests == [(20, 0), (5, 20)]
+
+
+def test_token_budget_stops_without_fetching_more_pages():
+    client = _FakeClient(100)
+    taken, reason = take_within_budget(iter_search_results(client, "q", page_size=10), token_budget=350)
+    assert [doc["title"] for doc in taken] == ["doc0", "doc1", "doc2"]
+    assert reason == "token_budget"
+    assert client.requests == [(10, 0)]
+
+
+def test_first_document_is_taken_even_over_budget():
+    taken, reason = take_within_budget(iter_search_results(_FakeClient(3), "q"), token_budget=10)
+    assert len(taken) == 1 and reason == "token_budget"
+
+
+def test_score_cutoffs():
+    taken, reason = take_within_budget(iter_search_results(_FakeClient(10), "q"), min_score=8.6)
+    assert [doc["score"] for doc in taken] == [10.0, 9.5, 9.0] and reason == "score_cutoff"
+    taken, reason = take_within_budget(iter_search_results(_FakeClient(10), "q"), min_relative_score=0.9)
+    assert [doc["score"] for doc in taken] == [10.0, 9.5, 9.0] and reason == "score_cutoff"
+
+
+def test_max_documents_and_exhaustion():
+    client = _FakeClient(50)
+    taken, reason = take_within_budget(iter_search_results(client, "q", page_size=20), max_documents=3)
+    assert len(taken) == 3 and reason == "max_documents"
+    assert client.requests == [(20, 0)]
+    taken, reason = take_within_budget(iter_search_results(_FakeClient(2), "q"))
+    assert len(taken) == 2 and reason == "exhausted"
+
+
+def test_reranker_score_is_preferred():
+    client = _FakeClient(1)
+    client.results[0]["@search.reranker_score"] = 3.2
+    assert next(iter_search_results(client, "q"))["score"] == 3.2
+
+
+def test_search_documents_handles_errors():
+    class Failing:
+        def search(self, **kwargs):
+            raise ConnectionError("unreachable")
+
+    assert search_documents(Failing(), "q", verbose=False) == []
+    with pytest.raises(ConnectionError):
+        search_documents(Failing(), "q", raise_errors=True, verbose=False)
@@ -0,0 +1,63 @@
+import semcache
+from embedbatch import local_embed_texts
+from semcache import SemanticCache
+from sharedstate import SharedStore
+
+QUESTION = "What is the VAT rate on children's clothing?"
+
+
+def test_hit_returns_answer_and_sources():
+    cache = SemanticCache(local_embed_texts, threshold=0.8)
+    cache.store(QUESTION, "Zero-rated.", ["VAT Notice 714"])
+    hit = cache.lookup("what is the VAT rate for children's clothing")
+    assert hit["answer"] == "Zero-rated." and hit["sources"] == ["VAT Notice 714"]
+    assert hit["similarity"] >= 0.8
+    assert cache.report()["hit_rate"] == 1.0
+
+
+def test_miss_below_threshold():
+    cache = SemanticCache(local_embed_texts, threshold=0.8)
+    cache.store(QUESTION, "Zero-rated.", ["VAT Notice 714"])
+    assert cache.lookup("When is the corporation tax return due?") is None
+    assert cache.report()["hits"] == 0
+
+
+def test_index_version_change_clears_the_cache():
+    version = ["v1"]
+    cache = SemanticCache(local_embed_texts, index_version_fn=lambda: version[0], version_check_interval=0)
+    cache.lookup(QUESTION) # Records the current version
+    cache.store(QUESTION, "Zero-rated.", ["VAT Notice 714"])
+    assert cache.lookup(QUESTION) is not None
+    version[0] = "v2"
+    assert cache.lookup(QUESTION) is None
+    assert cache.report()["entries"] == 0
+
+
+def test_invalidate_sources_drops_only_affected_answers():
+    cache = SemanticCache(local_embed_texts)
+    cache.store(QUESTION, "Zero-rated.", ["VAT Notice 714"])
+    cache.store("When is the corporation tax return due?", "12 months after the period.", ["CT Manual"])
+    assert cache.invalidate_sources(["VAT Notice 714"]) == 1
+    assert cache.lookup(QUESTION) is None
+    assert cache.lookup("When is the corporation tax return due?") is not None
+
+
+def test_answers_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(semcache.time, "time", lambda: now[0])
+    cache = SemanticCache(local_embed_texts, ttl=60)
+    cache.store(QUESTION, "Zero-rated.", ["VAT Notice 714"])
+    now[0] += 59
+    assert cache.lookup(QUESTION) is not None
+    now[0] += 2
+    assert cache.lookup(QUESTION) is None
+    assert cache.report()["entries"] == 0
+
+
+def test_shared_store_answers_are_hits_in_other_workers(tmp_path):
+    store = SharedStore(str(tmp_path / "shared.db"))
+    first, second = SemanticCache(local_embed_texts, shared_store=store), SemanticCache(local_embed_texts, shared_store=store)
+    first.store(QUESTION, "Zero-rated.", ["VAT Notice 714"])
+    assert second.lookup(QUESTION)["answer"] == "Zero-rated."
+    first.invalidate_sources(["VAT Notice 714"])
+    assert second.lookup(QUESTION) is None
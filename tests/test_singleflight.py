@@ -0,0 +1,79 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from sharedstate import SharedStore
+from singleflight import SingleFlight, normalize_key
+
+
+def test_normalize_key_ignores_case_whitespace_and_separates_versions():
+    assert normalize_key("What  is\nITC?", "1") == normalize_key("what is itc?", "1")
+    assert normalize_key("What is ITC?", "1") == normalize_key(" what   is itc? ", "1")
+    assert normalize_key("What is ITC?", "1") != normalize_key("What is ITC?", "2")
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight(memo_ttl=0)
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"answer": 42}
+
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", fn)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", fn))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while flight.stats["coalesced"] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert len(calls) == 1
+    assert sorted(how for _, how in results) == ["coalesced"] * 3 + ["executed"]
+    assert all(result == {"answer": 42} for result, _ in results)
+
+
+def test_memo_serves_stragglers_and_failures_are_not_memoized():
+    flight = SingleFlight(memo_ttl=30)
+    assert flight.do("k", lambda: 1) == (1, "executed")
+    assert flight.do("k", lambda: 2) == (1, "memo")
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flight.do("other", fail)
+    assert flight.do("other", lambda: 3) == (3, "executed")
+
+
+def test_memo_is_bounded():
+    flight = SingleFlight(memo_ttl=30, max_memo_entries=2)
+    for n in range(3):
+        flight.do(str(n), lambda n=n: n)
+    assert flight.do("0", lambda: "again") == ("again", "executed")
+
+
+def test_shared_memo_reaches_other_instances(tmp_path):
+    store = SharedStore(str(tmp_path / "shared.db"))
+    assert SingleFlight(shared_store=store).do("k", lambda: {"a": 1}) == ({"a": 1}, "executed")
+    assert SingleFlight(shared_store=store).do("k", lambda: {"a": 2}) == ({"a": 1}, "memo")
+
+
+class _LockedStore:
+    def get(self, namespace, key):
+        raise sqlite3.OperationalError("database is locked")
+
+    def set(self, namespace, key, value, ttl=None):
+        raise sqlite3.OperationalError("database is locked")
+
+
+def test_shared_store_errors_do_not_fail_a_successful_run():
+    assert SingleFlight(shared_store=_LockedStore()).do("k", lambda: 1) == (1, "executed")
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from structuredoutput import (StructuredOutputError, extract_json, is_done, parse_structured_findings,
+                              render_findings, render_summary_markdown, validate_findings, validate_summary)
+
+FINDINGS = {"f": [{"d": "D1.2", "t": "dv", "x": ["rate"], "n": "12%->18%"},
+                  {"t": "ca", "l": "Section 4", "x": ["oblig_add"]}]}
+
+
+def test_extract_json_tolerates_fences_and_prose_braces():
+    content = "Here is the {draft} result:\n```json\n" + json.dumps(FINDINGS) + "\n```\nDone {really}."
+    assert extract_json(content) == FINDINGS
+
+
+def test_extract_json_returns_first_of_several_objects():
+    content = '{"status": "working"}\n{"status": "done"}'
+    assert extract_json(content) == {"status": "working"}
+
+
+def test_extract_json_errors():
+    with pytest.raises(StructuredOutputError):
+        extract_json("no json {here")
+    with pytest.raises(StructuredOutputError):
+        extract_json(None)
+
+
+def test_validate_findings_normalizes_codes():
+    findings = validate_findings(FINDINGS)
+    assert findings[0] == {"id": "D1.2", "type": "data_value", "location": None, "codes": ["rate"], "note": "12%->18%"}
+    assert findings[1]["type"] == "clause_added" and findings[1]["location"] == "Section 4"
+
+
+@pytest.mark.parametrize("entry, message", [
+    ({"d": "D1", "t": "zz", "x": ["rate"]}, "unknown type code"),
+    ({"d": "D1", "t": "dv", "x": ["nope"]}, "explanation codes"),
+    ({"d": "D1", "t": "dv", "x": []}, "explanation codes"),
+    ({"t": "dv", "x": ["rate"]}, "difference id"),
+    ({"d": "D1", "t": "dv", "x": ["rate"], "n": "word " * 30}, "note longer"),
+])
+def test_validate_findings_rejects_schema_violations(entry, message):
+    with pytest.raises(StructuredOutputError, match=message):
+        validate_findings({"f": [entry]})
+
+
+def test_parse_structured_findings_collects_every_object():
+    messages = [
+        {"name": "rules_comparator", "content": json.dumps(FINDINGS)},
+        {"name": "judgement_analyzer", "content": 'Doc 1: {"f": [{"d": "D2.1", "t": "wd", "x": ["wording_only"]}]} '
+                                                  'Doc 2: {"f": [{"d": "D3.1", "t": "fm", "x": ["format_only"]}]}'},
+        {"name": "rules_comparator", "content": '{"f": "not a list"}'},
+        {"name": "data_accumulator", "content": "plain text"},
+    ]
+    by_id, unanchored, errors = parse_structured_findings(messages)
+    assert set(by_id) == {"D1.2", "D2.1", "D3.1"}
+    assert by_id["D1.2"] == "The tax rate differs from the reference. (12%->18%)"
+    assert render_findings(unanchored) == ["clause_added at Section 4: The document adds an obligation or "
+                                           "condition not in the reference."]
+    assert len(errors) == 1 and errors[0].startswith("rules_comparator")
+
+
+def test_is_done_reads_the_status_field():
+    assert is_done('{\n\t"h": "T",\n\t"status":\n"done"\n}')
+    assert is_done('```json\n{"status": "DONE"}\n```')
+    assert not is_done('{"status": "working"}')
+    assert not is_done('The status is "done"')
+    assert not is_done(None)
+
+
+def test_summary_round_trip():
+    summary = validate_summary({"h": "ITC", "s": [{"h": "Rules", "b": ["Rule 36 caps credit"]}], "src": ["CGST Rules"],
+                                "status": "done"})
+    assert render_summary_markdown(summary) == "# ITC\n\n## Rules\n\n- Rule 36 caps credit\n\nSources: CGST Rules"
+    with pytest.raises(StructuredOutputError):
+        validate_summary({"s": []})
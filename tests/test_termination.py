@@ -0,0 +1,43 @@
+import json
+
+from termination import ConvergenceMonitor
+
+
+def _tool_call(name):
+    return {"name": name, "role": "assistant", "content": None,
+            "tool_calls": [{"id": "call_1", "type": "function", "function": {"name": "search", "arguments": "{}"}}]}
+
+
+def test_tool_call_exchange_is_not_stale():
+    monitor = ConvergenceMonitor(stale_rounds=2, min_rounds=0)
+    messages = [
+        {"name": "user", "content": "Compare the document against the GST rules."},
+        _tool_call("Processor"),
+        {"name": "search", "role": "tool", "content": "Rule 36 limits input tax credit."},
+        _tool_call("Processor"),
+        _tool_call("Processor"),
+    ]
+    assert not any(monitor(message) for message in messages)
+    assert monitor.stop_reason is None
+
+
+def test_stale_text_messages_stop_the_chat():
+    monitor = ConvergenceMonitor(stale_rounds=2, min_rounds=0, repeat_threshold=1.1)
+    text = "The rate in the document matches the reference rate of twelve percent."
+    assert not monitor({"name": "a", "content": text})
+    assert not monitor({"name": "b", "content": text + " Agreed."})
+    assert monitor({"name": "a", "content": text})
+    assert monitor.result()["reason"] == "no_new_information"
+
+
+def test_structured_done_signal():
+    monitor = ConvergenceMonitor()
+    assert monitor({"name": "Summarizer", "content": json.dumps({"s": [], "status": "done"})})
+    assert monitor.result()["reason"] == "done_signal"
+
+
+def test_required_speakers():
+    monitor = ConvergenceMonitor(required_speakers=("A", "B"))
+    assert not monitor({"name": "A", "content": "first finding"})
+    assert monitor({"name": "B", "content": "second finding"})
+    assert monitor.result()["reason"] == "required_artifacts"
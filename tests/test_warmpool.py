@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+import warmpool
+from warmpool import WarmWorkerPool, WorkerStartError, _Worker
+
+
+@pytest.fixture
+def make_pool(tmp_path):
+    pools = []
+
+    def make(**kwargs):
+        pool = WarmWorkerPool(str(tmp_path / "coding"), preload=[], **kwargs)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        while not pool._idle.empty():
+            worker = pool._idle.get()
+            if isinstance(worker, _Worker):
+                worker.stop()
+
+
+def test_output_is_captured_at_the_fd_level(make_pool):
+    pool = make_pool(size=1)
+    code = (
+        "import os, subprocess, sys\n"
+        "print('from print')\n"
+        "os.system('echo from os.system')\n"
+        "subprocess.run(['sh', '-c', 'echo from a child >&2'])\n"
+        "os.write(1, b'from the fd\\n')\n"
+    )
+    exit_code, output = pool.run(code, timeout=10)
+    assert exit_code == 0
+    assert output.splitlines() == ["from print", "from os.system", "from a child", "from the fd"]
+    # Nothing leaks into the next execution
+    assert pool.run("print('next')", timeout=10) == (0, "next\n")
+
+
+def test_errors_and_exit_codes_are_reported(make_pool):
+    pool = make_pool(size=1)
+    exit_code, output = pool.run("raise ValueError('boom')", timeout=10)
+    assert exit_code == 1 and "ValueError: boom" in output
+    assert pool.run("import sys; sys.exit(3)", timeout=10) == (3, "")
+
+
+def test_timeout_kills_and_replaces_the_worker(make_pool):
+    pool = make_pool(size=1)
+    exit_code, output = pool.run("import time; time.sleep(30)", timeout=1)
+    assert exit_code == 1 and output.startswith("Timeout")
+    assert pool.run("print('alive')", timeout=10) == (0, "alive\n")
+
+
+def test_workers_are_recycled_after_max_tasks(make_pool):
+    pool = make_pool(size=1, max_tasks=2)
+    pids = [pool.run("import os; print(os.getpid())", timeout=10)[1] for _ in range(3)]
+    assert pids[0] == pids[1] != pids[2]
+
+
+def test_start_failure_is_returned_to_the_caller(make_pool, monkeypatch):
+    monkeypatch.setattr(warmpool.sys, "executable", os.path.join(os.sep, "nonexistent", "python"))
+    pool = make_pool(size=1)
+    exit_code, output = pool.run("print('never runs')", timeout=10)
+    assert exit_code == 1 and output.startswith("Code execution worker failed to start")
+
+
+def test_worker_that_does_not_finish_preloading_is_killed(tmp_path, monkeypatch):
+    (tmp_path / "slowmodule.py").write_text("import time\ntime.sleep(30)\n")
+    monkeypatch.setenv("PYTHONPATH", str(tmp_path))
+    with pytest.raises(WorkerStartError, match="preloading"):
+        _Worker(str(tmp_path / "coding"), ["slowmodule"], start_timeout=1)
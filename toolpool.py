@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+# --- Concurrent Tool Calls ---
+# When an LLM agent emits several tool calls in one message (e.g. three
+# ai_search_knowledge_store queries), autogen's default reply runs them one
+# after another on the executor agent. This registers a reply function that
+# runs them concurrently on a bounded, process-wide thread pool and merges the
+# results back in the original call order, so a multi-search turn takes as long
+# as its slowest search.
+#
+# A tool that exceeds TOOL_CALL_TIMEOUT gets an error response; its thread is
+# left to finish in the background (Python threads cannot be killed).
+
+TOOL_CALL_MAX_WORKERS = int(os.getenv("TOOL_CALL_MAX_WORKERS", "8"))
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "60"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=TOOL_CALL_MAX_WORKERS, thread_name_prefix="tool-call")
+        return _executor
+
+
+def run_tool_calls(agent, tool_calls, timeout=TOOL_CALL_TIMEOUT):
+    """
+    Executes tool calls concurrently using the agent's registered functions.
+    Args:
+        agent (ConversableAgent): The agent the tools are registered for execution on.
+        tool_calls (list): The 'tool_calls' entries of an LLM message.
+        timeout (float): Per-tool timeout in seconds.
+    Returns:
+        list: Tool response messages, in the same order as tool_calls.
+    """
+    executor = _get_executor()
+    submitted = time.monotonic()
+    futures = [executor.submit(agent.execute_function, call["function"]) for call in tool_calls]
+
+    tool_responses = []
+    for call, future in zip(tool_calls, futures):
+        name = call["function"].get("name", "unknown")
+        remaining = max(0.0, timeout - (time.monotonic() - submitted))
+        try:
+            _, func_return = future.result(timeout=remaining)
+            content = func_return.get("content", "")
+        except FutureTimeoutError:
+            content = f"Error: tool '{name}' timed out after {timeout} seconds."
+        except Exception as e:
+            content = f"Error: tool '{name}' failed: {e}"
+        print(f"--- Tool call {name} collected ({time.monotonic() - submitted:.2f}s since turn start) ---")
+        tool_responses.append({"tool_call_id": call.get("id"), "role": "tool", "content": content})
+    return tool_responses
+
+
+def register_concurrent_tool_calls(agent, timeout=TOOL_CALL_TIMEOUT):
+    """
+    Makes an executor agent run multi-call tool turns concurrently.
+    Single tool calls are left to autogen's default handling.
+    Args:
+        agent (ConversableAgent): The agent that executes the tools (e.g. the user proxy).
+        timeout (float): Per-tool timeout in seconds.
+    """
+    import autogen
+
+    def concurrent_tool_calls_reply(recipient, messages=None, sender=None, config=None):
+        if not messages:
+            return False, None
+        tool_calls = messages[-1].get("tool_calls") or []
+        if len(tool_calls) < 2:
+            return False, None
+        print(f"\n--- Running {len(tool_calls)} tool calls concurrently ---")
+        tool_responses = run_tool_calls(recipient, tool_calls, timeout=timeout)
+        return True, {
+            "role": "tool",
+            "tool_responses": tool_responses,
+            "content": "\n\n".join(response["content"] for response in tool_responses),
+        }
+
+    agent.register_reply(trigger=[autogen.Agent, None], reply_func=concurrent_tool_calls_reply, position=0)
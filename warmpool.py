@@ -0,0 +1,353 @@
+import builtins
+import os
+import queue
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import traceback
+from multiprocessing.connection import Client, Connection, answer_challenge, deliver_challenge
+
+# --- Warm Code-Execution Worker Pool ---
+# The default UserProxyAgent executor writes every code block to a temp file in
+# work_dir and runs it in a fresh interpreter, paying interpreter startup and
+# import cost on every execution round. This module keeps a pool of pre-warmed
+# Python worker processes (common modules already imported) and exposes it to
+# autogen as a CodeExecutor.
+#
+# Isolation: every code block runs in a brand-new global namespace, with the
+# working directory, sys.argv and sys.path reset to the worker's baseline.
+# A worker that times out is killed and replaced, and workers are recycled after
+# CODE_WORKER_MAX_TASKS executions so state leaking through imported modules
+# cannot accumulate. A worker that does not connect and finish preloading within
+# CODE_WORKER_START_TIMEOUT seconds is killed, and the error is returned to the
+# agent as the execution result instead of leaving it waiting for a worker.
+#
+# Pools start their workers on first use or with start_pools(), never when the
+# agents are built: in the pre-forked server (see prefork.py) the agents are
+# built in the parent, and worker subprocesses, their pipes and the spawn
+# threads cannot be shared across a fork. A forked child drops whatever pool
+# state it inherited and starts its own workers (on_worker_start=[start_pools]).
+#
+# Set CODE_EXECUTOR=local to fall back to autogen's default executor.
+
+CODE_EXECUTOR = os.getenv("CODE_EXECUTOR", "warm_pool")
+CODE_WORKER_POOL_SIZE = int(os.getenv("CODE_WORKER_POOL_SIZE", "2"))
+CODE_WORKER_MAX_TASKS = int(os.getenv("CODE_WORKER_MAX_TASKS", "50"))
+CODE_EXECUTION_TIMEOUT = int(os.getenv("CODE_EXECUTION_TIMEOUT", "60"))
+CODE_WORKER_START_TIMEOUT = int(os.getenv("CODE_WORKER_START_TIMEOUT", "60"))
+# Modules imported in every worker before it is marked ready; missing ones are skipped
+PRELOAD_MODULES = os.getenv(
+    "CODE_WORKER_PRELOAD",
+    "json,math,re,datetime,collections,statistics,csv,numpy,pandas,matplotlib",
+).split(",")
+
+PYTHON_LANGUAGES = ("python", "py", "python3", "")
+SHELL_LANGUAGES = ("bash", "shell", "sh")
+
+
+# --- Worker process ---
+
+def _worker_main(conn, work_dir, preload):
+    """Worker loop: preload modules, then execute code blocks sent over conn."""
+    for module in preload:
+        module = module.strip()
+        if not module:
+            continue
+        try:
+            __import__(module)
+        except Exception:
+            pass
+    os.makedirs(work_dir, exist_ok=True)
+    os.chdir(work_dir)
+    # Line-buffered, so print() output stays in order with what is written straight to the fds
+    sys.stdout.reconfigure(line_buffering=True)
+    baseline_cwd, baseline_argv, baseline_path = os.getcwd(), list(sys.argv), list(sys.path)
+    baseline_stdout, baseline_stderr = sys.stdout, sys.stderr
+    conn.send({"ready": True})
+
+    while True:
+        try:
+            code = conn.recv()
+        except EOFError:
+            break
+        if code is None:
+            break
+        # Fresh namespace and baseline process state for every execution
+        os.chdir(baseline_cwd)
+        sys.argv[:] = baseline_argv
+        sys.path[:] = baseline_path
+        sys.stdout, sys.stderr = baseline_stdout, baseline_stderr
+        namespace = {"__name__": "__main__", "__builtins__": builtins}
+        exit_code = 0
+        # Capture at the fd level, so os.system(), child processes and C extensions
+        # are captured too, not just writes to sys.stdout / sys.stderr
+        with tempfile.TemporaryFile() as capture:
+            saved_fds = os.dup(1), os.dup(2)
+            os.dup2(capture.fileno(), 1)
+            os.dup2(capture.fileno(), 2)
+            try:
+                exec(compile(code, "<code_block>", "exec"), namespace)
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                if e.code is not None and not isinstance(e.code, int):
+                    print(e.code, file=baseline_stdout)
+            except BaseException:
+                exit_code = 1
+                traceback.print_exc(file=baseline_stderr)
+            finally:
+                for stream in (sys.stdout, sys.stderr, baseline_stdout, baseline_stderr):
+                    try:
+                        stream.flush()
+                    except Exception:
+                        pass
+                for fd, saved in zip((1, 2), saved_fds):
+                    os.dup2(saved, fd)
+                    os.close(saved)
+            capture.seek(0)
+            output = capture.read().decode(errors="replace")
+        conn.send({"exit_code": exit_code, "output": output})
+
+
+class WorkerStartError(RuntimeError):
+    """Raised when a worker process does not connect or finish preloading in time."""
+
+
+class _Worker:
+    # Workers are plain subprocesses running this file, not multiprocessing children:
+    # spawn/forkserver would re-import the parent's __main__, and scripts such as
+    # summary.py start a whole chat at import time.
+    def __init__(self, work_dir, preload, start_timeout=CODE_WORKER_START_TIMEOUT):
+        authkey = os.urandom(16)
+        with socket.create_server(("127.0.0.1", 0)) as server:
+            server.settimeout(start_timeout)
+            host, port = server.getsockname()[:2]
+            env = dict(os.environ, WARMPOOL_AUTHKEY=authkey.hex())
+            self.process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), host, str(port), work_dir, ",".join(preload)],
+                env=env, stdin=subprocess.DEVNULL,
+            )
+            try:
+                sock, _ = server.accept()
+            except socket.timeout:
+                self.process.kill()
+                raise WorkerStartError(f"worker did not connect within {start_timeout} seconds")
+        sock.setblocking(True)
+        self.conn = Connection(sock.detach())
+        self.tasks = 0
+        try:
+            # The same handshake multiprocessing's Listener performs
+            deliver_challenge(self.conn, authkey)
+            answer_challenge(self.conn, authkey)
+            ready = self.conn.poll(start_timeout) # Block until preloading is done
+            if ready:
+                self.conn.recv()
+        except (OSError, EOFError) as e:
+            self.kill()
+            raise WorkerStartError(f"worker exited during startup: {e}")
+        if not ready:
+            self.kill()
+            raise WorkerStartError(f"worker did not finish preloading within {start_timeout} seconds")
+
+    def kill(self):
+        self.process.kill()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, EOFError):
+            pass
+        try:
+            self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.conn.close()
+
+
+class WarmWorkerPool:
+    """
+    Pool of pre-warmed, resettable Python worker processes.
+    Args:
+        work_dir (str): Working directory the code runs in.
+        size (int): Number of worker processes.
+        max_tasks (int): Executions after which a worker is replaced.
+        preload (list): Modules to import in each worker up front.
+    """
+
+    def __init__(self, work_dir="coding", size=CODE_WORKER_POOL_SIZE, max_tasks=CODE_WORKER_MAX_TASKS, preload=PRELOAD_MODULES):
+        self.work_dir = os.path.abspath(work_dir)
+        self.size = size
+        self.max_tasks = max_tasks
+        self._preload = preload
+        self._reset()
+
+    def _reset(self):
+        # Idle workers and spawn threads belong to the process that started them
+        self._lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._started = False
+
+    def start(self):
+        """Starts the worker processes; does nothing if this process already started them."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.size):
+            self._spawn_replacement()
+        print(f"Warm code-execution pool starting {self.size} workers in '{self.work_dir}'.")
+
+    def _spawn_replacement(self):
+        # Replacements warm up in the background so callers never wait on preloading;
+        # a failed start is queued as well, so a waiting run() reports it
+        def spawn():
+            try:
+                self._idle.put(_Worker(self.work_dir, self._preload))
+            except Exception as e:
+                print(f"Code execution worker failed to start: {e}")
+                self._idle.put(e)
+
+        threading.Thread(target=spawn, daemon=True).start()
+
+    def run(self, code, timeout=CODE_EXECUTION_TIMEOUT):
+        """
+        Executes Python code on an idle worker.
+        Args:
+            code (str): The Python source to run.
+            timeout (int): Seconds before the worker is killed.
+        Returns:
+            tuple: (exit_code, output)
+        """
+        self.start()
+        try:
+            worker = self._idle.get(timeout=timeout + CODE_WORKER_START_TIMEOUT)
+        except queue.Empty:
+            return 1, "No code execution worker became available; try again later."
+        if isinstance(worker, Exception):
+            self._spawn_replacement() # Try again for the next execution
+            return 1, f"Code execution worker failed to start: {worker}"
+        try:
+            worker.conn.send(code)
+            if not worker.conn.poll(timeout):
+                worker.kill()
+                self._spawn_replacement()
+                return 1, f"Timeout: code execution exceeded {timeout} seconds."
+            result = worker.conn.recv()
+        except (OSError, EOFError) as e:
+            worker.kill()
+            self._spawn_replacement()
+            return 1, f"Code execution worker died: {e}"
+
+        worker.tasks += 1
+        if worker.tasks >= self.max_tasks:
+            worker.stop()
+            self._spawn_replacement()
+        else:
+            self._idle.put(worker)
+        return result["exit_code"], result["output"]
+
+
+class WarmPoolCodeExecutor:
+    """
+    autogen CodeExecutor backed by a WarmWorkerPool. Python blocks run on the pool,
+    shell blocks run in a subprocess in the same work_dir.
+    Args:
+        pool (WarmWorkerPool): The worker pool to execute on.
+        timeout (int): Per-execution timeout in seconds.
+    """
+
+    def __init__(self, pool, timeout=CODE_EXECUTION_TIMEOUT):
+        from autogen.coding import MarkdownCodeExtractor
+
+        self._pool = pool
+        self._timeout = timeout
+        self._extractor = MarkdownCodeExtractor()
+
+    @property
+    def code_extractor(self):
+        return self._extractor
+
+    def execute_code_blocks(self, code_blocks):
+        from autogen.coding import CodeResult
+
+        outputs = []
+        exit_code = 0
+        for block in code_blocks:
+            language = (block.language or "").lower()
+            if language in PYTHON_LANGUAGES:
+                exit_code, output = self._pool.run(block.code, timeout=self._timeout)
+            elif language in SHELL_LANGUAGES:
+                exit_code, output = self._run_shell(block.code)
+            else:
+                exit_code, output = 1, f"Unsupported language: {block.language}"
+            outputs.append(output)
+            if exit_code != 0:
+                break
+        return CodeResult(exit_code=exit_code, output="\n".join(outputs))
+
+    def _run_shell(self, script):
+        try:
+            completed = subprocess.run(["bash", "-c", script], cwd=self._pool.work_dir,
+                                       capture_output=True, text=True, timeout=self._timeout)
+        except subprocess.TimeoutExpired:
+            return 1, f"Timeout: code execution exceeded {self._timeout} seconds."
+        return completed.returncode, completed.stdout + completed.stderr
+
+    def restart(self):
+        pass
+
+
+# One pool per work_dir, shared by every agent in the process
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def code_execution_config(work_dir="coding", last_n_messages=None, use_docker=False):
+    """
+    Builds a UserProxyAgent code_execution_config that uses the shared warm pool
+    for work_dir, or autogen's default executor when CODE_EXECUTOR=local.
+    Args:
+        work_dir (str): Directory for code execution.
+        last_n_messages (int, optional): How many messages to scan for code blocks.
+        use_docker (bool): Only used by the default executor.
+    Returns:
+        dict: The code_execution_config for the agent.
+    """
+    config = {}
+    if last_n_messages is not None:
+        config["last_n_messages"] = last_n_messages
+    if CODE_EXECUTOR != "warm_pool":
+        config.update({"work_dir": work_dir, "use_docker": use_docker})
+        return config
+    with _pools_lock:
+        if work_dir not in _pools:
+            _pools[work_dir] = WarmWorkerPool(work_dir)
+    config["executor"] = WarmPoolCodeExecutor(_pools[work_dir])
+    return config
+
+
+def start_pools():
+    """Starts the workers of every pool created so far; call in each pre-forked worker process."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.start()
+
+
+def _reset_after_fork():
+    global _pools_lock
+    _pools_lock = threading.Lock()
+    for pool in _pools.values():
+        pool._reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+if __name__ == "__main__":
+    # Worker subprocess: connect back to the pool that started us
+    _host, _port, _work_dir, _preload = sys.argv[1:5]
+    _conn = Client((_host, int(_port)), authkey=bytes.fromhex(os.environ["WARMPOOL_AUTHKEY"]))
+    _worker_main(_conn, _work_dir, _preload.split(","))